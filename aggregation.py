@@ -0,0 +1,238 @@
+"""
+Итоги отчета по обработанным звонкам периода
+
+KPI, услуги и количество звонков по операторам считаются одним
+сгруппированным SQL-запросом по полям ai_data, без загрузки звонков
+в Python. Итог по колл-центру складывается из строк операторов.
+Результат — ReportSummary, который используют все форматы отчета.
+Строки звонков для детальной части отчета — iter_call_details.
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import func
+
+from database import SessionLocal, Call, CallStatus
+from logger import get_logger
+
+logger = get_logger("aggregation")
+
+# Оценки GPT, из которых складывается KPI (среднее по пяти критериям)
+KPI_FIELDS = ("greeting", "needs", "presentation", "objection", "closing")
+# Пороги статуса оператора по KPI
+GOLD_KPI = 8.5
+SILVER_KPI = 7
+# Оценки и тексты ai_data в детальной части отчета (нет оценки — 0, текста — "-")
+DETAIL_SCORE_FIELDS = KPI_FIELDS + ("services_count", "bonus")
+DETAIL_TEXT_FIELDS = ("summary", "recommendation")
+# Сколько рекомендаций загружать из БД за раз
+RECOMMENDATIONS_CHUNK_SIZE = 1000
+# Сколько звонков загружать из БД за раз при формировании отчета
+REPORT_CHUNK_SIZE = 500
+
+
+def kpi_tier(kpi: float) -> str:
+    """Статус оператора по среднему KPI"""
+    return "Золотой" if kpi > GOLD_KPI else "Серебряный" if kpi >= SILVER_KPI else "Медный"
+
+
+@dataclass
+class OperatorSummary:
+    """Итоги одного оператора за период"""
+    operator: Optional[str]
+    calls: int
+    services: int
+    kpi: float
+    scores: Dict[str, float]  # Средние оценки по критериям KPI_FIELDS
+    recommendations: List[str] = field(default_factory=list)  # По звонкам, в порядке дат
+    final_recommendation: Optional[str] = None  # Итоговая рекомендация (add_final_recommendations)
+
+    @property
+    def tier(self) -> str:
+        return kpi_tier(self.kpi)
+
+    @property
+    def top_recommendation(self) -> str:
+        """Самая частая рекомендация по звонкам
+
+        При равенстве частот берется первая по алфавиту, как mode() в pandas.
+        """
+        counts = Counter(self.recommendations)
+        if not counts:
+            return "Нет данных"
+        return min(counts, key=lambda value: (-counts[value], value))
+
+
+@dataclass
+class ReportSummary:
+    """Итоги отчета: по колл-центру и по операторам"""
+    start_date: Optional[datetime]
+    end_date: Optional[datetime]
+    calls: int = 0
+    services: int = 0
+    kpi: float = 0.0
+    operators: List[OperatorSummary] = field(default_factory=list)
+
+    def for_operators(self, operators: Optional[Iterable[str]]) -> "ReportSummary":
+        """Итоги только по части операторов (None — все)
+
+        Строки операторов общие с исходными итогами, поэтому итоговые
+        рекомендации, посчитанные один раз, видны во всех отчетах.
+        """
+        if operators is None:
+            return self
+        operators = set(operators)
+
+        subset = ReportSummary(start_date=self.start_date, end_date=self.end_date)
+        subset.operators = [item for item in self.operators if item.operator in operators]
+        subset.calls = sum(item.calls for item in subset.operators)
+        subset.services = sum(item.services for item in subset.operators)
+        if subset.calls:
+            subset.kpi = sum(item.kpi * item.calls for item in subset.operators) / subset.calls
+        return subset
+
+    def to_dict(self) -> dict:
+        """Итоги в виде словаря для JSON"""
+        return {
+            "start_date": self.start_date.isoformat() if self.start_date else None,
+            "end_date": self.end_date.isoformat() if self.end_date else None,
+            "calls": self.calls,
+            "services": self.services,
+            "kpi": round(self.kpi, 2),
+            "operators": [
+                {
+                    "operator": item.operator,
+                    "calls": item.calls,
+                    "services": item.services,
+                    "kpi": round(item.kpi, 2),
+                    "tier": item.tier,
+                    "scores": {key: round(value, 2) for key, value in item.scores.items()},
+                    "top_recommendation": item.top_recommendation,
+                    "final_recommendation": item.final_recommendation,
+                }
+                for item in self.operators
+            ],
+        }
+
+
+def _period_filter(query, start_date: Optional[datetime], end_date: Optional[datetime],
+                   tenant: Optional[str] = None):
+    query = query.filter(Call.status == CallStatus.PROCESSED)
+    if tenant:
+        query = query.filter(Call.tenant == tenant)
+    if start_date:
+        query = query.filter(Call.date >= start_date)
+    if end_date:
+        query = query.filter(Call.date <= end_date)
+    return query
+
+
+def aggregate_report(start_date: datetime = None, end_date: datetime = None,
+                     tenant: str = None) -> ReportSummary:
+    """Считает итоги отчета по обработанным звонкам периода
+
+    Отсутствующие в ai_data оценки и услуги считаются нулем (как в
+    детальном листе).
+
+    Args:
+        start_date: Начало периода (None — без ограничения)
+        end_date: Конец периода (None — без ограничения)
+        tenant: Только звонки клиента (None — все клиенты)
+    """
+    def score(name, cast="as_float"):
+        return func.sum(func.coalesce(getattr(Call.ai_data[name], cast)(), 0))
+
+    session = SessionLocal()
+    try:
+        rows = _period_filter(session.query(
+            Call.operator,
+            func.count(Call.id),
+            score("services_count", "as_integer"),
+            *(score(name) for name in KPI_FIELDS)
+        ), start_date, end_date, tenant).group_by(Call.operator).all()
+
+        recommendations = {}
+        query = _period_filter(session.query(
+            Call.operator, func.coalesce(Call.ai_data["recommendation"].as_string(), "-")
+        ), start_date, end_date, tenant).order_by(Call.date)
+        for operator, recommendation in query.yield_per(RECOMMENDATIONS_CHUNK_SIZE):
+            recommendations.setdefault(operator, []).append(recommendation)
+    finally:
+        session.close()
+
+    summary = ReportSummary(start_date=start_date, end_date=end_date)
+    score_total = 0.0
+    for operator, calls, services, *sums in sorted(rows, key=lambda row: row[0] or ""):
+        scores = {name: (value or 0) / calls for name, value in zip(KPI_FIELDS, sums)}
+        summary.operators.append(OperatorSummary(
+            operator=operator,
+            calls=calls,
+            services=services or 0,
+            kpi=sum(scores.values()) / len(KPI_FIELDS),
+            scores=scores,
+            recommendations=recommendations.get(operator, []),
+        ))
+        summary.calls += calls
+        summary.services += services or 0
+        score_total += sum(value or 0 for value in sums)
+
+    if summary.calls:
+        summary.kpi = score_total / len(KPI_FIELDS) / summary.calls
+    return summary
+
+
+def iter_call_details(start_date: datetime = None, end_date: datetime = None,
+                      operators: Optional[Iterable[str]] = None,
+                      tenant: str = None) -> Iterator[dict]:
+    """Обработанные звонки периода по дате — для детальной части отчета
+
+    Звонки читаются из БД порциями (yield_per), поэтому память не растет
+    вместе с историей звонков.
+
+    Args:
+        start_date: Начало периода (None — без ограничения)
+        end_date: Конец периода (None — без ограничения)
+        operators: Только эти операторы (None — все)
+        tenant: Только звонки клиента (None — все клиенты)
+
+    Yields:
+        dict: operator, date, duration (сек), DETAIL_SCORE_FIELDS, DETAIL_TEXT_FIELDS
+    """
+    session = SessionLocal()
+    try:
+        query = _period_filter(session.query(Call), start_date, end_date, tenant)
+        if operators is not None:
+            query = query.filter(Call.operator.in_(list(operators)))
+
+        for call in query.order_by(Call.date).yield_per(REPORT_CHUNK_SIZE):
+            ai = call.ai_data or {}
+            details = {"operator": call.operator, "date": call.date, "duration": call.duration or 0}
+            for name in DETAIL_SCORE_FIELDS:
+                details[name] = ai.get(name, 0)
+            for name in DETAIL_TEXT_FIELDS:
+                details[name] = ai.get(name, '-')
+            yield details
+    finally:
+        session.close()
+
+
+def add_final_recommendations(summary: ReportSummary) -> ReportSummary:
+    """Итоговая рекомендация каждому оператору через GPT
+
+    Если GPT недоступен — статус и самая частая рекомендация по звонкам.
+    Уже заполненные рекомендации не пересчитываются.
+    """
+    for item in summary.operators:
+        if item.final_recommendation is not None:
+            continue
+        try:
+            from yandex_gpt import get_gpt_client
+            logger.info(f"🤖 Генерируем итоговую рекомендацию для {item.operator} через GPT...")
+            item.final_recommendation = get_gpt_client().generate_operator_summary(item.recommendations, item.operator)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сгенерировать через GPT: {e}")
+            item.final_recommendation = f"Статус: {item.tier}.\nЧастая ошибка: {item.top_recommendation}"
+    return summary
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Архив старых звонков в Parquet по месяцам
+
+Звонки старше ARCHIVE_RETENTION_DAYS (обработанные, dead-letter и так и
+не выбранные NEW) переносятся из calls в файлы
+ARCHIVE_PATH/month=ГГГГ-ММ/calls-<время>.parquet с типизированными
+колонками: оценки GPT разложены по отдельным колонкам, исходные ai_data
+и speech_data сохраняются JSON-строками. Звонки в работе, ожидающие
+повтора (FAILED) и с действующей арендой не архивируются.
+
+Сводка call_rollup продолжает учитывать архивные обработанные и
+dead-letter звонки (удаление идет в обход ORM), поэтому шапка отчета и
+счетчики не меняются. Архивные NEW из сводки вычитаются в той же
+транзакции, что и удаление: в ожидающих обработки минутах их больше нет.
+Исторические данные читаются через load_calls — он объединяет архив
+с живыми строками calls.
+
+Для работы нужен pyarrow (pip install pyarrow).
+
+Запуск:
+    python archive.py                    # архивировать звонки старше ARCHIVE_RETENTION_DAYS
+    python archive.py --days 90          # другой срок хранения в БД
+    python archive.py --vacuum           # после архивации сжать файл SQLite
+    python archive.py --trend 2025-01-01 2026-01-01  # средний KPI операторов по месяцам
+"""
+
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import delete, or_, text
+
+from database import init_db, engine, SessionLocal, Call, CallStatus, apply_rollup_deltas
+from config import Config
+from logger import get_logger
+from tenants import DEFAULT_TENANT
+
+logger = get_logger("archive")
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # архив не обязателен, без pyarrow работают только живые данные
+    pa = None
+
+# Статусы, в которых звонок больше не изменится сам (NEW — период прошел, звонок не выбран)
+ARCHIVE_STATUSES = (CallStatus.PROCESSED, CallStatus.DEAD, CallStatus.NEW)
+# Архивные звонки этих статусов остаются в сводке call_rollup (итоговые);
+# остальные (NEW) — больше не ожидают обработки и из сводки вычитаются
+ROLLUP_STATUSES = (CallStatus.PROCESSED, CallStatus.DEAD)
+# Строк в одной группе Parquet-файла и в одном DELETE
+ARCHIVE_CHUNK_SIZE = 5000
+# Оценки GPT, которые раскладываются по колонкам
+SCORE_FIELDS = ("greeting", "needs", "presentation", "objection", "closing", "bonus")
+
+if pa is not None:
+    ARCHIVE_SCHEMA = pa.schema(
+        [
+            ("id", pa.string()),
+            ("tenant", pa.string()),
+            ("date", pa.timestamp("us")),
+            ("operator", pa.string()),
+            ("phone", pa.string()),
+            ("duration", pa.int32()),
+            ("status", pa.string()),
+            ("audio_url", pa.string()),
+            ("transcript", pa.large_string()),
+            ("gpt_tokens", pa.int32()),
+            ("attempts", pa.int32()),
+            ("last_error", pa.string()),
+        ]
+        + [(field, pa.float32()) for field in SCORE_FIELDS]
+        + [
+            ("services_count", pa.int32()),
+            ("summary", pa.string()),
+            ("recommendation", pa.string()),
+            ("ai_data", pa.large_string()),
+            ("speech_data", pa.string()),
+        ]
+    )
+
+# Колонки load_calls по умолчанию — без тяжелых текстов
+DEFAULT_COLUMNS = ("id", "date", "operator", "duration", "status") + SCORE_FIELDS + ("services_count",)
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Для архива звонков нужен pyarrow: pip install pyarrow")
+
+
+def _number(value, cast):
+    """Число из ответа GPT (может прийти строкой или мусором) или None"""
+    try:
+        return cast(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_record(call: Call) -> dict:
+    """Строка архива по звонку (колонки ARCHIVE_SCHEMA)"""
+    ai = call.ai_data or {}
+    record = {
+        "id": call.id,
+        "tenant": call.tenant,
+        "date": call.date,
+        "operator": call.operator,
+        "phone": call.phone,
+        "duration": call.duration,
+        "status": call.status,
+        "audio_url": call.audio_url,
+        "transcript": call.transcript,
+        "gpt_tokens": call.gpt_tokens,
+        "attempts": call.attempts,
+        "last_error": call.last_error,
+        "services_count": _number(ai.get("services_count"), int),
+        "summary": ai.get("summary"),
+        "recommendation": ai.get("recommendation"),
+        "ai_data": json.dumps(ai, ensure_ascii=False) if ai else None,
+        "speech_data": json.dumps(call.speech_data, ensure_ascii=False) if call.speech_data else None,
+    }
+    for field in SCORE_FIELDS:
+        record[field] = _number(ai.get(field), float)
+    return record
+
+
+def _month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(value: datetime) -> datetime:
+    return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _archivable(query, cutoff: datetime):
+    """Фильтр звонков, которые можно перенести в архив"""
+    return query.filter(
+        Call.date < cutoff,
+        Call.status.in_(ARCHIVE_STATUSES),
+        or_(Call.lease_expires_at.is_(None), Call.lease_expires_at < datetime.now())
+    )
+
+
+def _archive_month(session, month: datetime, cutoff: datetime) -> int:
+    """Переносит звонки одного месяца в новый файл партиции
+
+    Файл пишется во временный и переименовывается, только потом звонки
+    удаляются из БД. Если удаление не прошло, звонки останутся и в архиве,
+    и в БД — load_calls в этом случае берет живую строку.
+    """
+    partition = Config.ARCHIVE_PATH / f"month={month.strftime('%Y-%m')}"
+    partition.mkdir(parents=True, exist_ok=True)
+    path = partition / f"calls-{datetime.now().strftime('%Y%m%d%H%M%S%f')}.parquet"
+    tmp_path = path.with_suffix(".parquet.tmp")
+
+    query = _archivable(session.query(Call), cutoff).filter(
+        Call.date >= month, Call.date < _next_month(month)
+    ).order_by(Call.date).yield_per(ARCHIVE_CHUNK_SIZE)
+
+    ids = []
+    records = []
+    try:
+        with pq.ParquetWriter(tmp_path, ARCHIVE_SCHEMA, compression="zstd") as writer:
+            for call in query:
+                records.append(_to_record(call))
+                ids.append(call.id)
+                if len(records) == ARCHIVE_CHUNK_SIZE:
+                    writer.write_table(pa.Table.from_pylist(records, schema=ARCHIVE_SCHEMA))
+                    records = []
+                    session.expunge_all()
+            if records:
+                writer.write_table(pa.Table.from_pylist(records, schema=ARCHIVE_SCHEMA))
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    # Закрываем транзакцию чтения до удаления
+    session.rollback()
+    if not ids:
+        tmp_path.unlink()
+        return 0
+    os.replace(tmp_path, path)
+
+    # Удаление через Core: сводка call_rollup сохраняет архивные итоговые звонки,
+    # а удаленные NEW вычитаются из нее в той же транзакции.
+    # Условия архивации проверяются повторно — звонок могли взять в работу
+    deleted = 0
+    with engine.begin() as conn:
+        for offset in range(0, len(ids), ARCHIVE_CHUNK_SIZE):
+            rows = conn.execute(
+                delete(Call.__table__).where(
+                    Call.id.in_(ids[offset:offset + ARCHIVE_CHUNK_SIZE]),
+                    Call.status.in_(ARCHIVE_STATUSES),
+                    or_(Call.lease_expires_at.is_(None), Call.lease_expires_at < datetime.now())
+                ).returning(Call.tenant, Call.operator, Call.date, Call.status, Call.duration)
+            ).all()
+            deleted += len(rows)
+
+            deltas = {}
+            for tenant, operator, call_date, status, duration in rows:
+                if status in ROLLUP_STATUSES or call_date is None:
+                    continue
+                key = (tenant or DEFAULT_TENANT, operator or "", call_date.date(), status)
+                calls, seconds = deltas.get(key, (0, 0))
+                deltas[key] = (calls - 1, seconds - (duration or 0))
+            apply_rollup_deltas(conn, deltas)
+    if deleted < len(ids):
+        logger.warning(
+            f"⚠️ {len(ids) - deleted} звонков взяты в работу во время архивации и остались в БД "
+            f"(load_calls берет живую строку; проверьте сводку: python rollup.py)"
+        )
+
+    logger.info(f"🗄️ {month.strftime('%Y-%m')}: {deleted} звонков -> {path}")
+    return deleted
+
+
+def archive_calls(retention_days: int = None) -> int:
+    """Переносит звонки старше retention_days в Parquet-архив
+
+    Returns:
+        int: Количество перенесенных звонков
+    """
+    _require_pyarrow()
+    if retention_days is None:
+        retention_days = Config.ARCHIVE_RETENTION_DAYS
+    cutoff = datetime.now() - timedelta(days=retention_days)
+
+    session = SessionLocal()
+    try:
+        oldest = _archivable(session.query(Call.date), cutoff).order_by(Call.date).first()
+        if not oldest:
+            logger.info(f"🗄️ Звонков старше {retention_days} дней для архива нет")
+            return 0
+
+        total = 0
+        month = _month_start(oldest.date)
+        while month < cutoff:
+            total += _archive_month(session, month, cutoff)
+            month = _next_month(month)
+    finally:
+        session.close()
+
+    logger.info(f"✅ В архив перенесено звонков: {total}")
+    return total
+
+
+def vacuum_database():
+    """Возвращает место, освобожденное архивацией (только SQLite, блокирует БД)"""
+    if engine.dialect.name != "sqlite":
+        logger.info("ℹ️ VACUUM нужен только для SQLite")
+        return
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+    logger.info("🧹 Файл БД сжат (VACUUM)")
+
+
+def _archive_dataset():
+    """Parquet-датасет архива или None, если архива нет"""
+    if not Config.ARCHIVE_PATH.exists() or not any(Config.ARCHIVE_PATH.glob("month=*/*.parquet")):
+        return None
+    _require_pyarrow()
+    return ds.dataset(
+        Config.ARCHIVE_PATH, format="parquet", schema=ARCHIVE_SCHEMA,
+        exclude_invalid_files=True, ignore_prefixes=[".", "_"]
+    )
+
+
+def _archive_files(start_date: datetime, end_date: datetime) -> List[str]:
+    """Файлы партиций, пересекающихся с периодом"""
+    months = set()
+    month = _month_start(start_date)
+    while month <= end_date:
+        months.add(f"month={month.strftime('%Y-%m')}")
+        month = _next_month(month)
+    return sorted(
+        str(path) for path in Config.ARCHIVE_PATH.glob("month=*/*.parquet")
+        if path.parent.name in months
+    )
+
+
+def load_calls(start_date: datetime, end_date: datetime, columns: Iterable[str] = DEFAULT_COLUMNS,
+               statuses: Iterable[str] = None) -> pd.DataFrame:
+    """Звонки периода из архива и из БД одной таблицей
+
+    Из архива читаются только партиции месяцев периода и только нужные
+    колонки. Звонок, который есть и в архиве, и в БД (прерванная
+    архивация), берется из БД.
+
+    Args:
+        columns: Колонки ARCHIVE_SCHEMA
+        statuses: Учитываемые статусы (по умолчанию все)
+
+    Returns:
+        pd.DataFrame: Звонки, отсортированные по дате
+    """
+    columns = list(columns)
+    if "id" not in columns:
+        columns.insert(0, "id")
+    statuses = tuple(statuses) if statuses else None
+
+    session = SessionLocal()
+    try:
+        query = session.query(Call).filter(Call.date >= start_date, Call.date <= end_date)
+        if statuses:
+            query = query.filter(Call.status.in_(statuses))
+        live_records = [
+            {key: record[key] for key in columns}
+            for record in map(_to_record, query.yield_per(ARCHIVE_CHUNK_SIZE))
+        ]
+    finally:
+        session.close()
+
+    frames = []
+    files = _archive_files(start_date, end_date) if Config.ARCHIVE_PATH.exists() else []
+    if files:
+        _require_pyarrow()
+        condition = (pc.field("date") >= pa.scalar(start_date, pa.timestamp("us"))) & \
+                    (pc.field("date") <= pa.scalar(end_date, pa.timestamp("us")))
+        if statuses:
+            condition = condition & pc.field("status").isin(list(statuses))
+        table = ds.dataset(files, format="parquet", schema=ARCHIVE_SCHEMA).to_table(
+            columns=columns, filter=condition
+        )
+        live_ids = pa.array([record["id"] for record in live_records], pa.string())
+        table = table.filter(pc.invert(pc.is_in(table["id"], value_set=live_ids)))
+        frames.append(table.to_pandas())
+
+    if pa is not None:
+        live_schema = pa.schema([ARCHIVE_SCHEMA.field(name) for name in columns])
+        frames.append(pa.Table.from_pylist(live_records, schema=live_schema).to_pandas())
+    else:
+        frames.append(pd.DataFrame(live_records, columns=columns))
+
+    frames = [frame for frame in frames if not frame.empty] or frames[-1:]
+    result = pd.concat(frames, ignore_index=True)
+    if "date" in result:
+        result = result.sort_values("date", kind="stable", ignore_index=True)
+    return result
+
+
+def archive_rollup() -> Dict[Tuple[str, str, date, str], Tuple[int, int]]:
+    """Сводка (клиент, оператор, день, статус) по архиву — для проверки call_rollup
+
+    Каждый звонок считается один раз. Если удаление после выгрузки не
+    прошло, звонок остался в calls (его учитывает живая таблица) и при
+    следующей архивации мог попасть в архив повторно — такие звонки
+    исключаются, повторы в архиве считаются по последнему файлу.
+    """
+    dataset = _archive_dataset()
+    if dataset is None:
+        return {}
+
+    # Архивные NEW в сводке не учитываются (см. ROLLUP_STATUSES)
+    table = dataset.to_table(columns=["id", "tenant", "date", "operator", "status", "duration"],
+                             filter=pc.field("status").isin(list(ROLLUP_STATUSES)))
+    if not table.num_rows:
+        return {}
+
+    # Живые звонки за даты архива — кандидаты на двойной учет
+    bounds = pc.min_max(table["date"])
+    session = SessionLocal()
+    try:
+        live_ids = [
+            call_id for (call_id,) in session.query(Call.id).filter(
+                Call.date >= bounds["min"].as_py(), Call.date <= bounds["max"].as_py()
+            )
+        ]
+    finally:
+        session.close()
+    table = table.filter(pc.invert(pc.is_in(table["id"], value_set=pa.array(live_ids, pa.string()))))
+
+    # Файлы датасета идут по порядку имен (время архивации): оставляем последнюю копию звонка
+    frame = table.to_pandas().drop_duplicates("id", keep="last")
+    # В файлах, записанных до появления клиентов, tenant пустой — это "default"
+    frame["tenant"] = frame["tenant"].fillna("").replace("", DEFAULT_TENANT)
+    frame["operator"] = frame["operator"].fillna("")
+    frame["day"] = frame["date"].dt.date
+    grouped = frame.groupby(["tenant", "operator", "day", "status"]).agg(
+        calls=("id", "count"), seconds=("duration", "sum")
+    )
+
+    return {
+        key: (int(calls), int(seconds))
+        for key, calls, seconds in zip(grouped.index, grouped["calls"], grouped["seconds"])
+    }
+
+
+def monthly_trend(start_date: datetime, end_date: datetime) -> pd.DataFrame:
+    """Средний KPI и число обработанных звонков операторов по месяцам"""
+    df = load_calls(start_date, end_date, statuses=(CallStatus.PROCESSED,))
+    if df.empty:
+        return pd.DataFrame(columns=["month", "operator", "calls", "kpi"])
+
+    df["month"] = df["date"].dt.strftime("%Y-%m")
+    df["kpi"] = df[["greeting", "needs", "presentation", "objection", "closing"]].mean(axis=1)
+    return df.groupby(["month", "operator"], as_index=False, dropna=False).agg(
+        calls=("id", "count"), kpi=("kpi", "mean")
+    )
+
+
+def _get_arg_value(name: str, default: Optional[str]) -> Optional[str]:
+    """Возвращает значение аргумента вида --name VALUE"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+
+if __name__ == "__main__":
+    init_db()
+
+    if "--trend" in sys.argv:
+        index = sys.argv.index("--trend")
+        start = datetime.strptime(sys.argv[index + 1], "%Y-%m-%d")
+        end = datetime.strptime(sys.argv[index + 2], "%Y-%m-%d").replace(hour=23, minute=59, second=59)
+        trend = monthly_trend(start, end)
+        for row in trend.itertuples():
+            print(f"{row.month} | {row.operator or '—'} | звонков: {row.calls} | KPI: {row.kpi:.2f}")
+        sys.exit(0)
+
+    days = _get_arg_value("--days", None)
+    archive_calls(int(days) if days else None)
+
+    if "--vacuum" in sys.argv:
+        vacuum_database()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк отправки отчетов: одно SMTP соединение на пакет писем
+(email_sender.send_reports) против соединения и авторизации на каждое
+письмо (прежний send_report), на локальном SMTP сервере aiosmtpd
+
+Письма — личные отчеты операторам (HTML и JSON, сжимаются в zip).
+Задержка установки соединения сервера (--handshake-ms, по умолчанию
+как TLS + авторизация у внешнего SMTP) добавляется в ответ на EHLO.
+Проверяется, что сервер получил все письма, и печатается размер
+вложений до и после сжатия.
+
+Запуск (нужен pip install aiosmtpd):
+    python benchmarks/bench_email.py
+    python benchmarks/bench_email.py --messages 50 --handshake-ms 300
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    sys.exit("❌ Для бенчмарка нужен aiosmtpd: pip install aiosmtpd")
+
+from config import Config
+from email_sender import Delivery, SMTPConnection, build_message, send_reports
+
+HOST = "127.0.0.1"
+PORT = 8025
+
+
+class CountingHandler:
+    """Принимает письма, считает их и байты; задерживает ответ на EHLO"""
+
+    def __init__(self, handshake_seconds: float):
+        self.handshake_seconds = handshake_seconds
+        self.messages = 0
+        self.bytes = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.handshake_seconds)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        self.bytes += len(envelope.content)
+        return "250 OK"
+
+
+def make_reports(folder: Path, count: int) -> list:
+    """Личные отчеты операторам: HTML (~300 КБ) и JSON на каждого"""
+    row = "<tr>" + "<td>Оператор вежливо поздоровался и записал клиента</td>" * 12 + "</tr>\n"
+    deliveries = []
+    for index in range(count):
+        html_path = folder / f"Report_{index:03d}.html"
+        html_path.write_text("<table>\n" + row * 500 + "</table>\n", encoding="utf-8")
+        json_path = folder / f"Report_{index:03d}.json"
+        json_path.write_text('{"calls": [' + ",".join(['{"greeting": 7, "needs": 6}'] * 2000) + "]}",
+                             encoding="utf-8")
+        deliveries.append(Delivery(files=[str(html_path), str(json_path)],
+                                   recipients=[f"operator{index}@company.test"],
+                                   period_text="01.01.2026 - 15.01.2026", name=f"Оператор {index}"))
+    return deliveries
+
+
+def send_one_by_one(deliveries: list) -> int:
+    """Как прежний send_report: новое соединение на каждое письмо"""
+    sent = 0
+    for delivery in deliveries:
+        with SMTPConnection(host=HOST, port=PORT, use_ssl=False, password="") as smtp:
+            smtp.send(build_message(delivery))
+            sent += 1
+    return sent
+
+
+def send_pooled(deliveries: list) -> int:
+    connection = SMTPConnection(host=HOST, port=PORT, use_ssl=False, password="")
+    return sum(send_reports(deliveries, connection=connection))
+
+
+def _get_arg_value(name: str, default: str) -> str:
+    """Возвращает значение аргумента вида --name VALUE"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+
+if __name__ == "__main__":
+    messages = int(_get_arg_value("--messages", "30"))
+    handshake = int(_get_arg_value("--handshake-ms", "150")) / 1000
+
+    Config.SMTP_USER = Config.SMTP_USER or "reports@company.test"
+
+    handler = CountingHandler(handshake)
+    controller = Controller(handler, hostname=HOST, port=PORT)
+    controller.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            deliveries = make_reports(Path(tmp), messages)
+            raw = sum(Path(path).stat().st_size for d in deliveries for path in d.files)
+
+            print(f"▶️ {messages} писем, задержка соединения {handshake * 1000:.0f} мс")
+            print(f"{'отправка':>14} {'время, с':>9} {'писем':>6} {'получено':>9} {'трафик, МБ':>11}")
+            for name, function in (("по одному", send_one_by_one), ("пакетом", send_pooled)):
+                handler.messages = handler.bytes = 0
+                started = time.perf_counter()
+                sent = function(deliveries)
+                elapsed = time.perf_counter() - started
+                print(f"{name:>14} {elapsed:>9.2f} {sent:>6} {handler.messages:>9} "
+                      f"{handler.bytes / 1024 / 1024:>11.1f}")
+
+            print(f"\nВложения: {raw / 1024 / 1024:.1f} МБ исходных файлов")
+    finally:
+        controller.stop()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк запуска CLI: время импорта точек входа (python -X importtime)
+
+Каждая точка входа импортируется в отдельном чистом интерпретаторе
+несколько раз; берется медиана суммарного времени импорта (без учета
+модулей, которые загружает сам интерпретатор при старте). Печатаются
+самые тяжелые зависимости и проверяется:
+- бюджет времени импорта точки входа;
+- что точка входа не загружает при импорте тяжелые модули, которые
+  ей нужны только в отдельных командах (openpyxl, pandas, faker, ...).
+
+Код возврата 1 — бюджет превышен или загружен запрещенный модуль, так
+что бенчмарк можно запускать как проверку перед выкладкой.
+
+Запуск:
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --runs 10 --scale 2
+"""
+
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Модули, которые нужны только отдельным командам (отчет, mock, архив, сеть)
+HEAVY_MODULES = ("openpyxl", "pandas", "pyarrow", "faker", "requests", "lxml")
+
+# Точка входа -> (бюджет импорта, мс; модули, которые нельзя загружать при импорте).
+# reporter.py загружает БД только в plan()/main(), чтобы --help был мгновенным
+ENTRY_POINTS = {
+    "reporter": (100, ("sqlalchemy",) + HEAVY_MODULES),
+    "worker": (800, HEAVY_MODULES),
+    "daemon": (800, HEAVY_MODULES),
+    "planner": (800, HEAVY_MODULES),
+    "retry_scheduler": (800, HEAVY_MODULES),
+    "rollup": (800, HEAVY_MODULES),
+    "report_jobs": (800, HEAVY_MODULES),
+}
+
+
+def parse_importtime(stderr: str) -> list:
+    """Импорты из вывода -X importtime: (вложенность, модуль, накопленное время, мкс)
+
+    Строки вывода: "import time: <self> | <cumulative> | <имя>", у
+    вложенных импортов имя с отступом в 2 пробела на уровень.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((depth, name.strip(), int(parts[1])))
+    return imports
+
+
+def importtime(module: str) -> str:
+    """Вывод -X importtime для импорта модуля в чистом интерпретаторе"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Не удалось импортировать {module}:\n{result.stderr[-2000:]}")
+    return result.stderr
+
+
+def measure(module: str, runs: int, baseline: set) -> dict:
+    """Медиана времени импорта (мс), самые тяжелые прямые зависимости и все загруженные модули"""
+    totals = []
+    for _ in range(runs):
+        imports = parse_importtime(importtime(module))
+        totals.append(sum(value for depth, name, value in imports
+                          if depth == 0 and name not in baseline) / 1000)
+    # Прямые зависимости модуля — строки уровня 1 перед его строкой уровня 0
+    direct, children = [], []
+    for depth, name, value in imports:
+        if depth == 1:
+            children.append((name, value))
+        elif depth == 0:
+            direct = children if name == module else direct
+            children = []
+    return {
+        "ms": statistics.median(totals),
+        "heaviest": sorted(direct, key=lambda item: item[1], reverse=True)[:4],
+        "loaded": {name for _, name, _ in imports},
+    }
+
+
+def _get_arg_value(name: str, default: str) -> str:
+    """Возвращает значение аргумента вида --name VALUE"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+
+if __name__ == "__main__":
+    runs = int(_get_arg_value("--runs", "5"))
+    # Множитель бюджетов для медленных машин
+    scale = float(_get_arg_value("--scale", "1"))
+
+    # Модули, которые интерпретатор загружает до любого импорта
+    baseline = {name for _, name, _ in parse_importtime(importtime("sys"))}
+
+    failed = False
+    print(f"{'модуль':>16} {'импорт, мс':>11} {'бюджет':>7}  самые тяжелые")
+    for module, (budget, forbidden) in ENTRY_POINTS.items():
+        result = measure(module, runs, baseline)
+        limit = budget * scale
+        heaviest = ", ".join(f"{name} {value / 1000:.0f}" for name, value in result["heaviest"])
+        mark = "✅" if result["ms"] <= limit else "❌"
+        print(f"{module:>16} {result['ms']:>11.1f} {limit:>7.0f}  {mark} {heaviest}")
+
+        roots = sorted({name.split(".")[0] for name in result["loaded"]} & set(forbidden))
+        if roots:
+            print(f"{'':>16} ❌ загружены при импорте: {', '.join(roots)}")
+        failed = failed or result["ms"] > limit or bool(roots)
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк записи отчета: потоковая запись Excel с именованными стилями
+(excel_writer.ExcelReportWriter) против прежней (load_workbook шаблона,
+ячейки через ws.cell, затем проход apply_beautiful_styles с новыми
+Border/Alignment на каждую ячейку), а также HTML и JSON (html_report)
+
+Строки звонков генерируются на лету, без БД, поэтому замеряется только
+формирование и сохранение книги: время, пик памяти (tracemalloc,
+отдельным прогоном) и размер файла.
+
+Запуск:
+    python benchmarks/bench_report.py
+    python benchmarks/bench_report.py --rows 100000 --max-rows 60000
+"""
+
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from openpyxl import load_workbook
+from openpyxl.styles import Alignment, Border, Side
+
+from aggregation import OperatorSummary, ReportSummary
+from excel_writer import ExcelReportWriter, EXCEL_MAX_ROWS, TEMPLATE_PATH
+from html_report import render_html, render_json
+
+OPERATORS = ["Смирнова Анна", "Кузнецова Елена", "Васильева Мария"]
+SEED = 42
+
+
+def generate_rows(count: int):
+    """Строки "Детального отчета" (12 колонок) — как в main.generate_excel"""
+    rng = random.Random(SEED)
+    start = datetime(2026, 1, 1)
+    for i in range(count):
+        duration = rng.randint(30, 600)
+        yield [
+            rng.choice(OPERATORS),
+            (start + timedelta(minutes=i)).strftime("%d.%m.%Y %H:%M"),
+            f"{duration // 60}:{duration % 60:02d}",
+            *(rng.randint(3, 10) for _ in range(5)),
+            rng.choice([0, 1, 2]),
+            rng.choice([0, 500]),
+            "Оператор вежливо поздоровался, выяснил потребность и записал клиента на прием.",
+            "Предлагать дополнительные услуги более настойчиво.",
+        ]
+
+
+def generate_calls(count: int):
+    """Те же звонки в формате aggregation.iter_call_details (для HTML и JSON)"""
+    fields = ("greeting", "needs", "presentation", "objection", "closing", "services_count", "bonus")
+    for row in generate_rows(count):
+        minutes, seconds = row[2].split(":")
+        yield {
+            "operator": row[0],
+            "date": datetime.strptime(row[1], "%d.%m.%Y %H:%M"),
+            "duration": int(minutes) * 60 + int(seconds),
+            **dict(zip(fields, row[3:10])),
+            "summary": row[10],
+            "recommendation": row[11],
+        }
+
+
+def report_summary(count: int) -> ReportSummary:
+    summary = ReportSummary(start_date=datetime(2026, 1, 1), end_date=datetime(2026, 1, 15),
+                            calls=count, services=count, kpi=7.0)
+    summary.operators = [
+        OperatorSummary(operator=name, calls=1, services=1, kpi=7.0, scores={},
+                        final_recommendation="Рекомендация")
+        for name in OPERATORS
+    ]
+    return summary
+
+
+def summary_rows():
+    return [(name, 1, 1, "7.00\nСеребряный", "Рекомендация") for name in OPERATORS]
+
+
+def legacy_apply_beautiful_styles(ws, start_row, end_row, last_col):
+    """Прежний main.apply_beautiful_styles"""
+    thin_border = Border(left=Side(style='thin'),
+                         right=Side(style='thin'),
+                         top=Side(style='thin'),
+                         bottom=Side(style='thin'))
+
+    for row in ws.iter_rows(min_row=start_row, max_row=end_row, min_col=1, max_col=last_col):
+        for cell in row:
+            cell.border = thin_border
+            if cell.column >= last_col - 1:
+                cell.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
+            else:
+                cell.alignment = Alignment(vertical='center', horizontal='center', wrap_text=True)
+            if cell.column == 1:
+                cell.alignment = Alignment(vertical='center', horizontal='left', wrap_text=True)
+
+
+def legacy_render(count: int, path: Path, max_rows: int):
+    """Прежняя запись: все ячейки в памяти, стили отдельным проходом"""
+    wb = load_workbook(TEMPLATE_PATH)
+    ws_detail = wb["Детальный отчет"]
+    r = 1
+    for r, values in enumerate(generate_rows(count), start=2):
+        for column, value in enumerate(values, start=1):
+            ws_detail.cell(row=r, column=column, value=value)
+    legacy_apply_beautiful_styles(ws_detail, 2, r, 12)
+
+    ws_summary = wb["Общий отчет"]
+    for row, values in enumerate(summary_rows(), start=16):
+        for column, value in enumerate(values, start=1):
+            ws_summary.cell(row=row, column=column, value=value)
+    legacy_apply_beautiful_styles(ws_summary, 16, 15 + len(OPERATORS), 5)
+
+    wb.save(path)
+    return 1
+
+
+def streaming_render(count: int, path: Path, max_rows: int):
+    """Новая запись через ExcelReportWriter"""
+    writer = ExcelReportWriter(max_rows=max_rows)
+    for values in generate_rows(count):
+        writer.add_detail_row(values)
+    writer.write_summary((count, count, 7.0), summary_rows())
+    writer.save(path)
+    return writer.detail_sheets
+
+
+def html_render(count: int, path: Path, max_rows: int):
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in render_html(report_summary(count), generate_calls(count)):
+            f.write(chunk)
+    return 1
+
+
+def json_render(count: int, path: Path, max_rows: int):
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in render_json(report_summary(count), generate_calls(count)):
+            f.write(chunk)
+    return 1
+
+
+def measure(function, count: int, path: Path, max_rows: int):
+    """Время и размер файла, пик памяти — отдельным прогоном (tracemalloc замедляет код)"""
+    started = time.perf_counter()
+    sheets = function(count, path, max_rows)
+    elapsed = time.perf_counter() - started
+    size = path.stat().st_size / 1024 / 1024
+
+    tracemalloc.start()
+    function(count, path, max_rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": elapsed, "peak_mb": peak / 1024 / 1024, "file_mb": size, "sheets": sheets}
+
+
+def _get_arg_value(name: str, default: str) -> str:
+    """Возвращает значение аргумента вида --name VALUE"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+
+if __name__ == "__main__":
+    rows = int(_get_arg_value("--rows", "100000"))
+    max_rows = int(_get_arg_value("--max-rows", str(EXCEL_MAX_ROWS)))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, function, extension in (("прежняя", legacy_render, "xlsx"),
+                                          ("потоковая", streaming_render, "xlsx"),
+                                          ("html", html_render, "html"),
+                                          ("json", json_render, "json")):
+            print(f"▶️ {name}: {rows} строк")
+            results[name] = measure(function, rows, Path(tmp) / f"{name}.{extension}", max_rows)
+
+    print()
+    print(f"{'запись':>10} {'время, с':>9} {'пик, МБ':>8} {'файл, МБ':>9} {'листов':>7}")
+    for name, r in results.items():
+        print(f"{name:>10} {r['seconds']:>9.2f} {r['peak_mb']:>8.1f} {r['file_mb']:>9.1f} {r['sheets']:>7}")
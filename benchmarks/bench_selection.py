@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк выбора звонков: отбор в БД (оконная функция, квоты water-filling)
+и потоковая стратифицированная выборка против прежнего отбора в Python
+(все звонки периода загружаются ORM-объектами, равные доли операторам)
+
+Для каждого размера создается временная SQLite БД со звонками периода,
+обе реализации запускаются на ней, сравниваются время, пик памяти
+(tracemalloc) и набранные минуты относительно цели.
+
+Запуск:
+    python benchmarks/bench_selection.py
+    python benchmarks/bench_selection.py --sizes 100000,1000000 --target 2000
+"""
+
+import logging
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import and_, create_engine, func
+
+from database import Base, Call, CallStatus, SessionLocal
+from call_selector import select_balanced_call_ids
+from rollup import rebuild_rollup
+from logger import logger
+
+PERIOD_START = datetime(2026, 1, 1)
+PERIOD_END = datetime(2026, 1, 31, 23, 59, 59)
+OPERATORS = 20
+# Операторов с малым числом звонков (их доля перераспределяется на остальных)
+SMALL_OPERATORS = 3
+INSERT_CHUNK = 50000
+SEED = 42
+# Звонков периода, уже обработанных прошлым запуском (засчитываются в цель)
+PROCESSED_CALLS = 100
+
+
+def legacy_select_ids(start_date: datetime, end_date: datetime, target_minutes: int) -> list:
+    """Прежняя реализация select_balanced_calls (отбор в Python), возвращает id"""
+    session = SessionLocal()
+    try:
+        all_calls = session.query(Call).filter(
+            and_(
+                Call.date >= start_date,
+                Call.date <= end_date,
+                Call.status.in_(CallStatus.IN_PROGRESS)
+            )
+        ).order_by(Call.date).all()
+
+        if not all_calls:
+            return []
+
+        processed_minutes = dict(
+            session.query(Call.operator, func.sum(Call.duration) / 60.0).filter(
+                and_(
+                    Call.date >= start_date,
+                    Call.date <= end_date,
+                    Call.status == CallStatus.PROCESSED
+                )
+            ).group_by(Call.operator).all()
+        )
+
+        operators_calls = {operator: [] for operator in processed_minutes}
+        for call in all_calls:
+            operators_calls.setdefault(call.operator, []).append(call)
+
+        target_per_operator = target_minutes / len(operators_calls)
+
+        selected = []
+        for operator, calls in operators_calls.items():
+            operator_minutes = processed_minutes.get(operator) or 0
+            for call in sorted(calls, key=lambda c: (c.status == CallStatus.NEW, c.date)):
+                if operator_minutes >= target_per_operator:
+                    break
+                selected.append(call.id)
+                operator_minutes += call.duration / 60
+        return selected
+    finally:
+        session.close()
+
+
+def _pick_operator(rng: random.Random, size: int) -> str:
+    """Оператор звонка: у первых SMALL_OPERATORS около 10 звонков за период"""
+    if rng.random() < SMALL_OPERATORS * 10 / size:
+        return f"Оператор {rng.randrange(SMALL_OPERATORS):02d}"
+    return f"Оператор {rng.randrange(SMALL_OPERATORS, OPERATORS):02d}"
+
+
+def covered_minutes(call_ids: list) -> float:
+    """Минуты выбранных звонков вместе с уже обработанными за период"""
+    session = SessionLocal()
+    try:
+        seconds = session.query(func.sum(Call.duration)).filter(
+            Call.status == CallStatus.PROCESSED
+        ).scalar() or 0
+        for offset in range(0, len(call_ids), 500):
+            seconds += session.query(func.sum(Call.duration)).filter(
+                Call.id.in_(call_ids[offset:offset + 500])
+            ).scalar() or 0
+        return seconds / 60
+    finally:
+        session.close()
+
+
+def create_database(path: Path, size: int):
+    """Создает БД с size звонками периода (~PROCESSED_CALLS обработаны, столько же начаты)"""
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+
+    rng = random.Random(SEED)
+    step = (PERIOD_END - PERIOD_START).total_seconds() / size
+    table = Call.__table__
+
+    with engine.begin() as conn:
+        rows = []
+        for i in range(size):
+            roll = rng.random()
+            if roll < PROCESSED_CALLS / size:
+                status = CallStatus.PROCESSED
+            elif roll < 2 * PROCESSED_CALLS / size:
+                status = CallStatus.TRANSCRIBED
+            else:
+                status = CallStatus.NEW
+
+            rows.append({
+                "id": f"bench_{i}",
+                "date": PERIOD_START + timedelta(seconds=i * step),
+                "operator": _pick_operator(rng, size),
+                "phone": "+70000000000",
+                "duration": rng.randint(30, 600),
+                "status": status,
+                "audio_url": "mock://audio.mp3",
+            })
+            if len(rows) == INSERT_CHUNK:
+                conn.execute(table.insert(), rows)
+                rows = []
+        if rows:
+            conn.execute(table.insert(), rows)
+
+    return engine
+
+
+def measure(function, *args):
+    """Время вызова и пик памяти (отдельным прогоном: tracemalloc замедляет код)"""
+    started = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def run(size: int, target_minutes: int) -> dict:
+    """Бенчмарк на БД из size звонков"""
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        engine = create_database(Path(tmp) / "bench.db", size)
+        SessionLocal.configure(bind=engine)
+        # Звонки вставлены в обход ORM — сводку call_rollup строим явно
+        rebuild_rollup()
+        print(f"  БД на {size} звонков создана за {time.perf_counter() - started:.1f}с")
+
+        legacy_ids, legacy_time, legacy_peak = measure(
+            legacy_select_ids, PERIOD_START, PERIOD_END, target_minutes
+        )
+        sql_ids, sql_time, sql_peak = measure(
+            select_balanced_call_ids, PERIOD_START, PERIOD_END, target_minutes, "oldest"
+        )
+        stratified_ids, stratified_time, stratified_peak = measure(
+            select_balanced_call_ids, PERIOD_START, PERIOD_END, target_minutes, "stratified"
+        )
+        legacy_minutes = covered_minutes(legacy_ids)
+        sql_minutes = covered_minutes(sql_ids)
+        stratified_minutes = covered_minutes(stratified_ids)
+        engine.dispose()
+
+    return {
+        "size": size,
+        "legacy_selected": len(legacy_ids),
+        "legacy_minutes": legacy_minutes,
+        "legacy_seconds": legacy_time,
+        "legacy_peak_mb": legacy_peak,
+        "sql_selected": len(sql_ids),
+        "sql_minutes": sql_minutes,
+        "sql_seconds": sql_time,
+        "sql_peak_mb": sql_peak,
+        "stratified_selected": len(stratified_ids),
+        "stratified_minutes": stratified_minutes,
+        "stratified_seconds": stratified_time,
+        "stratified_peak_mb": stratified_peak,
+    }
+
+
+def _get_arg_value(name: str, default: str) -> str:
+    """Возвращает значение аргумента вида --name VALUE"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in _get_arg_value("--sizes", "100000,1000000").split(",")]
+    target_minutes = int(_get_arg_value("--target", "2000"))
+
+    # Логи выбора не нужны в выводе бенчмарка
+    logger.setLevel(logging.WARNING)
+
+    results = []
+    for size in sizes:
+        print(f"▶️ {size} звонков")
+        results.append(run(size, target_minutes))
+
+    print()
+    print(f"Цель: {target_minutes} мин")
+    print(f"{'звонков':>10} {'реализация':>11} {'выбрано':>8} {'минут':>9} {'время, с':>9} {'пик, МБ':>8}")
+    for r in results:
+        for name, key in (("Python", "legacy"), ("SQL", "sql"), ("stratified", "stratified")):
+            print(
+                f"{r['size']:>10} {name:>11} {r[key + '_selected']:>8} {r[key + '_minutes']:>9.1f} "
+                f"{r[key + '_seconds']:>9.2f} {r[key + '_peak_mb']:>8.1f}"
+            )
+
+    # Новая реализация не должна превышать цель
+    sys.exit(0 if all(
+        r["sql_minutes"] <= target_minutes and r["stratified_minutes"] <= target_minutes
+        for r in results
+    ) else 1)
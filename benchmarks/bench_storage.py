@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк одновременной записи и чтения SQLite: прагмы по умолчанию
+против настроек database.create_db_engine (WAL, busy_timeout,
+synchronous=NORMAL, mmap)
+
+Нагрузка повторяет рабочую ситуацию: процессы-"вебхуки" вставляют
+звонки по одному (коммит на звонок), а процессы-"воркеры" в это время
+читают сводку по операторам и меняют статусы звонков. Для каждого
+режима считаются операции в секунду, p99 времени операции и число
+ошибок "database is locked".
+
+Запуск:
+    python benchmarks/bench_storage.py
+    python benchmarks/bench_storage.py --writers 4 --workers 4 --ops 300
+"""
+
+import multiprocessing
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, Call, CallStatus, create_db_engine
+from metrics import percentile
+
+OPERATORS = ["Смирнова Анна", "Кузнецова Елена", "Васильева Мария"]
+PERIOD_START = datetime(2026, 1, 1)
+# Звонков в БД до начала нагрузки
+INITIAL_CALLS = 5000
+# Таймаут ожидания блокировки в режиме по умолчанию (как у sqlite3)
+DEFAULT_TIMEOUT = 5.0
+
+
+def make_engine(url: str, tuned: bool):
+    """Движок в режиме по умолчанию или с настройками приложения"""
+    if tuned:
+        return create_db_engine(url)
+    return create_engine(url, connect_args={"timeout": DEFAULT_TIMEOUT})
+
+
+def prepare_database(url: str):
+    """Создает БД с INITIAL_CALLS новыми звонками"""
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(0)
+    with engine.begin() as conn:
+        conn.execute(Call.__table__.insert(), [
+            {
+                "id": f"seed_{i}",
+                "date": PERIOD_START + timedelta(minutes=i),
+                "operator": rng.choice(OPERATORS),
+                "duration": rng.randint(30, 600),
+                "status": CallStatus.NEW,
+            }
+            for i in range(INITIAL_CALLS)
+        ])
+    engine.dispose()
+
+
+def _writer(url: str, tuned: bool, index: int, ops: int, results):
+    """Вставляет звонки по одному, как вебхук"""
+    Session = sessionmaker(bind=make_engine(url, tuned))
+    rng = random.Random(index)
+    latencies, errors = [], 0
+
+    for i in range(ops):
+        started = time.perf_counter()
+        session = Session()
+        try:
+            session.add(Call(
+                id=f"w{index}_{i}",
+                date=PERIOD_START + timedelta(minutes=rng.randint(0, 20000)),
+                operator=rng.choice(OPERATORS),
+                duration=rng.randint(30, 600),
+                status=CallStatus.NEW,
+            ))
+            session.commit()
+        except OperationalError:
+            session.rollback()
+            errors += 1
+        finally:
+            session.close()
+        latencies.append(time.perf_counter() - started)
+
+    results.put(("write", latencies, errors))
+
+
+def _worker(url: str, tuned: bool, index: int, ops: int, results):
+    """Читает сводку по операторам и меняет статус звонка, как воркер"""
+    Session = sessionmaker(bind=make_engine(url, tuned))
+    rng = random.Random(1000 + index)
+    latencies, errors = [], 0
+
+    for _ in range(ops):
+        started = time.perf_counter()
+        session = Session()
+        try:
+            session.query(Call.operator, func.sum(Call.duration)).filter(
+                Call.status == CallStatus.NEW
+            ).group_by(Call.operator).all()
+
+            call = session.get(Call, f"seed_{rng.randrange(INITIAL_CALLS)}")
+            call.status = CallStatus.DOWNLOADED if call.status == CallStatus.NEW else CallStatus.NEW
+            session.commit()
+        except OperationalError:
+            session.rollback()
+            errors += 1
+        finally:
+            session.close()
+        latencies.append(time.perf_counter() - started)
+
+    results.put(("worker", latencies, errors))
+
+
+def run(tuned: bool, writers: int, workers: int, ops: int) -> dict:
+    """Один прогон нагрузки на свежей БД"""
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        prepare_database(url)
+
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        processes = [
+            ctx.Process(target=_writer, args=(url, tuned, i, ops, results)) for i in range(writers)
+        ] + [
+            ctx.Process(target=_worker, args=(url, tuned, i, ops, results)) for i in range(workers)
+        ]
+
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+    summary = {"mode": "tuned" if tuned else "default", "seconds": elapsed}
+    for kind in ("write", "worker"):
+        latencies = [value for k, values, _ in collected if k == kind for value in values]
+        summary[f"{kind}_ops_per_second"] = len(latencies) / elapsed if elapsed else 0
+        summary[f"{kind}_p99_ms"] = percentile(latencies, 99) * 1000
+        summary[f"{kind}_errors"] = sum(errors for k, _, errors in collected if k == kind)
+    return summary
+
+
+def _get_arg_value(name: str, default: str) -> str:
+    """Возвращает значение аргумента вида --name VALUE"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+
+if __name__ == "__main__":
+    writers = int(_get_arg_value("--writers", "2"))
+    workers = int(_get_arg_value("--workers", "4"))
+    ops = int(_get_arg_value("--ops", "300"))
+
+    print(f"▶️ Вебхуков: {writers}, воркеров: {workers}, операций на процесс: {ops}")
+    results = [run(tuned, writers, workers, ops) for tuned in (False, True)]
+
+    print()
+    print(f"{'режим':>8} {'время, с':>9} {'запись/с':>9} {'p99, мс':>8} {'ошибок':>7} "
+          f"{'воркер/с':>9} {'p99, мс':>8} {'ошибок':>7}")
+    for r in results:
+        print(
+            f"{r['mode']:>8} {r['seconds']:>9.2f} {r['write_ops_per_second']:>9.1f} "
+            f"{r['write_p99_ms']:>8.1f} {r['write_errors']:>7} {r['worker_ops_per_second']:>9.1f} "
+            f"{r['worker_p99_ms']:>8.1f} {r['worker_errors']:>7}"
+        )
+
+    tuned = results[1]
+    sys.exit(0 if tuned["write_errors"] == 0 and tuned["worker_errors"] == 0 else 1)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Набор бенчмарков горячих участков без интерактивных вопросов
+
+В отличие от test_system.py (проверка интеграций с вопросами в
+консоли) запускается без участия человека: в cron, перед выкладкой,
+после изменений в выборе, отчетах или вебхуке. Данные — синтетические
+и детерминированные (benchmarks/synthetic.py), БД — временная.
+
+Случаи:
+- selection_<N> — call_selector.select_balanced_calls на БД из N звонков;
+- generate_excel_<N> — итоги (aggregate_report) и main.generate_excel по
+  обработанной истории той же БД (5% от N), рекомендации без GPT;
+- extract_transcript — YandexSpeechClient._extract_transcript, ответы
+  SpeechKit на 5-минутные звонки;
+- gpt_json_parse — yandex_gpt.parse_gpt_json, ответы как у YandexGPT
+  (половина в ```json ... ```);
+- webhook — POST / receiver.py через ASGI клиент (нужен httpx) по
+  потоку форм АТС с повторами и другими командами.
+
+Результаты пишутся в JSON (--output, по умолчанию logs/bench_<дата>.json)
+и сравниваются с benchmarks/baseline.json: случай медленнее базы больше
+чем на --threshold (доля) — регрессия, код возврата 1. Базу снимают на
+той же машине, где потом сравнивают:
+    python benchmarks/bench_suite.py --update-baseline
+
+Запуск:
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --sizes 10000,100000,1000000 --threshold 0.3
+    python benchmarks/bench_suite.py --only selection,webhook
+"""
+
+import contextlib
+import io
+import json
+import logging
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, func
+
+from database import Base, Call, SessionLocal
+from logger import logger
+from synthetic import (
+    HISTORY_END, HISTORY_START, PERIOD_END, PERIOD_START, SEED, create_database, gpt_response_text,
+    persisted_forms, speechkit_response, webhook_forms
+)
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+# Насколько случай может быть медленнее базы без регрессии (0.5 — на 50%).
+# На общих виртуальных машинах прогоны расходятся до 30%; на выделенной
+# машине порог можно снизить (--threshold 0.2)
+REGRESSION_THRESHOLD = 0.5
+TARGET_MINUTES = 2000
+TRANSCRIPTS = 2000
+GPT_RESPONSES = 5000
+# Проходов по ответам в одном замере: короткие замеры слишком шумные для порога
+ROUNDS = 10
+WEBHOOK_REQUESTS = 2000
+
+
+def timed(function, repeats: int) -> tuple:
+    """Лучшее время из repeats вызовов и результат последнего
+
+    Минимум, а не среднее: шум (другие процессы, сборка мусора) только
+    добавляет время, и минимум меньше скачет между прогонами.
+    """
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - started)
+    return min(times), result
+
+
+def bench_selection(repeats: int) -> dict:
+    from call_selector import select_balanced_calls
+
+    seconds, calls = timed(
+        lambda: select_balanced_calls(PERIOD_START, PERIOD_END, TARGET_MINUTES, seed=SEED), repeats
+    )
+    return {"seconds": seconds, "selected": len(calls),
+            "minutes": round(sum(call.duration or 0 for call in calls) / 60, 1)}
+
+
+def bench_generate_excel(folder: Path, repeats: int) -> dict:
+    from aggregation import aggregate_report
+    from main import generate_excel
+
+    def run():
+        summary = aggregate_report(HISTORY_START, HISTORY_END)
+        # Итоговые рекомендации — как без доступа к GPT, чтобы не зависеть от сети
+        for item in summary.operators:
+            item.final_recommendation = f"Статус: {item.tier}.\nЧастая ошибка: {item.top_recommendation}"
+        with contextlib.redirect_stdout(io.StringIO()):
+            return generate_excel(HISTORY_START, HISTORY_END, summary=summary,
+                                  output_filename=str(folder / "bench.xlsx")), summary.calls
+
+    seconds, (path, rows) = timed(run, repeats)
+    return {"seconds": seconds, "rows": rows,
+            "file_mb": round(Path(path).stat().st_size / 1024 / 1024, 2) if path else None}
+
+
+def bench_extract_transcript(repeats: int) -> dict:
+    from yandex_speech import YandexSpeechClient
+
+    rng = random.Random(SEED)
+    responses = [speechkit_response(rng, 300) for _ in range(TRANSCRIPTS)]
+    client = YandexSpeechClient()
+    seconds, _ = timed(lambda: [client._extract_transcript(response)
+                                for _ in range(ROUNDS) for response in responses], repeats)
+    return {"seconds": seconds, "calls": TRANSCRIPTS * ROUNDS,
+            "us_per_call": round(seconds / TRANSCRIPTS / ROUNDS * 1e6, 1)}
+
+
+def bench_gpt_json_parse(repeats: int) -> dict:
+    from yandex_gpt import parse_gpt_json
+
+    rng = random.Random(SEED)
+    texts = [gpt_response_text(rng, fenced=index % 2 == 0) for index in range(GPT_RESPONSES)]
+    seconds, _ = timed(lambda: [parse_gpt_json(text) for _ in range(ROUNDS) for text in texts], repeats)
+    return {"seconds": seconds, "responses": GPT_RESPONSES * ROUNDS,
+            "us_per_response": round(seconds / GPT_RESPONSES / ROUNDS * 1e6, 1)}
+
+
+def bench_webhook(folder: Path) -> dict:
+    """Последовательные POST / (один прогон: повторный прогон — одни дубли)"""
+    try:
+        from fastapi.testclient import TestClient
+    except (ImportError, RuntimeError):
+        print("   ⚠️ Пропуск webhook: для ASGI клиента нужен httpx (pip install httpx)")
+        return None
+    import receiver
+
+    engine = create_engine(f"sqlite:///{folder / 'webhook.db'}")
+    Base.metadata.create_all(bind=engine)
+    SessionLocal.configure(bind=engine)
+
+    forms = list(webhook_forms(WEBHOOK_REQUESTS))
+    latencies = []
+    errors = 0
+    with TestClient(receiver.app) as client, contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for form in forms:
+            request_started = time.perf_counter()
+            errors += client.post("/", data=form).status_code != 200
+            latencies.append(time.perf_counter() - request_started)
+        seconds = time.perf_counter() - started
+
+    session = SessionLocal()
+    try:
+        persisted = session.query(func.count(Call.id)).scalar()
+    finally:
+        session.close()
+    engine.dispose()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {"seconds": seconds, "requests": len(forms), "rps": round(len(forms) / seconds, 1),
+            "p50_ms": round(quantiles[49] * 1000, 2), "p99_ms": round(quantiles[98] * 1000, 2),
+            "errors": errors, "persisted": persisted, "expected": persisted_forms(forms)}
+
+
+def run_suite(sizes: list, repeats: int, only: set = None) -> dict:
+    """Прогоняет случаи; {случай: метрики}, у каждого есть seconds"""
+    def wanted(name: str) -> bool:
+        return not only or name in only
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        if wanted("selection") or wanted("generate_excel"):
+            for size in sizes:
+                started = time.perf_counter()
+                engine = create_database(folder / f"bench_{size}.db", size)
+                print(f"▶️ БД на {size} звонков создана за {time.perf_counter() - started:.1f}с")
+                # Большие БД: меньше повторов, время и так стабильно
+                size_repeats = repeats if size < 1000000 else 1
+                if wanted("selection"):
+                    results[f"selection_{size}"] = bench_selection(size_repeats)
+                if wanted("generate_excel"):
+                    results[f"generate_excel_{size}"] = bench_generate_excel(folder, size_repeats)
+                engine.dispose()
+
+        if wanted("extract_transcript"):
+            results["extract_transcript"] = bench_extract_transcript(repeats)
+        if wanted("gpt_json_parse"):
+            results["gpt_json_parse"] = bench_gpt_json_parse(repeats)
+        if wanted("webhook"):
+            webhook = bench_webhook(folder)
+            if webhook:
+                results["webhook"] = webhook
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Случаи, которые медленнее базы больше чем на threshold"""
+    regressions = []
+    print(f"\n{'случай':>24} {'время, с':>9} {'база, с':>8} {'изм.':>7}")
+    for name, metrics in results.items():
+        base = baseline.get(name, {}).get("seconds")
+        if not base:
+            print(f"{name:>24} {metrics['seconds']:>9.3f} {'—':>8} {'':>7}  нет в базе")
+            continue
+        change = metrics["seconds"] / base - 1
+        mark = "❌" if change > threshold else "✅"
+        print(f"{name:>24} {metrics['seconds']:>9.3f} {base:>8.3f} {change:>+7.0%}  {mark}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def _get_arg_value(name: str, default: str) -> str:
+    """Возвращает значение аргумента вида --name VALUE"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in _get_arg_value("--sizes", "10000,100000").split(",")]
+    repeats = int(_get_arg_value("--repeats", "5"))
+    threshold = float(_get_arg_value("--threshold", str(REGRESSION_THRESHOLD)))
+    only = {name.strip() for name in _get_arg_value("--only", "").split(",") if name.strip()}
+    output = Path(_get_arg_value("--output", f"logs/bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"))
+    baseline_path = Path(_get_arg_value("--baseline", str(BASELINE_PATH)))
+
+    # Логи выбора и отчета не нужны в выводе бенчмарка
+    logger.setLevel(logging.WARNING)
+
+    results = run_suite(sizes, repeats, only)
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "sizes": sizes,
+        "results": results,
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n📄 Результаты: {output}")
+
+    if "--update-baseline" in sys.argv:
+        baseline_path.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"📌 База обновлена: {baseline_path}")
+        sys.exit(0)
+
+    baseline = {}
+    if baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))["results"]
+    else:
+        print(f"ℹ️ Базы {baseline_path} нет — сравнивать не с чем (--update-baseline)")
+    regressions = compare(results, baseline, threshold)
+    if regressions:
+        print(f"\n❌ Регрессия больше {threshold:.0%}: {', '.join(regressions)}")
+    sys.exit(1 if regressions else 0)
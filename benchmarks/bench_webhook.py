@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест вебхука АТС (receiver.py): сколько событий в секунду
+он принимает без таймаутов и потерь
+
+Поток форм — как шлет Мегафон (benchmarks/synthetic.webhook_forms):
+history с записью и без (пропущенные), другие команды, повторы уже
+отправленных звонков. Запросы отправляются по расписанию (открытая
+модель нагрузки: следующий запрос не ждет ответа на предыдущий, как у
+АТС) с постоянной частотой --rates и пачками --burst раз в
+--burst-every секунд. Запрос без ответа за --timeout секунд АТС
+считает потерянным.
+
+Режимы (--mode):
+- asgi — приложение в этом же процессе через httpx.ASGITransport: цена
+  обработчика и записи в БД без сети. Обработчик синхронно пишет в БД
+  внутри event loop, поэтому под нагрузкой отстает и само расписание;
+- uvicorn — настоящий сервер (python -m uvicorn receiver:app) в
+  отдельном процессе, запросы по HTTP. Ошибки сервера (например,
+  ClientDisconnect, когда АТС не дождалась ответа) пишутся в его лог и
+  считаются в колонке "ошиб. сервера".
+
+Для каждой частоты печатаются: отправлено, ответы 200, ошибки и
+таймауты, устойчивая частота (ответов 200 в секунду), задержка
+p50/p99 и сохраненные звонки против ожидаемых (history Success с
+записью без повторов) — потери при записи видны как "потеряно".
+БД — временная SQLite с настройками из database.create_db_engine
+(или --database-url, например тестовая PostgreSQL).
+
+Запуск (нужен pip install httpx):
+    python benchmarks/bench_webhook.py
+    python benchmarks/bench_webhook.py --mode uvicorn --rates 100,200,400,800 --duration 20
+    python benchmarks/bench_webhook.py --burst 1000 --burst-every 5 --timeout 3
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+try:
+    import httpx
+except ImportError:
+    sys.exit("❌ Для нагрузочного теста нужен httpx: pip install httpx")
+
+from sqlalchemy import func
+
+from database import Base, Call, SessionLocal, create_db_engine
+from synthetic import persisted_forms, webhook_forms
+
+# Сколько ждать запуска uvicorn
+SERVER_START_TIMEOUT = 30
+# Сколько ждать, пока сервер допишет запросы, на которые клиент не дождался ответа
+DRAIN_SECONDS = 5
+
+
+def build_schedule(rate: float, duration: float, burst: int, burst_every: float) -> list:
+    """Моменты отправки (сек от начала): rate в секунду + пачки по burst"""
+    moments = [index / rate for index in range(int(rate * duration))]
+    if burst and burst_every:
+        at = burst_every
+        while at < duration:
+            moments += [at] * burst
+            at += burst_every
+    return sorted(moments)
+
+
+async def run_load(client, forms: list, schedule: list, timeout: float) -> dict:
+    """Отправляет forms по расписанию schedule, не дожидаясь ответов"""
+    latencies = []
+    counts = {"ok": 0, "errors": 0, "timeouts": 0}
+
+    async def send(form):
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(client.post("/", data=form), timeout)
+        except asyncio.TimeoutError:
+            counts["timeouts"] += 1
+            return
+        except httpx.HTTPError:
+            counts["errors"] += 1
+            return
+        latencies.append(time.perf_counter() - started)
+        counts["ok" if response.status_code == 200 else "errors"] += 1
+
+    tasks = []
+    lag = 0.0
+    started = time.perf_counter()
+    for moment, form in zip(schedule, forms):
+        delay = started + moment - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            lag = max(lag, -delay)
+        tasks.append(asyncio.create_task(send(form)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0] * 99
+    return {
+        **counts,
+        "sent": len(tasks),
+        "offered_rps": round(len(tasks) / max(schedule[-1], 1e-9), 1) if schedule else 0,
+        "sustained_rps": round(counts["ok"] / elapsed, 1),
+        "p50_ms": round(quantiles[49] * 1000, 1),
+        "p99_ms": round(quantiles[98] * 1000, 1),
+        # Насколько генератор отстал от расписания (сервер или обработчик не отдавал управление)
+        "schedule_lag_ms": round(lag * 1000, 1),
+    }
+
+
+def count_persisted(prefix: str) -> int:
+    session = SessionLocal()
+    try:
+        return session.query(func.count(Call.id)).filter(Call.id.like(f"{prefix}\\_%", escape="\\")).scalar()
+    finally:
+        session.close()
+
+
+def wait_drained(prefix: str) -> int:
+    """Сохраненные звонки прогона, когда их число перестало расти"""
+    persisted = count_persisted(prefix)
+    deadline = time.monotonic() + DRAIN_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(0.5)
+        current = count_persisted(prefix)
+        if current == persisted:
+            break
+        persisted = current
+    return persisted
+
+
+def _server_errors(server_log: Path) -> int:
+    if server_log is None or not server_log.exists():
+        return 0
+    return server_log.read_text(encoding="utf-8", errors="replace").count("Traceback")
+
+
+def run_rates(client_factory, mode: str, rates: list, args: dict, server_log: Path = None) -> list:
+    """Прогон по каждой частоте; свой префикс callid, чтобы считать сохраненные"""
+    results = []
+    for rate in rates:
+        errors_before = _server_errors(server_log)
+        schedule = build_schedule(rate, args["duration"], args["burst"], args["burst_every"])
+        prefix = f"{mode}{int(rate)}"
+        forms = list(webhook_forms(len(schedule), seed=int(rate), prefix=prefix))
+
+        async def load():
+            async with client_factory() as client:
+                return await run_load(client, forms, schedule, args["timeout"])
+
+        bursts = f" + пачки по {args['burst']} раз в {args['burst_every']:g} с" if args["burst"] else ""
+        print(f"▶️ {mode}: {rate:g} запр/с × {args['duration']:g} с{bursts}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = asyncio.run(load())
+        result["expected"] = persisted_forms(forms)
+        result["persisted"] = wait_drained(prefix)
+        result["lost"] = result["expected"] - result["persisted"]
+        result["server_errors"] = _server_errors(server_log) - errors_before
+        result.update(mode=mode, rate=rate)
+        results.append(result)
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def uvicorn_server(database_url: str, workers: int, server_log: Path):
+    """uvicorn receiver:app в отдельном процессе (stderr — в server_log); адрес сервера"""
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=database_url)
+    log_file = open(server_log, "w", encoding="utf-8")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "receiver:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=log_file
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            try:
+                if httpx.get(f"{url}/metrics", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("uvicorn не запустился")
+            time.sleep(0.2)
+        yield url
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        log_file.close()
+
+
+def _get_arg_value(name: str, default: str) -> str:
+    """Возвращает значение аргумента вида --name VALUE"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+
+if __name__ == "__main__":
+    modes = _get_arg_value("--mode", "asgi,uvicorn").split(",")
+    rates = [float(rate) for rate in _get_arg_value("--rates", "100,200,400").split(",")]
+    args = {
+        "duration": float(_get_arg_value("--duration", "10")),
+        "burst": int(_get_arg_value("--burst", "300")),
+        "burst_every": float(_get_arg_value("--burst-every", "5")),
+        # АТС ждет ответа на вебхук несколько секунд, затем событие теряется
+        "timeout": float(_get_arg_value("--timeout", "5")),
+    }
+    server_workers = int(_get_arg_value("--server-workers", "1"))
+    connections = int(_get_arg_value("--connections", "200"))
+    output = Path(_get_arg_value("--output", f"logs/bench_webhook_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = _get_arg_value("--database-url", f"sqlite:///{Path(tmp) / 'webhook.db'}")
+        engine = create_db_engine(database_url)
+        Base.metadata.create_all(bind=engine)
+        SessionLocal.configure(bind=engine)
+
+        if "asgi" in modes:
+            import receiver
+            transport = httpx.ASGITransport(app=receiver.app)
+            results += run_rates(
+                lambda: httpx.AsyncClient(transport=transport, base_url="http://receiver"),
+                "asgi", rates, args
+            )
+
+        if "uvicorn" in modes:
+            limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+            server_log = Path(tmp) / "uvicorn.log"
+            with uvicorn_server(database_url, server_workers, server_log) as url:
+                results += run_rates(
+                    lambda: httpx.AsyncClient(base_url=url, limits=limits), "uvicorn", rates, args,
+                    server_log
+                )
+        engine.dispose()
+
+    print()
+    print(f"{'режим':>8} {'запр/с':>7} {'отпр.':>6} {'200':>6} {'ошиб.':>6} {'тайм.':>6} "
+          f"{'устойч.':>8} {'p50, мс':>8} {'p99, мс':>8} {'отст., мс':>10} "
+          f"{'сохр.':>6} {'ожид.':>6} {'потеряно':>9} {'ошиб. сервера':>14}")
+    for r in results:
+        mark = "✅" if not r["lost"] and not r["timeouts"] and not r["errors"] else "❌"
+        print(f"{r['mode']:>8} {r['rate']:>7g} {r['sent']:>6} {r['ok']:>6} {r['errors']:>6} {r['timeouts']:>6} "
+              f"{r['sustained_rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['schedule_lag_ms']:>10.0f} "
+              f"{r['persisted']:>6} {r['expected']:>6} {r['lost']:>9} {r['server_errors']:>14}  {mark}")
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"created": datetime.now().isoformat(timespec="seconds"), **args,
+                                  "results": results}, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n📄 Результаты: {output}")
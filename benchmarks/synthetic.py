@@ -0,0 +1,248 @@
+"""
+Синтетические данные для бенчмарков: звонки, ответы SpeechKit и GPT, вебхуки АТС
+
+Все генераторы детерминированы (random.Random(seed)), поэтому прогоны
+на одном размере сравнимы между собой и с базовыми результатами.
+Распределения приближены к реальным:
+- нагрузка на операторов неравномерная (логнормальные веса), несколько
+  операторов почти без звонков;
+- длительность — логнормальная (медиана ~2.5 мин, хвост до 30 мин);
+- звонки — в рабочие часы с пиками утром и после обеда;
+- оценки GPT зависят от "уровня" оператора, как в реальных отчетах;
+- в БД, кроме звонков текущего периода (почти все NEW, ~PROCESSED_CALLS
+  уже обработаны), есть обработанная история прошлого периода — по ней
+  строится отчет.
+
+БД заполняется пачками через Core (INSERT ... VALUES на INSERT_CHUNK
+строк), без ORM: 1 млн звонков — около минуты.
+"""
+
+import json
+import math
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from sqlalchemy import create_engine
+
+from database import Base, Call, CallStatus, SessionLocal
+from tenants import DEFAULT_TENANT
+
+PERIOD_START = datetime(2026, 1, 1)
+PERIOD_END = datetime(2026, 1, 15, 23, 59, 59)
+# Прошлый период: обработанные звонки для отчета
+HISTORY_START = datetime(2025, 12, 16)
+HISTORY_END = datetime(2025, 12, 31, 23, 59, 59)
+# Звонков текущего периода, уже обработанных прошлым запуском (засчитываются в цель)
+PROCESSED_CALLS = 100
+OPERATORS = 20
+# Операторов почти без звонков (их доля цели перераспределяется)
+SMALL_OPERATORS = 2
+INSERT_CHUNK = 20000
+SEED = 42
+
+# Доля звонков периода по часам (8:00-20:00): пики 10-12 и 15-17
+HOUR_WEIGHTS = {8: 3, 9: 7, 10: 11, 11: 12, 12: 9, 13: 7, 14: 9, 15: 11, 16: 11, 17: 9, 18: 6, 19: 5}
+# Длительность: логнормальное распределение, секунды
+DURATION_MEDIAN = 150
+DURATION_SIGMA = 0.8
+DURATION_MIN, DURATION_MAX = 10, 1800
+
+KPI_FIELDS = ("greeting", "needs", "presentation", "objection", "closing")
+RECOMMENDATIONS = [
+    "Не перебивать клиента, выслушать до конца.",
+    "Предлагать доп. услуги (УЗИ, анализы) более настойчиво.",
+    "Говорить громче и увереннее, клиент переспрашивает.",
+    "Выучить прайс-лист, долгие паузы при поиске цены.",
+    "Резюмировать договоренности в конце звонка.",
+    "Спрашивать, откуда клиент узнал о клинике.",
+    "Отличная работа, эталонный диалог.",
+]
+PHRASES = [
+    "Маммологический центр, добрый день, меня зовут Анна, чем могу помочь?",
+    "Здравствуйте, хочу записаться на УЗИ молочных желез.",
+    "Скажите, пожалуйста, вы ранее обращались к нам?",
+    "Могу предложить два варианта: завтра в 10:00 или послезавтра в 14:30.",
+    "Стоимость исследования 2500 рублей, в нее входит заключение врача.",
+    "Подскажите, а можно прийти вечером после работы?",
+    "Да, конечно, у нас есть запись до восьми вечера.",
+    "Остались ли у вас вопросы? Откуда вы о нас узнали?",
+    "Спасибо, всего доброго, ждем вас.",
+]
+
+
+def operator_names(count: int = OPERATORS) -> List[str]:
+    return [f"Оператор {index:02d}" for index in range(count)]
+
+
+def _operator_profiles(rng: random.Random, count: int) -> Dict[str, tuple]:
+    """Оператор -> (вес в потоке звонков, средний уровень оценок)"""
+    profiles = {}
+    for index, name in enumerate(operator_names(count)):
+        weight = 0.02 if index < SMALL_OPERATORS else rng.lognormvariate(0, 0.6)
+        profiles[name] = (weight, min(9.5, max(4.0, rng.gauss(7.2, 1.1))))
+    return profiles
+
+
+def _duration(rng: random.Random) -> int:
+    seconds = rng.lognormvariate(math.log(DURATION_MEDIAN), DURATION_SIGMA)
+    return int(min(DURATION_MAX, max(DURATION_MIN, seconds)))
+
+
+def _call_date(rng: random.Random, start: datetime, days: int) -> datetime:
+    hour = rng.choices(list(HOUR_WEIGHTS), weights=list(HOUR_WEIGHTS.values()))[0]
+    return start + timedelta(days=rng.randrange(days), hours=hour, seconds=rng.randrange(3600))
+
+
+def ai_data(rng: random.Random, level: float = 7.2) -> dict:
+    """Результат анализа GPT (как yandex_gpt.analyze_call) для оператора уровня level"""
+    data = {}
+    for name in KPI_FIELDS:
+        data[name] = int(min(10, max(0, round(rng.gauss(level, 1.5)))))
+        data[f"{name}_comment"] = "Выполнено частично" if data[name] < 7 else "Выполнено"
+    data["bonus"] = rng.choices([0, 1, 2, 3, 5], weights=[50, 20, 15, 10, 5])[0]
+    data["bonus_comment"] = "Общее впечатление"
+    data["services_count"] = rng.choices([0, 1, 2, 3], weights=[35, 40, 20, 5])[0]
+    data["summary"] = " ".join(rng.sample(PHRASES, 3))
+    data["recommendation"] = rng.choice(RECOMMENDATIONS)
+    return data
+
+
+def generate_calls(size: int, seed: int = SEED, history_share: float = 0.05,
+                   operators: int = OPERATORS) -> Iterator[dict]:
+    """Строки таблицы calls: size звонков, доля history_share — обработанная история
+
+    Остальные звонки — текущего периода: ~PROCESSED_CALLS обработаны,
+    немного в FAILED/DEAD (ошибки обработки), остальные NEW.
+    Обработанные — с ai_data и processed_at.
+    """
+    rng = random.Random(seed)
+    profiles = _operator_profiles(rng, operators)
+    names = list(profiles)
+    weights = [weight for weight, _ in profiles.values()]
+    for index in range(size):
+        operator = rng.choices(names, weights=weights)[0]
+        duration = _duration(rng)
+        roll = rng.random()
+        history = roll < history_share
+        start, end = (HISTORY_START, HISTORY_END) if history else (PERIOD_START, PERIOD_END)
+        date = min(end, _call_date(rng, start, (end - start).days + 1))
+        row = {
+            "id": f"bench_{index}",
+            "tenant": DEFAULT_TENANT,
+            "date": date,
+            "operator": operator,
+            "phone": f"+7900{rng.randrange(10 ** 7):07d}",
+            "duration": duration,
+            "audio_url": f"https://pbx.example/records/{index}.mp3",
+            "status": CallStatus.NEW,
+            "ai_data": {},
+            "processed_at": None,
+            "attempts": None,
+            "last_error": None,
+        }
+        if history or roll < history_share + PROCESSED_CALLS / size:
+            row["status"] = CallStatus.PROCESSED
+            row["ai_data"] = ai_data(rng, profiles[operator][1])
+            row["processed_at"] = date + timedelta(hours=1)
+        elif roll < history_share + 2 * PROCESSED_CALLS / size:
+            row["status"] = rng.choice([CallStatus.FAILED, CallStatus.DEAD])
+            row["attempts"] = 1 if row["status"] == CallStatus.FAILED else 5
+            row["last_error"] = "HTTP 503 от SpeechKit"
+        yield row
+
+
+def create_database(path: Path, size: int, seed: int = SEED, history_share: float = 0.05):
+    """SQLite БД с size звонками периода; SessionLocal переключается на нее
+
+    Returns:
+        Engine: Движок БД (engine.dispose() после бенчмарка)
+    """
+    from rollup import rebuild_rollup
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    table = Call.__table__
+
+    with engine.begin() as conn:
+        rows = []
+        for row in generate_calls(size, seed, history_share=history_share):
+            rows.append(row)
+            if len(rows) == INSERT_CHUNK:
+                conn.execute(table.insert(), rows)
+                rows = []
+        if rows:
+            conn.execute(table.insert(), rows)
+
+    SessionLocal.configure(bind=engine)
+    # Звонки вставлены в обход ORM — сводку call_rollup строим явно
+    rebuild_rollup()
+    return engine
+
+
+def speechkit_response(rng: random.Random, duration: int = 300) -> dict:
+    """Ответ SpeechKit (поле response операции): чанк на ~5 секунд речи, 2 канала"""
+    chunks = []
+    for index in range(max(1, duration // 5)):
+        text = rng.choice(PHRASES)
+        chunks.append({
+            "channelTag": str(index % 2 + 1),
+            "alternatives": [
+                {"text": text, "confidence": round(rng.uniform(0.7, 1.0), 3)},
+                {"text": text.lower(), "confidence": round(rng.uniform(0.3, 0.7), 3)},
+            ],
+        })
+    return {"chunks": chunks}
+
+
+def gpt_response_text(rng: random.Random, fenced: bool = False) -> str:
+    """Текст ответа YandexGPT на анализ звонка (иногда в ```json ... ```)"""
+    text = json.dumps(ai_data(rng), ensure_ascii=False, indent=2)
+    return f"```json\n{text}\n```" if fenced else text
+
+
+def webhook_forms(count: int, seed: int = SEED, duplicate_share: float = 0.1,
+                  other_share: float = 0.15, prefix: str = "wh") -> Iterator[dict]:
+    """Форма вебхуков АТС (как шлет Мегафон), в порядке отправки
+
+    Кроме history со статусом Success: пропущенные звонки (без записи),
+    другие команды (event, contact) и повторы уже отправленных history.
+
+    Yields:
+        dict: Поля формы
+    """
+    rng = random.Random(seed)
+    names = operator_names()
+    sent = []
+    for index in range(count):
+        roll = rng.random()
+        if roll < other_share:
+            yield {"cmd": rng.choice(["event", "contact"]), "type": "INCOMING",
+                   "phone": f"+7900{rng.randrange(10 ** 7):07d}", "callid": f"{prefix}_event_{index}",
+                   "crm_token": "token"}
+        elif roll < other_share + duplicate_share and sent:
+            yield rng.choice(sent)
+        else:
+            missed = rng.random() < 0.2
+            form = {
+                "cmd": "history",
+                "type": rng.choice(["in", "out"]),
+                "status": "Missed" if missed else "Success",
+                "user": rng.choice(names),
+                "phone": f"+7900{rng.randrange(10 ** 7):07d}",
+                "callid": f"{prefix}_{index}",
+                "duration": str(0 if missed else _duration(rng)),
+                "start": (PERIOD_START + timedelta(seconds=index)).strftime("%Y%m%dT%H%M%SZ"),
+                "crm_token": "token",
+            }
+            if not missed:
+                form["link"] = f"https://pbx.example/records/{prefix}_{index}.mp3"
+                sent.append(form)
+            yield form
+
+
+def persisted_forms(forms: List[dict]) -> int:
+    """Сколько звонков из форм должен сохранить receiver.py (history Success с записью, без повторов)"""
+    return len({form["callid"] for form in forms
+                if form["cmd"] == "history" and form.get("status") == "Success" and form.get("link")})
@@ -1,96 +1,432 @@
+import math
+import random
 from datetime import datetime
-from typing import List
-from sqlalchemy import and_
+from typing import Dict, Iterator, List
+from sqlalchemy import and_, case, func, select
 
-from database import SessionLocal, Call
+from database import SessionLocal, Call, CallStatus
+from rollup import operator_status_seconds
 from config import Config
-from logger import logger
+from logger import get_logger
 
+logger = get_logger("call_selector")
 
-def select_balanced_calls(
+# Сколько выбранных звонков загружать из БД за один запрос
+LOAD_CHUNK_SIZE = 500
+# Сколько следующих звонков оператора рассматривать при доборе остатка квоты
+FILL_CANDIDATES = 50
+# Стратегии отбора звонков оператора (см. select_balanced_call_ids)
+SELECTION_STRATEGIES = ("oldest", "stratified")
+# Интервалы часов [начало, конец) для стратификации по времени суток
+HOUR_BANDS = ((0, 11), (11, 14), (14, 17), (17, 24))
+# Порция строк при потоковом чтении звонков
+STREAM_CHUNK_SIZE = 1000
+
+
+def allocate_quotas(capacity: Dict[str, float], target: float,
+                    used: Dict[str, float] = None) -> Dict[str, float]:
+    """Распределяет цель между операторами "наливом воды" (water-filling)
+
+    Каждый оператор получает min(capacity, level) (но не меньше used),
+    где level подобран так, чтобы сумма квот равнялась цели. Операторы,
+    у которых звонков меньше равной доли, получают все свои звонки,
+    а неиспользованная часть делится между остальными. Если звонков в сумме меньше цели, каждый
+    получает всю свою емкость.
+
+    Уже обработанное (used) забрать нельзя: оператор, у которого его
+    больше уровня, получает квоту ровно used (новых звонков ему не
+    выбирается), а остаток цели делится между остальными. Поэтому сумма
+    квот не больше цели (или суммы used, если обработано уже больше цели).
+
+    Args:
+        capacity: Доступные секунды по операторам (обработанные + необработанные)
+        target: Цель в секундах
+        used: Уже обработанные секунды по операторам (входят в capacity)
+
+    Returns:
+        dict: Квота в секундах по операторам
+    """
+    used = {operator: min((used or {}).get(operator, 0), capacity[operator]) for operator in capacity}
+
+    def fill(level: float) -> Dict[str, float]:
+        return {operator: max(used[operator], min(capacity[operator], level)) for operator in capacity}
+
+    if sum(used.values()) >= target:
+        return dict(used)
+    if sum(capacity.values()) <= target:
+        return dict(capacity)
+
+    # Сумма квот кусочно-линейна по level: ищем отрезок между соседними
+    # границами (used и capacity), на котором она достигает цели
+    points = sorted(set(used.values()) | set(capacity.values()))
+    level = points[-1]
+    for low, high in zip(points, points[1:]):
+        total = sum(fill(low).values())
+        slope = sum(1 for operator in capacity if used[operator] <= low and capacity[operator] >= high)
+        if slope and total + slope * (high - low) >= target:
+            level = low + (target - total) / slope
+            break
+
+    quotas = fill(level)
+    assert sum(quotas.values()) <= target + 1e-6, "квоты превышают цель"
+    return quotas
+
+
+def fill_residual(candidates: List[tuple], residual: int) -> List[tuple]:
+    """Добирает остаток квоты подмножеством звонков без превышения
+
+    Ограниченный рюкзак (subset sum) по секундам: из candidates — следующих
+    по очереди звонков оператора (id, duration) — выбирается набор
+    с наибольшей суммой длительностей, не превышающей residual.
+    При равенстве предпочтение более ранним звонкам очереди.
+
+    Returns:
+        List[tuple]: Выбранные кандидаты в исходном порядке
+    """
+    if residual <= 0 or not candidates:
+        return []
+
+    # reachable[сумма] = индексы кандидатов, дающие эту сумму
+    reachable = {0: ()}
+    for index, (_, duration) in enumerate(candidates):
+        if not duration or duration > residual:
+            continue
+        for total, items in list(reachable.items()):
+            new_total = total + duration
+            if new_total <= residual and new_total not in reachable:
+                reachable[new_total] = items + (index,)
+
+    best = reachable[max(reachable)]
+    return [candidates[index] for index in best]
+
+
+def _select_oldest(session, in_period, available: Dict[str, float]) -> Dict[str, List[tuple]]:
+    """Стратегия "oldest": звонки оператора по порядку, начатые первыми
+
+    1. Накопленная длительность звонков по оператору считается оконной
+       функцией SUM(duration) OVER (PARTITION BY operator ORDER BY ...):
+       сначала начатые и ждущие повтора звонки (их промежуточные
+       результаты уже в БД), затем новые; внутри — по дате
+    2. Берутся звонки, пока оператор укладывается в квоту
+       (накопленные с этим звонком <= доступной квоты)
+    3. Остаток квоты добирается из следующих FILL_CANDIDATES звонков
+       оператора, которые в него помещаются (fill_residual)
+
+    Returns:
+        dict: Выбранные (id, duration) по операторам в порядке обработки
+    """
+    running_seconds = func.sum(Call.duration).over(
+        partition_by=Call.operator,
+        order_by=(
+            case((Call.status == CallStatus.NEW, 1), else_=0),
+            Call.date,
+            Call.id
+        ),
+        rows=(None, 0)
+    )
+    pending = session.query(
+        Call.id.label("id"),
+        Call.operator.label("operator"),
+        Call.duration.label("duration"),
+        running_seconds.label("running_seconds")
+    ).filter(in_period, Call.status.in_(CallStatus.PENDING)).subquery()
+
+    # Звонки без оператора (NULL) — под ключом "" (как в сводке, см. database._rollup_key):
+    # сравнение с NULL в CASE никогда не срабатывает
+    operator_key = func.coalesce(pending.c.operator, "")
+
+    # Доступная квота оператора строки
+    operator_available = case(
+        {operator or "": seconds for operator, seconds in available.items()}, value=operator_key, else_=0
+    )
+
+    # Звонки, которые целиком помещаются в квоту
+    rows = session.query(
+        pending.c.id, pending.c.operator, pending.c.duration
+    ).filter(
+        pending.c.running_seconds <= operator_available
+    ).order_by(pending.c.operator, pending.c.running_seconds).all()
+
+    by_operator = {}
+    for call_id, operator, duration in rows:
+        by_operator.setdefault(operator, []).append((call_id, duration or 0))
+
+    # Остаток квоты — рюкзаком по следующим звонкам очереди
+    residual = {}
+    for operator, seconds in available.items():
+        left = int(seconds - sum(duration for _, duration in by_operator.get(operator, [])))
+        if left > 0:
+            residual[operator] = left
+
+    if not residual:
+        return by_operator
+
+    queue_position = func.row_number().over(
+        partition_by=pending.c.operator, order_by=pending.c.running_seconds
+    )
+    candidates = session.query(
+        pending.c.id.label("id"),
+        pending.c.operator.label("operator"),
+        pending.c.duration.label("duration"),
+        queue_position.label("position")
+    ).filter(
+        pending.c.running_seconds > operator_available,
+        pending.c.duration <= case(
+            {operator or "": seconds for operator, seconds in residual.items()}, value=operator_key, else_=0
+        )
+    ).subquery()
+
+    candidate_rows = session.query(
+        candidates.c.id, candidates.c.operator, candidates.c.duration
+    ).filter(
+        candidates.c.position <= FILL_CANDIDATES
+    ).order_by(candidates.c.operator, candidates.c.position).all()
+
+    operator_candidates = {}
+    for call_id, operator, duration in candidate_rows:
+        operator_candidates.setdefault(operator, []).append((call_id, duration))
+
+    for operator, items in operator_candidates.items():
+        by_operator.setdefault(operator, []).extend(fill_residual(items, residual[operator]))
+
+    return by_operator
+
+
+def _hour_band(hour: int) -> int:
+    """Номер интервала часов (HOUR_BANDS), в который попадает hour"""
+    for index, (start, end) in enumerate(HOUR_BANDS):
+        if start <= hour < end:
+            return index
+    return len(HOUR_BANDS) - 1
+
+
+def _stream_new_calls(session, in_period):
+    """Потоково читает новые звонки периода (серверный курсор, порциями)
+
+    Порядок по id нужен для воспроизводимости выборки с одним seed.
+    """
+    query = select(Call.id, Call.operator, Call.date, Call.duration).where(
+        in_period, Call.status == CallStatus.NEW
+    ).order_by(Call.id).execution_options(stream_results=True, yield_per=STREAM_CHUNK_SIZE)
+
+    for call_id, operator, date, duration in session.execute(query):
+        yield call_id, operator, (date.date(), _hour_band(date.hour)), duration or 0
+
+
+def _select_stratified(session, in_period, available: Dict[str, float],
+                       seed: int) -> Dict[str, List[tuple]]:
+    """Стратегия "stratified": случайная выборка, равномерная по дням и часам
+
+    Старт: начатые и ждущие повтора звонки берутся первыми (как в "oldest"), их длительность
+    вычитается из квоты оператора. Новые звонки делятся на страты
+    оператор × день × интервал часов, и за два потоковых прохода
+    (в памяти только сводка по стратам и сами резервуары):
+    1. Считаются секунды и число звонков каждой страты; квота оператора
+       делится между его стратами пропорционально их секундам
+    2. В каждой страте резервуарной выборкой (Algorithm R) набирается
+       примерно квота / средняя длительность звонков (+1 про запас)
+    Из перемешанного резервуара берутся звонки, пока страта укладывается
+    в свою квоту; остаток квоты оператора добирается из неиспользованных
+    звонков резервуаров (fill_residual).
+
+    Returns:
+        dict: Выбранные (id, duration) по операторам
+    """
+    # Начатые и ждущие повтора звонки — в первую очередь, их результаты уже частично в БД
+    by_operator = {}
+    available = dict(available)
+    started = session.query(Call.id, Call.operator, Call.duration).filter(
+        in_period,
+        Call.status.in_(CallStatus.PENDING),
+        Call.status != CallStatus.NEW
+    ).order_by(Call.operator, Call.date).all()
+    for call_id, operator, duration in started:
+        duration = duration or 0
+        if duration <= available.get(operator, 0):
+            by_operator.setdefault(operator, []).append((call_id, duration))
+            available[operator] -= duration
+
+    # Проход 1: размер страт
+    strata = {}
+    operator_seconds = {}
+    for _, operator, stratum, duration in _stream_new_calls(session, in_period):
+        seconds, count = strata.get((operator, stratum), (0, 0))
+        strata[(operator, stratum)] = (seconds + duration, count + 1)
+        operator_seconds[operator] = operator_seconds.get(operator, 0) + duration
+
+    stratum_quota = {}
+    reservoir_size = {}
+    for key, (seconds, count) in strata.items():
+        operator = key[0]
+        if available.get(operator, 0) <= 0 or not seconds:
+            continue
+        quota = available[operator] * seconds / operator_seconds[operator]
+        stratum_quota[key] = quota
+        reservoir_size[key] = min(count, math.ceil(quota / (seconds / count)) + 1)
+
+    # Проход 2: резервуарная выборка в каждой страте
+    reservoirs = {}
+    seen = {}
+    generators = {}
+    for call_id, operator, stratum, duration in _stream_new_calls(session, in_period):
+        key = (operator, stratum)
+        size = reservoir_size.get(key)
+        if not size:
+            continue
+
+        if key not in reservoirs:
+            reservoirs[key] = []
+            seen[key] = 0
+            generators[key] = random.Random(f"{seed}:{operator}:{stratum[0]}:{stratum[1]}")
+
+        seen[key] += 1
+        if len(reservoirs[key]) < size:
+            reservoirs[key].append((call_id, duration))
+        else:
+            slot = generators[key].randrange(seen[key])
+            if slot < size:
+                reservoirs[key][slot] = (call_id, duration)
+
+    # Звонки резервуара, пока страта укладывается в квоту
+    leftovers = {}
+    sampled_seconds = {}
+    for key in sorted(reservoirs):
+        operator = key[0]
+        items = reservoirs[key]
+        generators[key].shuffle(items)
+
+        taken = 0
+        for call_id, duration in items:
+            if taken + duration <= stratum_quota[key]:
+                by_operator.setdefault(operator, []).append((call_id, duration))
+                taken += duration
+            else:
+                leftovers.setdefault(operator, []).append((call_id, duration))
+        sampled_seconds[operator] = sampled_seconds.get(operator, 0) + taken
+
+    # Остаток квоты оператора — из неиспользованных звонков резервуаров
+    for operator, items in leftovers.items():
+        residual = int(available[operator] - sampled_seconds.get(operator, 0))
+        by_operator.setdefault(operator, []).extend(fill_residual(items[:FILL_CANDIDATES], residual))
+
+    return by_operator
+
+
+def select_balanced_call_ids(
     start_date: datetime,
     end_date: datetime,
-    target_minutes: int = None
-) -> List[Call]:
+    target_minutes: int = None,
+    strategy: str = None,
+    seed: int = None,
+    tenant: str = None
+) -> List[str]:
     """Выбирает звонки с равномерным распределением между операторами
     
-    Алгоритм:
-    1. Получить все звонки за период со статусом NEW
-    2. Сгруппировать по операторам
-    3. Рассчитать целевые минуты на оператора
-    4. Для каждого оператора набрать звонки пока не достигнем цели
-    
+    Алгоритм (отбор в БД, в Python приходят только выбранные id):
+    1. Посчитать по операторам уже обработанные за период секунды
+       и секунды необработанных звонков (NEW, начатые, но не
+       завершенные после сбоя, и FAILED, ждущие повтора — см.
+       CallStatus.PENDING) —
+       по сводке call_rollup, без просмотра звонков
+    2. Распределить цель между операторами (allocate_quotas): квота,
+       которую оператор не может выбрать, достается остальным
+    3. Набрать звонки каждого оператора в пределах квоты выбранной
+       стратегией:
+       - "oldest" — по порядку, самые ранние звонки (_select_oldest);
+       - "stratified" — воспроизводимая случайная выборка, равномерная
+         по дням и часам (_select_stratified)
+       Квота не превышается, остаток добирается подходящими звонками
+
     Args:
         start_date: Начало периода
         end_date: Конец периода
         target_minutes: Целевое количество минут (по умолчанию из конфига)
+        strategy: Стратегия отбора (по умолчанию Config.SELECTION_STRATEGY)
+        seed: Seed случайной выборки для "stratified" (по умолчанию Config.SELECTION_SEED)
+        tenant: Только звонки клиента (None — всех, см. tenants.py)
         
     Returns:
-        List[Call]: Список выбранных звонков
+        List[str]: ID выбранных звонков, по операторам в порядке обработки
     """
     if target_minutes is None:
         target_minutes = Config.ANALYSIS_MINUTES_TARGET
+    if strategy is None:
+        strategy = Config.SELECTION_STRATEGY
+    if strategy not in SELECTION_STRATEGIES:
+        raise ValueError(
+            f"Неизвестная стратегия выбора звонков: {strategy} "
+            f"(доступны: {', '.join(SELECTION_STRATEGIES)})"
+        )
     
     session = SessionLocal()
     
     try:
-        # Получаем все звонки за период со статусом NEW
-        all_calls = session.query(Call).filter(
-            and_(
-                Call.date >= start_date,
-                Call.date <= end_date,
-                Call.status == "NEW"
-            )
-        ).order_by(Call.date).all()
-        
-        if not all_calls:
+        in_period = and_(Call.date >= start_date, Call.date <= end_date)
+        if tenant is not None:
+            in_period = and_(in_period, Call.tenant == tenant)
+
+        # Сводка по операторам (по call_rollup): необработанные и уже обработанные секунды
+        operator_seconds = operator_status_seconds(start_date, end_date, tenant)
+        pending_seconds = {operator: pending for operator, (pending, _) in operator_seconds.items()}
+        processed_seconds = {operator: processed for operator, (_, processed) in operator_seconds.items()}
+
+        if not any(pending_seconds.values()):
             logger.warning(f"⚠️ Нет звонков за период {start_date.date()} - {end_date.date()}")
             return []
-        
-        # Группируем по операторам
-        operators_calls = {}
-        for call in all_calls:
-            if call.operator not in operators_calls:
-                operators_calls[call.operator] = []
-            operators_calls[call.operator].append(call)
-        
-        logger.info(f"📊 Найдено операторов: {len(operators_calls)}")
+
+        logger.info(f"📊 Найдено операторов: {len(operator_seconds)}")
         logger.info(f"🎯 Цель: {target_minutes} минут ({target_minutes // 60}ч {target_minutes % 60}м)")
         
-        # Рассчитываем целевые минуты на оператора
-        operators_count = len(operators_calls)
-        target_per_operator = target_minutes / operators_count
+        # Квоты операторов: недобор одних перераспределяется на других
+        quotas = allocate_quotas(
+            {operator: pending_seconds[operator] + processed_seconds[operator] for operator in pending_seconds},
+            target_minutes * 60,
+            used=processed_seconds
+        )
+        level = max(quotas.values()) / 60
+        saturated = [
+            operator for operator, quota in quotas.items()
+            if quota >= pending_seconds[operator] + processed_seconds[operator]
+        ]
         
-        logger.info(f"📈 Целевые минуты на оператора: ~{target_per_operator:.0f} мин")
+        logger.info(f"📈 Целевые минуты на оператора: до ~{level:.0f} мин")
+        if saturated and len(saturated) < len(quotas):
+            logger.info(
+                f"💧 У {len(saturated)} операторов звонков меньше доли — "
+                f"их остаток перераспределен на остальных"
+            )
         
-        # Выбираем звонки для каждого оператора
-        selected_calls = []
-        total_minutes = 0
+        # Квота за вычетом уже обработанного (allocate_quotas не дает квоту меньше него)
+        available = {operator: max(0, quotas[operator] - processed_seconds[operator]) for operator in quotas}
         
-        for operator, calls in operators_calls.items():
-            operator_minutes = 0
-            operator_selected = []
-            
-            # Сортируем по дате
-            calls_sorted = sorted(calls, key=lambda c: c.date)
-            
-            # Набираем звонки пока не достигнем цели
-            for call in calls_sorted:
-                if operator_minutes >= target_per_operator:
-                    break
-                
-                operator_selected.append(call)
-                operator_minutes += call.duration / 60  # переводим секунды в минуты
-            
-            selected_calls.extend(operator_selected)
+        if strategy == "stratified":
+            if seed is None:
+                seed = Config.SELECTION_SEED
+            logger.info(f"🎲 Стратегия: случайная выборка по дням и часам (seed {seed})")
+            by_operator = _select_stratified(session, in_period, available, seed=seed)
+        else:
+            by_operator = _select_oldest(session, in_period, available)
+
+        selected_ids = []
+        total_minutes = 0
+        for operator in quotas:
+            operator_calls = by_operator.get(operator, [])
+            selected_ids.extend(call_id for call_id, _ in operator_calls)
+            operator_minutes = (
+                processed_seconds[operator] + sum(duration for _, duration in operator_calls)
+            ) / 60
             total_minutes += operator_minutes
             
             logger.info(
-                f"  ✅ {operator}: {len(operator_selected)} звонков, "
+                f"  ✅ {operator}: {len(operator_calls)} звонков, "
                 f"{operator_minutes:.1f} минут"
             )
         
-        logger.info(f"🎉 ИТОГО: {len(selected_calls)} звонков, {total_minutes:.1f} минут")
+        already_processed = sum(processed_seconds.values()) / 60
+        if already_processed:
+            logger.info(f"♻️ Уже обработано за период: {already_processed:.1f} минут")
+
+        logger.info(f"🎉 ИТОГО: {len(selected_ids)} звонков, {total_minutes:.1f} минут")
         
         # Если набрали меньше цели - предупреждаем
         if total_minutes < target_minutes * 0.9:  # допуск 10%
@@ -99,22 +435,85 @@ def select_balanced_calls(
                 f"Возможно, недостаточно звонков за период."
             )
         
-        return selected_calls
+        return selected_ids
         
     finally:
         session.close()
 
 
-def get_period_dates(period_type: str = "auto") -> tuple[datetime, datetime]:
-    """Определяет даты периода для анализа
-    
-    Args:
-        period_type: "first_half" (1-15), "second_half" (16-конец), или "auto" (определить по текущей дате)
-        
+def iter_calls_by_ids(call_ids: List[str], chunk_size: int = LOAD_CHUNK_SIZE) -> Iterator[Call]:
+    """Загружает звонки по id порциями, сохраняя порядок списка
+
+    В памяти одновременно не больше chunk_size объектов (если вызывающий
+    код их не накапливает).
+    """
+    for offset in range(0, len(call_ids), chunk_size):
+        chunk = call_ids[offset:offset + chunk_size]
+        session = SessionLocal()
+        try:
+            calls = {call.id: call for call in session.query(Call).filter(Call.id.in_(chunk))}
+        finally:
+            session.close()
+
+        for call_id in chunk:
+            if call_id in calls:
+                yield calls[call_id]
+
+
+def select_balanced_calls(
+    start_date: datetime,
+    end_date: datetime,
+    target_minutes: int = None,
+    strategy: str = None,
+    seed: int = None,
+    tenant: str = None
+) -> List[Call]:
+    """Выбирает звонки (см. select_balanced_call_ids) и загружает их из БД
+
     Returns:
-        tuple: (start_date, end_date)
+        List[Call]: Список выбранных звонков
+    """
+    return list(iter_calls_by_ids(
+        select_balanced_call_ids(start_date, end_date, target_minutes, strategy=strategy, seed=seed,
+                                 tenant=tenant)
+    ))
+
+
+def select_incremental_call_ids(start_date: datetime, end_date: datetime,
+                                now: datetime = None, target_minutes: int = None,
+                                tenant: str = None) -> List[str]:
+    """Инкрементальный выбор звонков для непрерывной обработки (daemon.py)
+
+    Цель периода набирается постепенно: к моменту now — доля цели,
+    равная прошедшей доле периода (к концу периода — вся цель). Выбор
+    тот же, что у select_balanced_call_ids по уже поступившим звонкам:
+    обработанные минуты учитываются, недобор одних операторов
+    перераспределяется на других. Повторный вызов возвращает и уже
+    выбранные, но еще не обработанные звонки.
+
+    Returns:
+        List[str]: ID выбранных звонков, по операторам в порядке обработки
+    """
+    now = now or datetime.now()
+    if target_minutes is None:
+        target_minutes = Config.ANALYSIS_MINUTES_TARGET
+
+    elapsed = (min(now, end_date) - start_date) / (end_date - start_date)
+    paced_minutes = math.ceil(target_minutes * max(0.0, elapsed))
+    if paced_minutes <= 0:
+        return []
+
+    return select_balanced_call_ids(start_date, min(now, end_date), paced_minutes, tenant=tenant)
+
+
+def period_bounds(period_type: str = "auto", now: datetime = None) -> tuple[datetime, datetime]:
+    """Даты периода без записи в лог (см. get_period_dates)
+
+    Args:
+        period_type: "first_half", "second_half" или "auto"
+        now: Дата, от которой считается период (по умолчанию сейчас)
     """
-    now = datetime.now()
+    now = now or datetime.now()
     year = now.year
     month = now.month
     
@@ -143,5 +542,18 @@ def get_period_dates(period_type: str = "auto") -> tuple[datetime, datetime]:
         last_day = (next_month - timedelta(days=1)).day
         end_date = datetime(year, month, last_day, 23, 59, 59)
     
+    return start_date, end_date
+
+
+def get_period_dates(period_type: str = "auto") -> tuple[datetime, datetime]:
+    """Определяет даты периода для анализа
+    
+    Args:
+        period_type: "first_half" (1-15), "second_half" (16-конец), или "auto" (определить по текущей дате)
+        
+    Returns:
+        tuple: (start_date, end_date)
+    """
+    start_date, end_date = period_bounds(period_type)
     logger.info(f"📅 Период: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}")
     return start_date, end_date
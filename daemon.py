@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Непрерывная обработка звонков (демон)
+
+Вместо обработки всех звонков периода за один запуск 15-го числа и в
+конце месяца звонки обрабатываются в течение всего периода по мере
+поступления (вебхук receiver.py, синхронизация с АТС):
+
+1. Раз в DAEMON_SELECT_MINUTES инкрементальный выбор
+   (call_selector.select_incremental_call_ids) ставит звонки текущего
+   периода в очередь work_queue: цель периода набирается постепенно,
+   пропорционально прошедшей доле периода, с тем же равномерным
+   распределением между операторами.
+2. Звонки из очереди обрабатываются сразу, в пределах дневной квоты
+   DAEMON_DAILY_MINUTES минут аудио (scheduler.DailyQuotaGuard), с
+   повторами после ошибок (retry_scheduler). При смене периода
+   незавершенные звонки прошлого пакета переносятся в новый.
+3. Раз в DAEMON_SYNC_HOURS новые звонки забираются из АТС (на случай
+   пропущенных вебхуков).
+
+Отчет по расписанию тогда только собирает уже обработанные звонки:
+    python reporter.py --report-only
+
+Запуск (под systemd или supervisor, см. README):
+    python daemon.py
+    python daemon.py --mock
+    python daemon.py --once          # один цикл (проверка настроек)
+
+Клиенты (tenants.py): АТС синхронизируются параллельно, выбор — по
+цели каждого клиента в его пакет, а обработка идет по всем пакетам
+сразу — очередь выдает звонки клиентов по очереди, поэтому дневная
+квота и лимиты Yandex Cloud делятся между клиентами поровну.
+
+Демонов может быть несколько (на разных машинах с общей БД): очередь и
+квота общие. SIGTERM/Ctrl+C — остановка после текущего звонка.
+"""
+
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Iterable, List, Union
+
+from database import init_db
+from call_selector import iter_calls_by_ids, period_bounds, select_incremental_call_ids
+from processor import process_calls_batch
+from work_queue import (
+    batch_label, carry_over_calls, enqueue_calls, get_batch_progress, iter_claimed_calls, make_batch_id,
+    make_worker_id, reclaim_expired_leases
+)
+from retry_scheduler import requeue_due_calls
+from scheduler import DailyQuotaGuard, interleave_by_operator, processed_minutes_by_operator
+from metrics import metrics
+from logger import get_logger
+from tenants import Tenant, load_tenants
+from config import Config
+
+logger = get_logger("daemon")
+
+# Выставляется по SIGTERM/SIGINT: новые звонки не берутся, ожидание прерывается
+_stop = threading.Event()
+
+
+def enqueue_new_calls(start_date: datetime, end_date: datetime, now: datetime = None,
+                      tenant: Tenant = None) -> int:
+    """Ставит в очередь пакета периода звонки, выбранные к моменту now
+
+    Args:
+        tenant: Клиент (по умолчанию — "default" с настройками из .env)
+
+    Returns:
+        int: Количество звонков, добавленных в пакет
+    """
+    tenant = tenant or Tenant()
+    batch_id = make_batch_id(start_date, end_date, tenant.name)
+    call_ids = select_incremental_call_ids(start_date, end_date, now, tenant.minutes_target,
+                                           tenant=tenant.name)
+    if not call_ids:
+        return 0
+    return enqueue_calls(
+        interleave_by_operator(iter_calls_by_ids(call_ids), processed_minutes_by_operator(batch_id)),
+        batch_id
+    )
+
+
+def carry_over_previous_period(start_date: datetime, end_date: datetime, tenants: List[Tenant]) -> int:
+    """Переносит незавершенные звонки пакетов прошлого периода в пакеты текущего
+
+    Иначе звонки, выбранные, но не обработанные до конца периода (и взятые
+    в работу в момент смены), остались бы в старом пакете, который демон
+    больше не разбирает.
+
+    Returns:
+        int: Количество перенесенных звонков
+    """
+    previous_start, previous_end = period_bounds("auto", start_date - timedelta(days=1))
+    return sum(
+        carry_over_calls(make_batch_id(previous_start, previous_end, tenant.name),
+                         make_batch_id(start_date, end_date, tenant.name))
+        for tenant in tenants
+    )
+
+
+def sync_recent_calls(tenant: Tenant = None):
+    """Забирает звонки последних суток из АТС клиента (дубли пропускаются)"""
+    from megafon import sync_calls_from_megafon
+    tenant = tenant or Tenant()
+    try:
+        sync_calls_from_megafon(days_back=max(1, Config.DAEMON_SYNC_HOURS // 24 + 1), tenant=tenant)
+    except Exception as e:
+        logger.error(f"❌ Ошибка синхронизации с АТС {tenant.name}: {e}")
+
+
+def sync_tenants(tenants: List[Tenant]):
+    """Синхронизирует АТС клиентов параллельно (запросы к разным АТС не ждут друг друга)"""
+    with ThreadPoolExecutor(max_workers=len(tenants)) as pool:
+        list(pool.map(sync_recent_calls, tenants))
+
+
+def process_available(batch_id: Union[str, Iterable[str]], worker_id: str, quota: DailyQuotaGuard,
+                      use_mock: bool = False) -> int:
+    """Обрабатывает свободные звонки пакета (или пакетов клиентов) в пределах дневной квоты
+
+    Returns:
+        int: Количество обработанных (взятых в работу) звонков
+    """
+    reclaim_expired_leases(batch_id)
+    requeue_due_calls(batch_id)
+
+    progress = get_batch_progress(batch_id)
+    if progress["pending"] <= progress["leased"]:
+        return 0
+
+    stats = process_calls_batch(
+        iter_claimed_calls(batch_id, worker_id,
+                           accept=lambda call: not _stop.is_set() and quota.accept(call)),
+        use_mock=use_mock
+    )
+    return stats["total"]
+
+
+def _due(last_run, interval: timedelta, now: datetime) -> bool:
+    return interval > timedelta(0) and (last_run is None or now - last_run >= interval)
+
+
+def run_daemon(use_mock: bool = False, once: bool = False, poll_seconds: int = None):
+    """Цикл демона: выбор, обработка, ожидание новых звонков
+
+    Args:
+        use_mock: Mock данные вместо АТС и Yandex Cloud
+        once: Выполнить один цикл и выйти
+        poll_seconds: Пауза, когда работы нет (по умолчанию DAEMON_POLL_SECONDS)
+    """
+    poll_seconds = poll_seconds or Config.DAEMON_POLL_SECONDS
+    select_interval = timedelta(minutes=Config.DAEMON_SELECT_MINUTES)
+    # В mock режиме АТС не вызывается
+    sync_interval = timedelta(hours=0 if use_mock else Config.DAEMON_SYNC_HOURS)
+
+    tenants = load_tenants()
+    worker_id = make_worker_id()
+    quota = DailyQuotaGuard()
+    quota_text = f"{Config.DAEMON_DAILY_MINUTES} мин/сутки" if Config.DAEMON_DAILY_MINUTES else "без ограничения"
+    logger.info(
+        f"🛰️ Демон {worker_id} запущен (клиентов: {len(tenants)}, квота: {quota_text}, "
+        f"опрос раз в {poll_seconds} сек)"
+    )
+
+    last_selection = last_sync = None
+    day = datetime.now().date()
+    period_start = None
+
+    while not _stop.is_set():
+        now = datetime.now()
+
+        # Снимок метрик за сутки — история для planner.py и /metrics
+        if now.date() != day:
+            logger.info(f"📈 Метрики за {day.strftime('%d.%m.%Y')} сохранены: {metrics.write_summary()}")
+            metrics.reset()
+            day = now.date()
+
+        if _due(last_sync, sync_interval, now):
+            sync_tenants(tenants)
+            last_sync = now
+
+        start_date, end_date = period_bounds("auto", now)
+        batch_id = [make_batch_id(start_date, end_date, tenant.name) for tenant in tenants]
+
+        # Новый период (и первый цикл после запуска) — незавершенная работа прошлого не теряется
+        if start_date != period_start:
+            carry_over_previous_period(start_date, end_date, tenants)
+            period_start = start_date
+
+        # Выбор по клиентам по очереди: одна БД, запросы параллельно не ускорятся
+        if _due(last_selection, select_interval, now):
+            for tenant in tenants:
+                enqueue_new_calls(start_date, end_date, now, tenant)
+            last_selection = now
+
+        processed = process_available(batch_id, worker_id, quota, use_mock=use_mock)
+
+        if once:
+            break
+        # Работа была и квота не исчерпана — сразу следующий цикл
+        if processed and not quota.stopped:
+            continue
+        _stop.wait(poll_seconds)
+
+    progress = get_batch_progress(batch_id)
+    logger.info(
+        f"🏁 Пакет {batch_label(batch_id)}: обработано {progress['processed']}, "
+        f"ожидают {progress['pending']}, ждут повтора {progress['failed']}"
+    )
+    logger.info(f"📈 Метрики сохранены: {metrics.write_summary()}")
+
+
+def _request_stop(signum, frame):
+    logger.info("🛑 Остановка: дообрабатываем текущий звонок")
+    _stop.set()
+
+
+def _get_arg_value(name: str, default: str) -> str:
+    """Возвращает значение аргумента вида --name VALUE"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+
+if __name__ == "__main__":
+    use_mock = "--mock" in sys.argv or "-m" in sys.argv
+    once = "--once" in sys.argv
+    poll_seconds = int(_get_arg_value("--poll", str(Config.DAEMON_POLL_SECONDS)))
+
+    try:
+        Config.validate()
+        load_tenants()
+    except ValueError as e:
+        logger.error(f"❌ {e}")
+        sys.exit(1)
+
+    init_db()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    run_daemon(use_mock=use_mock, once=once, poll_seconds=poll_seconds)
+    sys.exit(0)
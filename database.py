@@ -1,24 +1,287 @@
-from sqlalchemy import Column, String, Integer, DateTime, JSON, create_engine
+from sqlalchemy import (
+    Column, Date, Index, String, Integer, DateTime, JSON, Text,
+    create_engine, event, inspect, insert, select, text, update
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from config import Config
+from tenants import DEFAULT_TENANT
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    """Настройки SQLite для одновременной работы вебхука и воркеров
+
+    - WAL: чтения не блокируют запись и наоборот;
+    - busy_timeout: при занятой БД ждать, а не падать с "database is locked";
+    - synchronous=NORMAL: в режиме WAL безопасно и заметно быстрее FULL;
+    - mmap_size: чтение файла БД через отображение в память.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={Config.SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+
+def create_db_engine(url: str = None) -> Engine:
+    """Создает движок БД по DATABASE_URL
+
+    SQLite (по умолчанию calls.db) — с прагмами _configure_sqlite.
+    Серверная БД (например postgresql://...) — с пулом соединений:
+    у каждого процесса (воркер, вебхук) свой пул размером
+    DB_POOL_SIZE + DB_MAX_OVERFLOW, поэтому всего к БД может быть до
+    (WORKERS + 1) * (DB_POOL_SIZE + DB_MAX_OVERFLOW) соединений.
+    """
+    url = url or Config.DATABASE_URL
+
+    if url.startswith("sqlite"):
+        db_engine = create_engine(
+            url,
+            connect_args={"timeout": Config.SQLITE_BUSY_TIMEOUT_MS / 1000, "check_same_thread": False}
+        )
+        if ":memory:" not in url and url != "sqlite://":
+            event.listen(db_engine, "connect", _configure_sqlite)
+        return db_engine
+
+    return create_engine(
+        url,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_timeout=Config.DB_POOL_TIMEOUT,
+        pool_pre_ping=True,  # соединения, закрытые сервером между запусками
+        pool_recycle=1800
+    )
+
+
 # Создаем движок БД
-engine = create_engine("sqlite:///./calls.db")
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+class CallStatus:
+    """Статусы звонка по этапам пайплайна обработки"""
+
+    NEW = "NEW"                  # Звонок получен из АТС
+    DOWNLOADED = "DOWNLOADED"    # Аудио скачано во временную папку
+    TRANSCRIBED = "TRANSCRIBED"  # Транскрипт сохранен в БД
+    SCORED = "SCORED"            # Оценка GPT сохранена, осталась очистка
+    PROCESSED = "PROCESSED"      # Обработка завершена
+    FAILED = "FAILED"            # Временная ошибка, ждет повтора (next_retry_at)
+    DEAD = "DEAD"                # Dead-letter: постоянная ошибка или исчерпаны попытки
+
+    # Незавершенные этапы: звонок можно продолжить с места остановки
+    IN_PROGRESS = (NEW, DOWNLOADED, TRANSCRIBED, SCORED)
+    # Ждут обработки: незавершенные и ожидающие повтора (FAILED еще станет PROCESSED или DEAD)
+    PENDING = IN_PROGRESS + (FAILED,)
+
+
 class Call(Base):
     __tablename__ = "calls"
 
     id = Column(String, primary_key=True, index=True)
+    tenant = Column(String, index=True, default=DEFAULT_TENANT)  # Клиент (АТС), см. tenants.py
     date = Column(DateTime, index=True)  # Индекс для быстрого поиска
     operator = Column(String, index=True)  # Индекс для группировки
     phone = Column(String)
     duration = Column(Integer)
-    status = Column(String, index=True)  # NEW/PROCESSED/FAILED
+    status = Column(String, index=True)  # См. CallStatus
     audio_url = Column(String)  # Ссылка на аудио в АТС
     ai_data = Column(JSON)  # Результаты анализа от GPT
 
+    # Промежуточные результаты (чекпоинты) для продолжения после сбоя
+    audio_path = Column(String)  # Скачанный аудио файл
+    transcript = Column(Text)  # Транскрипт от SpeechKit
+    speech_data = Column(JSON)  # Тон и статистика от SpeechKit
+    stage_timings = Column(JSON)  # Длительность каждого этапа, сек
+    gpt_tokens = Column(Integer)  # Токены YandexGPT на оценку звонка
+
+    # Очередь работ: звонок выбран в пакет периода и захвачен воркером на время аренды
+    batch_id = Column(String, index=True)  # Ключ периода, для которого выбран звонок
+    lease_owner = Column(String)  # ID воркера, который обрабатывает звонок
+    lease_expires_at = Column(DateTime, index=True)  # Когда аренда истекает без heartbeat
+    heartbeat_at = Column(DateTime)  # Последний heartbeat воркера
+    priority = Column(Integer, index=True)  # Порядок обработки в пакете (scheduler.py)
+
+    # Повторы после ошибок
+    attempts = Column(Integer)  # Сколько раз обработка завершилась ошибкой
+    next_retry_at = Column(DateTime, index=True)  # Когда вернуть FAILED звонок в очередь
+    last_error = Column(Text)  # Последняя ошибка (для разбора dead-letter)
+    processed_at = Column(DateTime, index=True)  # Когда обработка завершена (дневная квота daemon.py)
+
+    __table_args__ = (
+        # Выбор звонков периода по статусу с накоплением минут по оператору (call_selector.py)
+        Index("ix_calls_status_operator_date", "status", "operator", "date"),
+    )
+
+
+class CallRollup(Base):
+    """Сводка звонков по (клиент, оператор, день, статус): количество и длительность
+
+    Поддерживается автоматически при каждом flush сессии SessionLocal
+    (новые звонки из вебхука и синхронизации с АТС, смена статуса при
+    обработке и повторах) в той же транзакции, что и изменение calls.
+    Позволяет считать минуты и количество звонков периода за
+    O(операторы × дни) вместо просмотра calls (см. rollup.py).
+    """
+    __tablename__ = "call_rollup"
+
+    tenant = Column(String, primary_key=True)
+    operator = Column(String, primary_key=True)  # "" если оператор не указан
+    day = Column(Date, primary_key=True)
+    status = Column(String, primary_key=True)
+    calls = Column(Integer, nullable=False, default=0)
+    duration = Column(Integer, nullable=False, default=0)  # Сумма длительностей, сек
+
+
+def _rollup_key(tenant, operator, date, status):
+    """Ключ строки сводки для значений звонка"""
+    return (tenant or DEFAULT_TENANT, operator or "", date.date(), status)
+
+
+def _collect_rollup_deltas(session) -> dict:
+    """Изменения сводки от звонков, добавленных или измененных в сессии"""
+    deltas = {}
+
+    def add(key, calls, duration):
+        if key[2] is None:
+            return
+        old_calls, old_duration = deltas.get(key, (0, 0))
+        deltas[key] = (old_calls + calls, old_duration + duration)
+
+    for obj in session.new:
+        if isinstance(obj, Call) and obj.date is not None:
+            add(_rollup_key(obj.tenant, obj.operator, obj.date, obj.status), 1, obj.duration or 0)
+
+    for obj in session.deleted:
+        if isinstance(obj, Call) and obj.date is not None:
+            add(_rollup_key(obj.tenant, obj.operator, obj.date, obj.status), -1, -(obj.duration or 0))
+
+    tracked = ("tenant", "operator", "date", "status", "duration")
+    for obj in session.dirty:
+        if not isinstance(obj, Call):
+            continue
+
+        state = inspect(obj)
+        histories = {name: state.attrs[name].history for name in tracked}
+        if not any(history.has_changes() for history in histories.values()):
+            continue
+
+        # Прежние значения из истории атрибутов; если они не были загружены — из БД
+        old = {}
+        for name, history in histories.items():
+            if history.deleted:
+                old[name] = history.deleted[0]
+            elif not history.has_changes():
+                old[name] = getattr(obj, name)
+        if len(old) < len(tracked):
+            row = session.connection().execute(
+                select(Call.tenant, Call.operator, Call.date, Call.status, Call.duration)
+                .where(Call.id == obj.id)
+            ).first()
+            if row is None:
+                continue
+            old = dict(row._mapping)
+
+        if old["date"] is not None:
+            add(_rollup_key(old["tenant"], old["operator"], old["date"], old["status"]),
+                -1, -(old["duration"] or 0))
+        if obj.date is not None:
+            add(_rollup_key(obj.tenant, obj.operator, obj.date, obj.status), 1, obj.duration or 0)
+
+    return {key: delta for key, delta in deltas.items() if delta != (0, 0)}
+
+
+def apply_rollup_deltas(connection, deltas: dict):
+    """Прибавляет изменения к строкам сводки (upsert)"""
+    table = CallRollup.__table__
+    dialect_insert = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}.get(connection.dialect.name)
+
+    for (tenant, operator, day, status), (calls, duration) in deltas.items():
+        values = {"tenant": tenant, "operator": operator, "day": day, "status": status,
+                  "calls": calls, "duration": duration}
+
+        if dialect_insert is not None:
+            statement = dialect_insert(table).values(**values)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.tenant, table.c.operator, table.c.day, table.c.status],
+                set_={
+                    "calls": table.c.calls + statement.excluded.calls,
+                    "duration": table.c.duration + statement.excluded.duration,
+                }
+            ))
+            continue
+
+        result = connection.execute(
+            update(table)
+            .where(table.c.tenant == tenant, table.c.operator == operator,
+                   table.c.day == day, table.c.status == status)
+            .values(calls=table.c.calls + calls, duration=table.c.duration + duration)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**values))
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _update_rollup(session, flush_context, instances):
+    """Обновляет сводку call_rollup в той же транзакции, что и изменения calls"""
+    deltas = _collect_rollup_deltas(session)
+    if deltas:
+        apply_rollup_deltas(session.connection(), deltas)
+
+
+def _add_missing_columns():
+    """Добавляет в существующие таблицы колонки, появившиеся в моделях
+
+    create_all не меняет уже созданные таблицы, поэтому старый calls.db
+    дополняется через ALTER TABLE (только добавление nullable-колонок)
+    вместе с индексами новых колонок.
+    """
+    inspector = inspect(engine)
+
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'
+                ))
+
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
 def init_db():
-    """Инициализирует базу данных и создает таблицы"""
+    """Инициализирует базу данных и создает таблицы
+
+    Если таблица сводки call_rollup только что создана для уже
+    заполненной БД, сводка строится по существующим звонкам. Сводка
+    без колонки tenant (до появления клиентов, tenants.py) создается
+    заново, а звонкам без клиента назначается "default".
+    """
+    inspector = inspect(engine)
+    rollup_existed = inspector.has_table(CallRollup.__tablename__)
+    if rollup_existed and "tenant" not in {col["name"] for col in inspector.get_columns(CallRollup.__tablename__)}:
+        # Ключ сводки изменился — таблица пересоздается и строится по calls
+        CallRollup.__table__.drop(engine)
+        rollup_existed = False
+
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+    with engine.begin() as conn:
+        conn.execute(update(Call.__table__).where(Call.tenant.is_(None)).values(tenant=DEFAULT_TENANT))
+
+    if not rollup_existed:
+        from rollup import rebuild_rollup
+        rebuild_rollup()
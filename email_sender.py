@@ -1,82 +1,339 @@
+"""
+Отправка отчетов на email
+
+Пакет писем (отчеты руководству, тимлидам, операторам) уходит через
+одно SMTP соединение с одной авторизацией (SMTPConnection), а письма
+собираются параллельно в потоках, пока предыдущие отправляются.
+
+Вложения:
+- файлы больше EMAIL_COMPRESS_MIN_BYTES сжимаются в zip, если это
+  заметно уменьшает их (xlsx уже сжат, html и json — в разы);
+- если вложения письма не помещаются в EMAIL_MAX_ATTACHMENTS_BYTES,
+  не поместившиеся файлы копируются в REPORT_PUBLISH_PATH и в письмо
+  идет ссылка REPORT_LINK_BASE_URL/<токен>/<файл>.
+
+Для проверки без почтового сервера: SMTP_USE_SSL=false и локальный
+SMTP (python -m aiosmtpd -n -l localhost:8025), см. benchmarks/bench_email.py.
+"""
+
+import io
+import mimetypes
+import secrets
+import shutil
 import smtplib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 from pathlib import Path
 from datetime import datetime
+from typing import List, Optional
+from urllib.parse import quote
 
 from config import Config
-from logger import logger
+from logger import get_logger
+
+logger = get_logger("email_sender")
+
+# Форматы, которые уже сжаты: zip их почти не уменьшает
+COMPRESSED_SUFFIXES = {".xlsx", ".zip", ".gz", ".parquet", ".png", ".jpg", ".pdf"}
+# Сжатый файл прикладывается, только если он меньше исходного хотя бы на 10%
+MIN_COMPRESSION_GAIN = 0.9
+
+
+@dataclass
+class Delivery:
+    """Одно письмо с отчетом"""
+    files: List[str]
+    recipients: List[str] = field(default_factory=list)  # пусто — EMAIL_TO
+    period_text: Optional[str] = None
+    name: str = ""  # Кому отчет (оператор, группа) — в теме и тексте письма
 
 
-def send_report(file_path: str, recipients: list[str] = None, period_text: str = None):
-    """Отправляет Excel отчет на email
-    
+def default_recipients() -> List[str]:
+    """Получатели по умолчанию из EMAIL_TO (через запятую)"""
+    return [email.strip() for email in (Config.EMAIL_TO or "").split(",") if email.strip()]
+
+
+class SMTPConnection:
+    """Одно авторизованное SMTP соединение на пакет писем
+
+    Использование:
+        with SMTPConnection() as smtp:
+            smtp.send(message)
+
+    Если сервер закрыл соединение (таймаут простоя), оно открывается
+    заново и письмо отправляется повторно один раз.
+    """
+
+    def __init__(self, host: str = None, port: int = None, use_ssl: bool = None,
+                 user: str = None, password: str = None, timeout: int = None):
+        self.host = host or Config.SMTP_HOST
+        self.port = port or Config.SMTP_PORT
+        self.use_ssl = Config.SMTP_USE_SSL if use_ssl is None else use_ssl
+        self.user = user if user is not None else Config.SMTP_USER
+        self.password = password if password is not None else Config.SMTP_PASSWORD
+        self.timeout = timeout or Config.SMTP_TIMEOUT
+        self.server = None
+        self.sent = 0
+
+    def connect(self):
+        if self.use_ssl:
+            self.server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            self.server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            self.server.ehlo()
+            if self.server.has_extn("starttls"):
+                self.server.starttls()
+                self.server.ehlo()
+        # Локальный тестовый сервер обычно без авторизации
+        if self.password:
+            self.server.login(self.user, self.password)
+
+    def send(self, message):
+        if self.server is None:
+            self.connect()
+        try:
+            self.server.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            logger.info("🔁 SMTP соединение закрыто сервером, переподключаемся")
+            self.connect()
+            self.server.send_message(message)
+        self.sent += 1
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+        self.server = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _compress(path: Path, data: bytes):
+    """Zip с одним файлом, если сжатие того стоит; иначе (имя, данные) как есть"""
+    if len(data) < Config.EMAIL_COMPRESS_MIN_BYTES or path.suffix.lower() in COMPRESSED_SUFFIXES:
+        return path.name, data
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(path.name, data)
+    compressed = buffer.getvalue()
+    if len(compressed) > len(data) * MIN_COMPRESSION_GAIN:
+        return path.name, data
+    return f"{path.name}.zip", compressed
+
+
+def publish_file(path: Path) -> Optional[str]:
+    """Копирует файл в REPORT_PUBLISH_PATH под случайным токеном; ссылка или None
+
+    Токен в пути не дает перебрать чужие отчеты по имени файла.
+    """
+    if not Config.REPORT_LINK_BASE_URL:
+        return None
+    token = secrets.token_urlsafe(16)
+    target = Config.REPORT_PUBLISH_PATH / token / path.name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(path, target)
+    return f"{Config.REPORT_LINK_BASE_URL.rstrip('/')}/{token}/{quote(path.name)}"
+
+
+def cleanup_published(days: int = None) -> int:
+    """Удаляет опубликованные файлы (папки токенов) старше days дней
+
     Args:
-        file_path: Путь к Excel файлу
-        recipients: Список email адресов (по умолчанию из конфига)
-        period_text: Текст периода для письма (например "01.02 - 15.02")
+        days: Срок хранения ссылок (по умолчанию REPORT_PUBLISH_DAYS, 0 — хранить всегда)
+
+    Returns:
+        int: Сколько папок удалено
     """
-    if not Path(file_path).exists():
-        logger.error(f"❌ Файл не найден: {file_path}")
-        return False
-    
-    if recipients is None:
-        if not Config.EMAIL_TO:
-            logger.warning("⚠️ Email получатель не настроен в .env")
-            return False
-        recipients = [Config.EMAIL_TO]
-    
-    if not Config.SMTP_USER or not Config.SMTP_PASSWORD:
-        logger.warning("⚠️ SMTP учетные данные не настроены в .env")
-        return False
-    
-    try:
-        logger.info(f"📧 Отправляем отчет на: {', '.join(recipients)}")
-        
-        # Формируем письмо
-        msg = MIMEMultipart()
-        msg['From'] = Config.SMTP_USER
-        msg['To'] = ", ".join(recipients)
-        
-        if period_text:
-            msg['Subject'] = f"Отчет по звонкам за период {period_text}"
+    if days is None:
+        days = Config.REPORT_PUBLISH_DAYS
+    if not days or not Config.REPORT_PUBLISH_PATH.is_dir():
+        return 0
+
+    expired_before = datetime.now().timestamp() - days * 24 * 3600
+    removed = 0
+    for folder in Config.REPORT_PUBLISH_PATH.iterdir():
+        if folder.is_dir() and folder.stat().st_mtime < expired_before:
+            shutil.rmtree(folder, ignore_errors=True)
+            removed += 1
+    if removed:
+        logger.info(f"🧹 Удалено устаревших опубликованных отчетов: {removed}")
+    return removed
+
+
+def build_message(delivery: Delivery):
+    """Собирает письмо: тема и текст по получателю отчета, вложения или ссылки"""
+    recipients = delivery.recipients or default_recipients()
+
+    attachments = []
+    for file_path in delivery.files:
+        path = Path(file_path)
+        attachments.append((path, *_compress(path, path.read_bytes())))
+
+    # Самые маленькие файлы прикладываются, пока помещаются в лимит, остальные — ссылкой
+    attached, links = [], []
+    total = 0
+    for path, name, data in sorted(attachments, key=lambda item: len(item[2])):
+        if total + len(data) <= Config.EMAIL_MAX_ATTACHMENTS_BYTES:
+            attached.append((name, data))
+            total += len(data)
+            continue
+        url = publish_file(path)
+        if url:
+            links.append((path.name, url))
         else:
-            msg['Subject'] = f"Отчет по звонкам от {datetime.now().strftime('%d.%m.%Y')}"
-        
-        # Текст письма
-        body = f"""Добрый день!
+            logger.warning(f"⚠️ {path.name} больше лимита вложений, а REPORT_LINK_BASE_URL не задан — прикладываем")
+            attached.append((name, data))
 
-Во вложении отчет по анализу звонков операторов.
+    msg = MIMEMultipart()
+    msg['From'] = Config.SMTP_USER
+    msg['To'] = ", ".join(recipients)
 
-Период: {period_text or 'последние 2 недели'}
+    about = f" — {delivery.name}" if delivery.name else ""
+    if delivery.period_text:
+        msg['Subject'] = f"Отчет по звонкам{about} за период {delivery.period_text}"
+    else:
+        msg['Subject'] = f"Отчет по звонкам{about} от {datetime.now().strftime('%d.%m.%Y')}"
+
+    whose = f"({delivery.name})" if delivery.name else "операторов"
+    link_lines = "".join(f"\n{name}: {url}" for name, url in links)
+    if not attached:
+        # Все файлы больше лимита — во вложении ничего нет
+        intro = f"Отчет по анализу звонков {whose} доступен по ссылке:{link_lines}\n"
+    elif links:
+        intro = (f"Во вложении отчет по анализу звонков {whose}.\n"
+                 f"\nФайлы по ссылкам (слишком большие для письма):{link_lines}\n")
+    else:
+        intro = f"Во вложении отчет по анализу звонков {whose}.\n"
+
+    # Текст письма
+    body = f"""Добрый день!
+
+{intro}
+Период: {delivery.period_text or 'последние 2 недели'}
 Дата формирования: {datetime.now().strftime('%d.%m.%Y %H:%M')}
 
 С уважением,
 Система автоматического анализа звонков
 """
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-        
-        # Прикрепляем Excel файл
-        with open(file_path, 'rb') as f:
-            attachment = MIMEApplication(f.read(), _subtype='xlsx')
-            attachment.add_header(
-                'Content-Disposition',
-                'attachment',
-                filename=Path(file_path).name
-            )
-            msg.attach(attachment)
-        
-        # Отправляем через SMTP
-        with smtplib.SMTP_SSL(Config.SMTP_HOST, Config.SMTP_PORT) as server:
-            server.login(Config.SMTP_USER, Config.SMTP_PASSWORD)
-            server.send_message(msg)
-        
-        logger.info(f"✅ Отчет успешно отправлен!")
-        return True
-        
+    msg.attach(MIMEText(body, 'plain', 'utf-8'))
+
+    for name, data in attached:
+        msg.attach(_attachment(name, data))
+
+    return msg
+
+
+def _attachment(name: str, data: bytes):
+    """Вложение с MIME типом по расширению (text/html, application/vnd...sheet, application/zip)"""
+    mime_type, _ = mimetypes.guess_type(name)
+    maintype, subtype = (mime_type or 'application/octet-stream').split('/', 1)
+    if maintype == 'text':
+        # HTML отчет — text/html, чтобы почтовые клиенты показывали его
+        attachment = MIMEText(data.decode('utf-8'), subtype, 'utf-8')
+    else:
+        attachment = MIMEApplication(data, _subtype=subtype)
+    attachment.add_header('Content-Disposition', 'attachment', filename=name)
+    return attachment
+
+
+def _build_or_none(delivery: Delivery):
+    try:
+        return build_message(delivery)
+    except Exception as e:
+        logger.error(f"❌ Не удалось собрать письмо ({', '.join(delivery.files)}): {e}")
+        return None
+
+
+def send_reports(deliveries: List[Delivery], connection: SMTPConnection = None) -> List[bool]:
+    """Отправляет пакет писем через одно SMTP соединение
+
+    Письма собираются в EMAIL_BUILD_THREADS потоках (чтение и сжатие
+    файлов) и отправляются по мере готовности в исходном порядке.
+
+    Args:
+        deliveries: Письма
+        connection: Соединение (по умолчанию — из настроек SMTP_*)
+
+    Returns:
+        list: Отправлено ли письмо, в порядке deliveries
+    """
+    results = [False] * len(deliveries)
+    if not deliveries:
+        return results
+
+    if not Config.SMTP_USER:
+        logger.warning("⚠️ SMTP_USER (отправитель) не настроен в .env")
+        return results
+
+    ready = []
+    for index, delivery in enumerate(deliveries):
+        missing = [path for path in delivery.files if not Path(path).exists()]
+        if missing or not delivery.files:
+            logger.error(f"❌ Файл не найден: {', '.join(missing) or 'нет файлов отчета'}")
+        elif not (delivery.recipients or default_recipients()):
+            logger.warning(f"⚠️ Для {', '.join(delivery.files)} не указаны получатели (EMAIL_TO)")
+        else:
+            ready.append(index)
+
+    if not ready:
+        logger.warning("⚠️ Нет писем для отправки")
+        return results
+
+    cleanup_published()
+
+    smtp = connection or SMTPConnection()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, Config.EMAIL_BUILD_THREADS)) as pool:
+            messages = pool.map(_build_or_none, [deliveries[index] for index in ready])
+            try:
+                for index, msg in zip(ready, messages):
+                    if msg is None:
+                        continue
+                    logger.info(f"📧 Отправляем отчет на: {msg['To']}")
+                    try:
+                        # Соединение открывается при первом собранном письме
+                        smtp.send(msg)
+                        results[index] = True
+                    except smtplib.SMTPRecipientsRefused as e:
+                        logger.error(f"❌ Получатели отклонены: {', '.join(e.recipients)}")
+                    except smtplib.SMTPDataError as e:
+                        # Например, письмо больше лимита сервера — остальные письма отправляем
+                        logger.error(f"❌ Сервер отклонил письмо на {msg['To']}: {e}")
+            finally:
+                smtp.close()
     except Exception as e:
         logger.error(f"❌ Ошибка отправки email: {e}")
         import traceback
         logger.error(traceback.format_exc())
+
+    logger.info(f"✅ Отправлено писем: {sum(results)} из {len(deliveries)}")
+    return results
+
+
+def send_report(file_path: str | list[str], recipients: list[str] = None, period_text: str = None):
+    """Отправляет отчет на email одним письмом
+
+    Args:
+        file_path: Путь к файлу отчета или список файлов (xlsx, html, json) — в одно письмо
+        recipients: Список email адресов (по умолчанию EMAIL_TO)
+        period_text: Текст периода для письма (например "01.02 - 15.02")
+    """
+    file_paths = [file_path] if isinstance(file_path, (str, Path)) else list(file_path)
+    if not (recipients or default_recipients()):
+        logger.warning("⚠️ Email получатель не настроен в .env")
         return False
+    return send_reports([Delivery(files=[str(path) for path in file_paths],
+                                  recipients=recipients or [], period_text=period_text)])[0]
@@ -0,0 +1,201 @@
+"""
+Потоковая запись Excel отчета (openpyxl write-only)
+
+Строки пишутся сразу в файл, а не в дерево ячеек в памяти. Ячейкам
+в момент записи назначаются общие именованные стили (рамка и
+выравнивание создаются один раз на книгу), поэтому отчет на десятки
+тысяч звонков не требует ни прохода по листу после заполнения, ни
+памяти под весь лист.
+
+Шапки листов (значения, оформление, ширина колонок) копируются из
+Template.xlsx. Когда "Детальный отчет" упирается в лимит строк листа
+Excel, продолжение пишется на листы "Детальный отчет (2)", "(3)" и т.д.
+с той же шапкой.
+"""
+
+from copy import copy
+from pathlib import Path
+from typing import Iterable, List, Sequence
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, NamedStyle, Side
+
+TEMPLATE_PATH = Path(__file__).resolve().parent / "Template.xlsx"
+
+DETAIL_SHEET = "Детальный отчет"
+SUMMARY_SHEET = "Общий отчет"
+# Строк в шапке листов шаблона
+DETAIL_HEADER_ROWS = 1
+SUMMARY_HEADER_ROWS = 15
+# Лимит строк листа Excel
+EXCEL_MAX_ROWS = 1048576
+
+DETAIL_COLUMN_WIDTHS = {
+    'A': 25,  # Оператор
+    'B': 18,  # Дата
+    'C': 10,  # Длительность
+    'D': 10, 'E': 10, 'F': 10, 'G': 10, 'H': 10, 'I': 8, 'J': 8,  # Оценки
+    'K': 50,  # Анализ (широкий)
+    'L': 50,  # Рекомендации (широкий)
+}
+SUMMARY_COLUMN_WIDTHS = {
+    'A': 25,  # Оператор
+    'B': 15,  # Звонки
+    'C': 15,  # Услуги
+    'D': 20,  # Статус
+    'E': 60,  # Рекомендации
+}
+
+_THIN = Side(style='thin')
+_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+
+# Оформление строк данных: рамка, имя оператора слева, оценки по центру,
+# длинные тексты (последние 2 колонки) — с переносом от верхнего края
+STYLE_NAME = "report_name"
+STYLE_CENTER = "report_center"
+STYLE_TEXT = "report_text"
+STYLE_HEADER_VALUE = "report_header_value"
+
+REPORT_STYLES = (
+    NamedStyle(name=STYLE_NAME, border=_BORDER,
+               alignment=Alignment(vertical='center', horizontal='left', wrap_text=True)),
+    NamedStyle(name=STYLE_CENTER, border=_BORDER,
+               alignment=Alignment(vertical='center', horizontal='center', wrap_text=True)),
+    NamedStyle(name=STYLE_TEXT, border=_BORDER,
+               alignment=Alignment(vertical='top', horizontal='left', wrap_text=True)),
+    NamedStyle(name=STYLE_HEADER_VALUE, border=_BORDER,
+               alignment=Alignment(vertical='center', horizontal='center')),
+)
+
+
+def _row_styles(columns: int) -> List[str]:
+    """Стили колонок строки данных из columns колонок"""
+    return [
+        STYLE_NAME if column == 1 else STYLE_TEXT if column >= columns - 1 else STYLE_CENTER
+        for column in range(1, columns + 1)
+    ]
+
+
+class ExcelReportWriter:
+    """Отчет в режиме write-only по шаблону
+
+    Использование:
+        writer = ExcelReportWriter()
+        for row in rows:
+            writer.add_detail_row(row)
+        writer.write_summary(header_values, operator_rows)
+        writer.save("Report.xlsx")
+    """
+
+    def __init__(self, template_path: Path = TEMPLATE_PATH, max_rows: int = EXCEL_MAX_ROWS):
+        """
+        Args:
+            template_path: Шаблон отчета (берутся только шапки листов)
+            max_rows: Лимит строк одного листа, включая шапку
+
+        Raises:
+            FileNotFoundError: Нет файла шаблона
+            KeyError: В шаблоне нет нужного листа
+        """
+        template = load_workbook(template_path)
+        self._detail_template = template[DETAIL_SHEET]
+        self._summary_template = template[SUMMARY_SHEET]
+        self.max_rows = max_rows
+
+        self.wb = Workbook(write_only=True)
+        for style in REPORT_STYLES:
+            self.wb.add_named_style(style)
+
+        self.detail_rows = 0
+        self.detail_sheets = 0
+        self._detail = None
+        self._detail_cells = []
+        self._detail_sheet_rows = 0
+        self._detail_styles = _row_styles(len(DETAIL_COLUMN_WIDTHS))
+        self._summary_styles = _row_styles(len(SUMMARY_COLUMN_WIDTHS))
+
+    def _copy_header(self, ws, source, rows: int, overrides: dict = None):
+        """Переносит строки шапки из листа шаблона (значения и оформление)"""
+        overrides = overrides or {}
+        for row in source.iter_rows(min_row=1, max_row=rows):
+            cells = []
+            for src in row:
+                if (src.row, src.column) in overrides:
+                    cell = WriteOnlyCell(ws, overrides[(src.row, src.column)])
+                    cell.style = STYLE_HEADER_VALUE
+                else:
+                    cell = WriteOnlyCell(ws, src.value)
+                    if src.has_style:
+                        cell.font = copy(src.font)
+                        cell.border = copy(src.border)
+                        cell.fill = copy(src.fill)
+                        cell.alignment = copy(src.alignment)
+                        cell.number_format = src.number_format
+                cells.append(cell)
+            ws.append(cells)
+
+    def _new_sheet(self, title: str, widths: dict):
+        ws = self.wb.create_sheet(title)
+        for column, width in widths.items():
+            ws.column_dimensions[column].width = width
+        return ws
+
+    def _start_detail_sheet(self):
+        self.detail_sheets += 1
+        title = DETAIL_SHEET if self.detail_sheets == 1 else f"{DETAIL_SHEET} ({self.detail_sheets})"
+        self._detail = self._new_sheet(title, DETAIL_COLUMN_WIDTHS)
+        self._detail.freeze_panes = f"A{DETAIL_HEADER_ROWS + 1}"
+        self._copy_header(self._detail, self._detail_template, DETAIL_HEADER_ROWS)
+        self._detail_cells = self._styled_cells(self._detail, self._detail_styles)
+        self._detail_sheet_rows = DETAIL_HEADER_ROWS
+
+    def _styled_cells(self, ws, styles: List[str]) -> list:
+        """Ячейки строки с назначенными стилями
+
+        Ячейки переиспользуются для всех строк листа: write-only лист
+        сериализует строку сразу при append, поэтому стиль ищется один раз
+        на лист, а не на каждую ячейку.
+        """
+        cells = []
+        for style in styles:
+            cell = WriteOnlyCell(ws)
+            cell.style = style
+            cells.append(cell)
+        return cells
+
+    @staticmethod
+    def _fill(cells: list, values: Sequence) -> list:
+        for cell, value in zip(cells, values):
+            cell.value = value
+        return cells
+
+    def add_detail_row(self, values: Sequence):
+        """Пишет строку звонка в "Детальный отчет" (12 колонок)"""
+        if self._detail is None or self._detail_sheet_rows >= self.max_rows:
+            self._start_detail_sheet()
+        self._detail.append(self._fill(self._detail_cells, values))
+        self._detail_sheet_rows += 1
+        self.detail_rows += 1
+
+    def write_summary(self, header_values: Sequence, operator_rows: Iterable[Sequence]):
+        """Пишет "Общий отчет": шапку шаблона с итогами во 2-й строке и строки операторов
+
+        Args:
+            header_values: Всего звонков, доп. записей, средний балл
+            operator_rows: Строки таблицы операторов (5 колонок)
+        """
+        if self._detail is None:
+            self._start_detail_sheet()
+
+        ws = self._new_sheet(SUMMARY_SHEET, SUMMARY_COLUMN_WIDTHS)
+        overrides = {(2, column): value for column, value in enumerate(header_values, start=1)}
+        self._copy_header(ws, self._summary_template, SUMMARY_HEADER_ROWS, overrides)
+        cells = self._styled_cells(ws, self._summary_styles)
+        for values in operator_rows:
+            ws.append(self._fill(cells, values))
+
+    def save(self, path) -> str:
+        """Сохраняет книгу; после сохранения писать в нее нельзя"""
+        self.wb.save(path)
+        return str(path)
@@ -0,0 +1,88 @@
+import errno
+import sys
+from typing import TYPE_CHECKING, Optional
+
+from sqlalchemy.exc import OperationalError
+
+if TYPE_CHECKING:
+    import requests
+
+
+class ProcessingError(Exception):
+    """Ошибка этапа обработки звонка
+
+    transient=True — временная ошибка (таймаут, 5xx, rate limit, обрыв
+    связи): звонок стоит повторить позже.
+    transient=False — постоянная ошибка (нет записи, в аудио нет речи,
+    4xx): повтор ничего не изменит, звонок уходит в dead-letter.
+    """
+
+    def __init__(self, message: str, transient: bool = True):
+        super().__init__(message)
+        self.transient = transient
+
+
+# errno ошибок ОС, которые проходят сами: нет места, сброс или таймаут соединения
+TRANSIENT_ERRNOS = {
+    errno.ENOSPC, errno.ECONNRESET, errno.ECONNREFUSED, errno.ECONNABORTED, errno.ETIMEDOUT,
+    errno.EPIPE, errno.EAGAIN, errno.EINTR, errno.EBUSY, errno.ENETDOWN, errno.ENETUNREACH,
+    errno.EHOSTUNREACH,
+}
+
+
+def is_transient_status(status_code: int) -> bool:
+    """Временная ли ошибка по HTTP статусу (408, 429 и 5xx)"""
+    return status_code in (408, 429) or status_code >= 500
+
+
+def is_transient_exception(error: Exception) -> bool:
+    """Классифицирует исключение: True если ошибку стоит повторить"""
+    if isinstance(error, ProcessingError):
+        return error.transient
+
+    # requests не импортируется ради одной классификации: если модуль еще
+    # не загружен, ошибок requests быть не может
+    http = sys.modules.get("requests")
+    if http is not None:
+        if isinstance(error, (http.exceptions.Timeout, http.exceptions.ConnectionError)):
+            return True
+
+        if isinstance(error, http.exceptions.HTTPError) and error.response is not None:
+            return is_transient_status(error.response.status_code)
+
+        # Остальные ошибки requests (InvalidURL, MissingSchema, TooManyRedirects, ...)
+        # наследуют IOError, но повтором не исправляются
+        if isinstance(error, http.exceptions.RequestException):
+            return False
+
+    # Блокировка или обрыв соединения с БД
+    if isinstance(error, OperationalError):
+        return True
+
+    # Сетевые и файловые ошибки ОС проходят, только если это таймаут, обрыв
+    # связи или нет места; нет файла, нет прав и т.п. повтором не исправить
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, OSError):
+        return error.errno in TRANSIENT_ERRNOS
+
+    # Ошибки в данных и коде (KeyError, ValueError, ...) повтором не исправить
+    return False
+
+
+def http_error(service: str, response: "requests.Response") -> ProcessingError:
+    """Создает ProcessingError по неуспешному HTTP ответу"""
+    return ProcessingError(
+        f"{service} error ({response.status_code}): {response.text[:300]}",
+        transient=is_transient_status(response.status_code)
+    )
+
+
+def describe_error(error: Optional[Exception], default: str) -> ProcessingError:
+    """Приводит ошибку к ProcessingError (или создает временную по умолчанию)"""
+    if isinstance(error, ProcessingError):
+        return error
+    if error is not None:
+        return ProcessingError(f"{type(error).__name__}: {error}",
+                               transient=is_transient_exception(error))
+    return ProcessingError(default, transient=True)
@@ -0,0 +1,222 @@
+"""
+Легкий отчет: статическая HTML-страница и JSON с данными
+
+Те же данные, что в Excel (aggregation.ReportSummary и
+aggregation.iter_call_details), но без openpyxl. Страница
+самодостаточная (стили встроены, без скриптов и внешних файлов) и на
+узком экране телефона показывает строки таблиц карточками. JSON —
+итоги (ReportSummary.to_dict) и звонки для других систем.
+
+Оба файла пишутся потоково: шапка и итоги по операторам, затем строки
+звонков по мере чтения из БД. Поэтому отчет за полный период
+формируется за доли секунды и не требует памяти под все звонки.
+"""
+
+import json
+from datetime import datetime
+from html import escape
+from string import Template
+from typing import Iterable, Iterator, Optional
+
+from aggregation import (ReportSummary, DETAIL_SCORE_FIELDS, DETAIL_TEXT_FIELDS,
+                         aggregate_report, add_final_recommendations, iter_call_details)
+from logger import get_logger
+
+logger = get_logger("html_report")
+
+# Колонки таблицы операторов и таблицы звонков (подписи карточек на телефоне)
+OPERATOR_COLUMNS = ("Оператор", "Звонки", "Услуги", "KPI", "Статус", "Рекомендации")
+CALL_COLUMNS = (
+    "Оператор", "Дата", "Длительность",
+    "Приветствие", "Потребности", "Презентация", "Возражения", "Завершение",
+    "Услуги", "Бонус", "Анализ", "Рекомендации",
+)
+# Оформление колонок (по номеру, чтобы не повторять классы в каждой ячейке):
+# первая — оператор, последняя у операторов и две последние у звонков — тексты
+OPERATOR_TEXT_COLUMNS = 1
+CALL_TEXT_COLUMNS = len(DETAIL_TEXT_FIELDS)
+
+PAGE_HEAD = Template("""<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>$title</title>
+<style>
+body { font-family: -apple-system, "Segoe UI", Roboto, Arial, sans-serif; margin: 0 auto; padding: 16px; max-width: 1400px; color: #222; }
+h1 { font-size: 1.4em; margin: 0 0 4px; }
+h2 { font-size: 1.15em; margin: 24px 0 8px; }
+.period { color: #666; margin: 0 0 16px; }
+.totals { display: flex; flex-wrap: wrap; gap: 12px; }
+.totals div { border: 1px solid #ddd; border-radius: 6px; padding: 8px 16px; }
+.totals b { display: block; font-size: 1.4em; }
+table { border-collapse: collapse; width: 100%; font-size: 0.9em; }
+th, td { border: 1px solid #ccc; padding: 4px 6px; vertical-align: top; }
+th { background: #f2f2f2; }
+$column_styles
+.Золотой { background: #fff4c2; }
+.Серебряный { background: #eeeeee; }
+.Медный { background: #f6e0cc; }
+@media (max-width: 700px) {
+  thead { display: none; }
+  table, tbody, tr, td { display: block; width: auto; }
+  tr { border: 1px solid #ccc; border-radius: 6px; margin-bottom: 8px; }
+  td { border: none; text-align: left !important; min-width: 0 !important; }
+  td::before { font-weight: bold; }
+$card_labels
+}
+</style>
+</head>
+<body>
+<h1>$title</h1>
+<p class="period">$period</p>
+""")
+PAGE_TAIL = """</tbody>
+</table>
+<p class="period">Сформировано: $created</p>
+</body>
+</html>
+"""
+
+
+def _format_period(summary: ReportSummary) -> str:
+    if not summary.start_date and not summary.end_date:
+        return "За все время"
+    start = summary.start_date.strftime("%d.%m.%Y") if summary.start_date else "…"
+    end = summary.end_date.strftime("%d.%m.%Y") if summary.end_date else "…"
+    return f"Период: {start} - {end}"
+
+
+def _column_styles(table: str, columns: tuple, text_columns: int) -> str:
+    rules = []
+    for number in range(2, len(columns) + 1):
+        if number > len(columns) - text_columns:
+            rules.append(f".{table} td:nth-child({number}) {{ min-width: 240px; white-space: pre-line; }}")
+        else:
+            rules.append(f".{table} td:nth-child({number}) {{ text-align: center; white-space: nowrap; }}")
+    return "\n".join(rules)
+
+
+def _card_labels(table: str, columns: tuple) -> str:
+    return "\n".join(
+        f'  .{table} td:nth-child({number})::before {{ content: "{name}: "; }}'
+        for number, name in enumerate(columns, start=1)
+    )
+
+
+def _table_head(table: str, columns: Iterable[str]) -> str:
+    head = "".join(f"<th>{name}</th>" for name in columns)
+    return f'<table class="{table}">\n<thead><tr>{head}</tr></thead>\n<tbody>\n'
+
+
+def _row(values: Iterable, css: str = "") -> str:
+    cells = "".join(f"<td>{escape(str(value))}</td>" for value in values)
+    return f'<tr class="{css}">{cells}</tr>\n' if css else f"<tr>{cells}</tr>\n"
+
+
+def render_html(summary: ReportSummary, calls: Iterable[dict], title: str = "Отчет по звонкам") -> Iterator[str]:
+    """HTML-страница отчета по частям (для потоковой записи в файл)
+
+    Args:
+        summary: Итоги отчета (с итоговыми рекомендациями)
+        calls: Звонки в формате aggregation.iter_call_details
+        title: Заголовок страницы
+    """
+    yield PAGE_HEAD.substitute(
+        title=escape(title),
+        period=escape(_format_period(summary)),
+        column_styles=_column_styles("operators", OPERATOR_COLUMNS, OPERATOR_TEXT_COLUMNS)
+        + "\n" + _column_styles("calls", CALL_COLUMNS, CALL_TEXT_COLUMNS),
+        card_labels=_card_labels("operators", OPERATOR_COLUMNS) + "\n" + _card_labels("calls", CALL_COLUMNS),
+    )
+
+    yield (
+        '<div class="totals">'
+        f"<div>Звонков<b>{summary.calls}</b></div>"
+        f"<div>Доп. услуг<b>{summary.services}</b></div>"
+        f"<div>Средний KPI<b>{summary.kpi:.2f}</b></div>"
+        "</div>\n"
+    )
+
+    yield "<h2>Операторы</h2>\n" + _table_head("operators", OPERATOR_COLUMNS)
+    for item in summary.operators:
+        yield _row((item.operator, item.calls, item.services, f"{item.kpi:.2f}", item.tier,
+                    item.final_recommendation or item.top_recommendation), css=item.tier)
+    yield "</tbody>\n</table>\n"
+
+    yield "<h2>Звонки</h2>\n" + _table_head("calls", CALL_COLUMNS)
+    for call in calls:
+        mins, secs = divmod(call["duration"], 60)
+        yield _row((
+            call["operator"],
+            call["date"].strftime("%d.%m.%Y %H:%M"),
+            f"{mins}:{secs:02d}",
+            *(call[name] for name in DETAIL_SCORE_FIELDS),
+            *(call[name] for name in DETAIL_TEXT_FIELDS),
+        ))
+
+    yield Template(PAGE_TAIL).substitute(created=datetime.now().strftime("%d.%m.%Y %H:%M"))
+
+
+def render_json(summary: ReportSummary, calls: Iterable[dict]) -> Iterator[str]:
+    """JSON отчета по частям: {"summary": ..., "calls": [...]}"""
+    yield '{"summary": ' + json.dumps(summary.to_dict(), ensure_ascii=False) + ',\n "calls": ['
+    separator = "\n  "
+    for call in calls:
+        yield separator + json.dumps(
+            {**call, "date": call["date"].isoformat()}, ensure_ascii=False, default=str
+        )
+        separator = ",\n  "
+    yield "\n]}\n"
+
+
+def _write(chunks: Iterable[str], output_filename: str) -> Optional[str]:
+    try:
+        with open(output_filename, "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        logger.info(f"✅ Файл создан: {output_filename}")
+        return output_filename
+    except Exception as e:
+        logger.error(f"❌ Ошибка при сохранении {output_filename}: {e}")
+        return None
+
+
+def _report_data(start_date: datetime, end_date: datetime,
+                 summary: Optional[ReportSummary], operators: Optional[list],
+                 tenant: Optional[str]):
+    """Итоги (как в Excel — с итоговыми рекомендациями) и поток звонков"""
+    if summary is None:
+        summary = aggregate_report(start_date, end_date, tenant)
+    summary = summary.for_operators(operators)
+    if summary.calls:
+        add_final_recommendations(summary)
+    return summary, iter_call_details(start_date, end_date, operators, tenant)
+
+
+def _default_filename(extension: str) -> str:
+    return f"Report_{datetime.now().strftime('%d.%m.%y')}.{extension}"
+
+
+def generate_html(start_date: datetime = None, end_date: datetime = None,
+                  summary: ReportSummary = None, operators: list = None,
+                  output_filename: str = None, tenant: str = None) -> Optional[str]:
+    """Формирует HTML отчет (аргументы — как у main.generate_excel)
+
+    Returns:
+        str: Путь к файлу или None при ошибке
+    """
+    summary, calls = _report_data(start_date, end_date, summary, operators, tenant)
+    return _write(render_html(summary, calls), output_filename or _default_filename("html"))
+
+
+def generate_json(start_date: datetime = None, end_date: datetime = None,
+                  summary: ReportSummary = None, operators: list = None,
+                  output_filename: str = None, tenant: str = None) -> Optional[str]:
+    """Формирует JSON с итогами и звонками (аргументы — как у main.generate_excel)
+
+    Returns:
+        str: Путь к файлу или None при ошибке
+    """
+    summary, calls = _report_data(start_date, end_date, summary, operators, tenant)
+    return _write(render_json(summary, calls), output_filename or _default_filename("json"))
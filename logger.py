@@ -1,47 +1,204 @@
+"""
+Логирование приложения
+
+Записи не пишутся в файл и консоль в потоке, который логирует:
+QueueHandler кладет их в очередь, а QueueListener в фоновом потоке
+отдает обработчикам. Поэтому обработка звонков не ждет диск.
+
+- Консоль — прежний читаемый формат с эмодзи.
+- Файл logs/processing.log — по JSON-объекту на строку (время, уровень,
+  модуль, сообщение и поля из extra: call_id, stage, duration, ...).
+  При LOG_MAX_BYTES файл ротируется, старые части сжимаются в
+  processing.log.N.gz (хранится LOG_BACKUP_COUNT).
+- Уровни: LOG_LEVEL для всех и LOG_LEVELS для отдельных модулей,
+  например "processor.banner:WARNING,yandex_gpt:DEBUG".
+
+Модули логируют через logger = get_logger("<модуль>"). Дочерние
+процессы (worker.py --workers, пул отчетов) отправляют записи в
+очередь основного процесса (log_queue / use_parent_log_queue), чтобы
+в один файл писал и ротировал его только один процесс.
+"""
+
+import atexit
+import copy
+import gzip
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import shutil
 import sys
-from pathlib import Path
 from datetime import datetime
+from pathlib import Path
+
+from config import Config
 
 # Создаем папку для логов
 LOG_DIR = Path("./logs")
 LOG_DIR.mkdir(exist_ok=True)
+LOG_FILE = LOG_DIR / "processing.log"
 
-# Формат лога
+# Формат лога в консоли
 LOG_FORMAT = "[%(asctime)s] %(levelname)s: %(message)s"
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-def setup_logger(name: str = "speech_analysis") -> logging.Logger:
+ROOT_LOGGER = "speech_analysis"
+
+# Атрибуты LogRecord, которые не относятся к полям extra
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+_process_queue = None
+_process_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись в одну строку JSON: ts, level, module, msg и поля extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "module": record.name[len(ROOT_LOGGER) + 1:] if record.name != ROOT_LOGGER else record.module,
+            "pid": record.process,
+            "msg": record.getMessage().strip(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который оставляет traceback отдельно от сообщения
+
+    Стандартный prepare склеивает их в msg, а в JSON traceback — поле exc.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def _gzip_rotator(source: str, dest: str):
+    """Ротация: закрытая часть лога сжимается в gzip"""
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def parse_levels(value: str) -> dict:
+    """Уровни модулей из строки "processor.banner:WARNING,yandex_gpt:DEBUG" """
+    levels = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, level = item.partition(":")
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+        if not isinstance(levels[name.strip()], int):
+            raise ValueError(f"Неизвестный уровень логирования: {item.strip()!r}")
+    return levels
+
+
+def _output_handlers() -> list:
+    """Обработчики, которые пишут записи (работают в потоке QueueListener)"""
+    # Файл: JSON, ротация по размеру со сжатием. delay=True: файл
+    # открывается при первой записи, а не при импорте
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUP_COUNT,
+        encoding="utf-8", delay=True
+    )
+    file_handler.namer = lambda name: f"{name}.gz"
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(JsonFormatter())
+
+    # Консоль
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+
+    return [file_handler, console_handler]
+
+
+def _stop_listeners():
+    for listener in (_process_listener, _listener):
+        if listener is not None:
+            listener.stop()
+
+
+def setup_logger(name: str = ROOT_LOGGER) -> logging.Logger:
     """Настраивает логгер для приложения
-    
+
     Args:
         name: Имя логгера
-        
+
     Returns:
         logging.Logger: Настроенный логгер
     """
+    global _listener
+
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    
+    logger.setLevel(Config.LOG_LEVEL.upper())
+    logger.propagate = False
+
     # Избегаем дублирования handlers
     if logger.handlers:
         return logger
-    
-    # Handler для файла (с датой в имени)
-    log_file = LOG_DIR / f"processing_{datetime.now().strftime('%Y%m%d')}.log"
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
-    file_handler.setLevel(logging.INFO)
-    file_handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
-    
-    # Handler для консоли
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
-    
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+
+    for module, level in parse_levels(Config.LOG_LEVELS).items():
+        logging.getLogger(f"{name}.{module}").setLevel(level)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(_QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *_output_handlers())
+    _listener.start()
+    atexit.register(_stop_listeners)
+
     return logger
 
+
+def get_logger(module: str) -> logging.Logger:
+    """Логгер модуля (уровень настраивается через LOG_LEVELS)"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{module}")
+
+
+def log_queue():
+    """Очередь для записей дочерних процессов (spawn) этого процесса
+
+    Передайте ее в дочерний процесс и вызовите там use_parent_log_queue.
+    """
+    global _process_queue, _process_listener
+    if _process_queue is None:
+        import multiprocessing
+        _process_queue = multiprocessing.get_context("spawn").Queue()
+        # Записи уже отфильтрованы по уровням в дочернем процессе
+        _process_listener = logging.handlers.QueueListener(_process_queue, *_listener.handlers)
+        _process_listener.start()
+    return _process_queue
+
+
+def use_parent_log_queue(parent_queue):
+    """В дочернем процессе: отправлять записи в очередь основного процесса"""
+    global _listener
+    if parent_queue is None:
+        return
+    root = logging.getLogger(ROOT_LOGGER)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    root.addHandler(_QueueHandler(parent_queue))
+
+
 # Глобальный логгер
 logger = setup_logger()
@@ -1,240 +1,92 @@
-from megafon import sync_calls_from_megafon
-import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles import Alignment, Border, Side, Font, PatternFill
-from openpyxl.utils import get_column_letter
-from database import init_db, SessionLocal, Call
-from datetime import datetime, timedelta
-import random
-import time
-from faker import Faker
-
-fake = Faker("ru_RU")
-OPERATORS = ["Смирнова Анна", "Кузнецова Елена", "Васильева Мария"]
-
-def create_mock_data():
-    """Наполняет базу фейковыми звонками для теста"""
-    session = SessionLocal()
-    
-    if session.query(Call).count() > 0:
-        print("ℹ️ В базе уже есть данные. Используем их.")
-        session.close()
-        return
-
-    print("🎲 Генерирую 30 тестовых звонков...")
-    
-    for _ in range(30):
-        ai_mock = {
-            "greeting": random.randint(4, 10),
-            "greeting_comment": "Все ок",
-            "needs": random.randint(3, 9),
-            "needs_comment": "Мало вопросов",
-            "presentation": random.randint(4, 10),
-            "presentation_comment": "Хорошо",
-            "objection": random.randint(5, 10),
-            "objection_comment": "Справился",
-            "closing": random.randint(5, 10),
-            "closing_comment": "Записал",
-            "services_count": random.choice([0, 1, 1, 2]),
-            "bonus": random.choice([0, 0, 0, 500]),
-            "bonus_comment": "Бонус за сложность",
-            "summary": fake.sentence(nb_words=15), # Чуть длиннее текст
-            "recommendation": random.choice([
-                "Не перебивать клиента, выслушать до конца.",
-                "Предлагать доп. услуги (УЗИ, анализы) более настойчиво.",
-                "Говорить громче и увереннее, клиент переспрашивает.",
-                "Выучить прайс-лист, долгие паузы при поиске цены.",
-                "Отличная работа, эталонный диалог."
-            ])
-        }
-
-        call = Call(
-            id=str(random.randint(100000, 999999)),
-            date=datetime.now() - timedelta(days=random.randint(0, 14)),
-            operator=random.choice(OPERATORS),
-            duration=random.randint(60, 400),
-            status="PROCESSED",
-            ai_data=ai_mock
-        )
-        session.add(call)
-    
-    session.commit()
-    print("✅ Тестовые данные сохранены в calls.db")
-    session.close()
-
-def apply_beautiful_styles(ws, start_row, end_row, last_col):
-    """Наводит красоту: рамки, отступы, переносы строк"""
-    thin_border = Border(left=Side(style='thin'), 
-                         right=Side(style='thin'), 
-                         top=Side(style='thin'), 
-                         bottom=Side(style='thin'))
-    
-    # Проходим по всем ячейкам с данными
-    for row in ws.iter_rows(min_row=start_row, max_row=end_row, min_col=1, max_col=last_col):
-        for cell in row:
-            # 1. Делаем рамку
-            cell.border = thin_border
-            
-            # 2. Настраиваем выравнивание
-            # Если колонка с длинным текстом (обычно это последние 2) - делаем перенос
-            if cell.column >= last_col - 1: 
-                cell.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
-            else:
-                # Остальные по центру
-                cell.alignment = Alignment(vertical='center', horizontal='center', wrap_text=True)
-                
-            # Имя оператора (1 колонка) - выравниваем по левому краю
-            if cell.column == 1:
-                cell.alignment = Alignment(vertical='center', horizontal='left', wrap_text=True)
-
-def set_column_widths(ws, columns_config):
-    """Задает ширину столбцов"""
-    for col_letter, width in columns_config.items():
-        ws.column_dimensions[col_letter].width = width
-
-def generate_excel():
+from excel_writer import ExcelReportWriter, TEMPLATE_PATH
+from aggregation import (ReportSummary, DETAIL_SCORE_FIELDS, DETAIL_TEXT_FIELDS,
+                         aggregate_report, add_final_recommendations, iter_call_details)
+from datetime import datetime
+
+# Тестовые данные — в mock_data.py (create_mock_data)
+
+
+def generate_excel(start_date: datetime = None, end_date: datetime = None,
+                   summary: ReportSummary = None, operators: list = None,
+                   output_filename: str = None, tenant: str = None):
+    """Формирует Excel отчет по обработанным звонкам периода
+
+    Звонки читаются из БД порциями (aggregation.iter_call_details) и
+    сразу пишутся в "Детальный отчет" (потоковая запись, см.
+    excel_writer.py), поэтому память не растет вместе с историей звонков. "Общий отчет" строится
+    по итогам aggregation.aggregate_report.
+
+    Args:
+        start_date: Начало периода (None — без ограничения)
+        end_date: Конец периода (None — без ограничения)
+        summary: Готовые итоги периода (иначе считаются здесь)
+        operators: Только эти операторы (None — все)
+        output_filename: Имя файла (по умолчанию Report_<дата>.xlsx)
+        tenant: Только звонки клиента (None — все клиенты)
+    """
     print("📊 Формирую красивый Excel отчет...")
-    session = SessionLocal()
-    calls = session.query(Call).filter(Call.status == "PROCESSED").all()
-    
+
     try:
-        wb = load_workbook("template.xlsx")
+        writer = ExcelReportWriter()
     except FileNotFoundError:
-        print("❌ ОШИБКА: Файл template.xlsx не найден!")
+        print(f"❌ ОШИБКА: Файл {TEMPLATE_PATH.name} не найден!")
+        return
+    except KeyError as e:
+        print(f"❌ ОШИБКА: В шаблоне нет листа {e}")
         return
 
     # ==========================================
     # ЛИСТ 1: Детальный отчет
     # ==========================================
-    try:
-        ws_detail = wb["Детальный отчет"]
-    except KeyError:
-        print("❌ ОШИБКА: Лист 'Детальный отчет' не найден")
-        return
-
-    start_row = 2
-    data_for_pandas = []
-
-    for i, call in enumerate(calls):
-        r = start_row + i
-        ai = call.ai_data
-        
-        mins, secs = divmod(call.duration, 60)
+    for call in iter_call_details(start_date, end_date, operators, tenant):
+        mins, secs = divmod(call["duration"], 60)
         duration_str = f"{mins}:{secs:02d}"
-        
-        ws_detail.cell(row=r, column=1, value=call.operator)
-        ws_detail.cell(row=r, column=2, value=call.date.strftime("%d.%m.%Y %H:%M"))
-        ws_detail.cell(row=r, column=3, value=duration_str)
-        ws_detail.cell(row=r, column=4, value=ai.get('greeting', 0))
-        ws_detail.cell(row=r, column=5, value=ai.get('needs', 0))
-        ws_detail.cell(row=r, column=6, value=ai.get('presentation', 0))
-        ws_detail.cell(row=r, column=7, value=ai.get('objection', 0))
-        ws_detail.cell(row=r, column=8, value=ai.get('closing', 0)) # New column
-        ws_detail.cell(row=r, column=9, value=ai.get('services_count', 0))
-        ws_detail.cell(row=r, column=10, value=ai.get('bonus', 0))
-        ws_detail.cell(row=r, column=11, value=ai.get('summary', '-'))
-        ws_detail.cell(row=r, column=12, value=ai.get('recommendation', '-'))
-
-        data_for_pandas.append({
-            "Оператор": call.operator,
-            "greeting": ai.get('greeting', 0),
-            "needs": ai.get('needs', 0),
-            "presentation": ai.get('presentation', 0),
-            "objection": ai.get('objection', 0),
-            "closing": ai.get('closing', 0),
-            "services": ai.get('services_count', 0),
-            "recommendation": ai.get('recommendation', '-')
-        })
-
-    set_column_widths(ws_detail, {
-        'A': 25, # Оператор
-        'B': 18, # Дата
-        'C': 10, # Длительность
-        'D': 10, 'E': 10, 'F': 10, 'G': 10, 'H': 10, 'I': 8, 'J': 8, # Оценки
-        'K': 50, # Анализ (широкий)
-        'L': 50  # Рекомендации (широкий)
-    })
-    apply_beautiful_styles(ws_detail, start_row, start_row + len(calls) - 1, 12)
 
+        writer.add_detail_row([
+            call["operator"],
+            call["date"].strftime("%d.%m.%Y %H:%M"),
+            duration_str,
+            *(call[name] for name in DETAIL_SCORE_FIELDS),
+            *(call[name] for name in DETAIL_TEXT_FIELDS),
+        ])
 
+    if writer.detail_sheets > 1:
+        print(f"ℹ️ Детальный отчет разбит на {writer.detail_sheets} листа(ов) по лимиту строк Excel")
 
     # ==========================================
     # ЛИСТ 2: Общий отчет
     # ==========================================
-    try:
-        ws_summary = wb["Общий отчет"]
-        if data_for_pandas:
-            df = pd.DataFrame(data_for_pandas)
-            
-            # --- 1. Шапка ---
-            ws_summary.cell(row=2, column=1, value=len(df))
-            ws_summary.cell(row=2, column=2, value=df['services'].sum())
-            avg_total = (df['greeting'].mean() + df['needs'].mean() + 
-                         df['presentation'].mean() + df['objection'].mean() + df['closing'].mean()) / 5
-            ws_summary.cell(row=2, column=3, value=round(avg_total, 2))
-            
-            # Стили для шапки (выравнивание по центру)
-            for col in range(1, 4):
-                ws_summary.cell(row=2, column=col).alignment = Alignment(horizontal='center', vertical='center')
-
-            # --- 2. Таблица операторов ---
-            grouped = df.groupby("Оператор")
-            start_row_sum = 16 
-            
-            current_row = start_row_sum
-            for name, group in grouped:
-                avg_kpi = (group['greeting'].mean() + group['needs'].mean() + 
-                           group['presentation'].mean() + group['objection'].mean() + group['closing'].mean()) / 5
-                
-                status_text = "Золотой" if avg_kpi > 8.5 else "Серебряный" if avg_kpi >= 7 else "Медный"
-                status_val = f"{avg_kpi:.2f}\n{status_text}"
-                
-                # НОВОЕ: Генерируем итоговую рекомендацию через GPT
-                recommendations_list = group['recommendation'].tolist()
-                
-                # Пробуем использовать GPT для генерации итоговой рекомендации
-                try:
-                    from yandex_gpt import gpt_client
-                    print(f"🤖 Генерируем итоговую рекомендацию для {name} через GPT...")
-                    final_ai = gpt_client.generate_operator_summary(recommendations_list, name)
-                except Exception as e:
-                    print(f"⚠️ Не удалось сгенерировать через GPT: {e}")
-                    # Fallback: используем старую логику
-                    rec_mode = group['recommendation'].mode()
-                    top_rec = rec_mode[0] if not rec_mode.empty else "Нет данных"
-                    final_ai = f"Статус: {status_text}.\nЧастая ошибка: {top_rec}"
-
-                ws_summary.cell(row=current_row, column=1, value=name)
-                ws_summary.cell(row=current_row, column=2, value=len(group))
-                ws_summary.cell(row=current_row, column=3, value=group['services'].sum())
-                ws_summary.cell(row=current_row, column=4, value=status_val)
-                ws_summary.cell(row=current_row, column=5, value=final_ai)
-
-                current_row += 1
-            
-            # НАВОДИМ КРАСОТУ (Сводный)
-            set_column_widths(ws_summary, {
-                'A': 25, # Оператор
-                'B': 15, # Звонки
-                'C': 15, # Услуги
-                'D': 20, # Статус
-                'E': 60  # Рекомендации
-            })
-            apply_beautiful_styles(ws_summary, start_row_sum, current_row - 1, 5)
-
-    except KeyError:
-        print("⚠️ Лист 'Общий отчет' не найден.")
+    if summary is None:
+        summary = aggregate_report(start_date, end_date, tenant)
+    summary = summary.for_operators(operators)
+
+    header_values = ()
+    operator_rows = []
+    if summary.calls:
+        # --- 1. Шапка ---
+        header_values = (summary.calls, summary.services, round(summary.kpi, 2))
+
+        # --- 2. Таблица операторов ---
+        # Итоговые рекомендации через GPT (или по частой ошибке, если GPT недоступен)
+        add_final_recommendations(summary)
+        for item in summary.operators:
+            operator_rows.append((
+                item.operator, item.calls, item.services,
+                f"{item.kpi:.2f}\n{item.tier}", item.final_recommendation
+            ))
+
+    writer.write_summary(header_values, operator_rows)
 
     # ==========================================
     # СОХРАНЕНИЕ
     # ==========================================
     # Формат: Report_16.02.26.xlsx
-    date_str = datetime.now().strftime("%d.%m.%y")
-    
-    output_filename = f"Report_{date_str}.xlsx"
+    if not output_filename:
+        date_str = datetime.now().strftime("%d.%m.%y")
+        output_filename = f"Report_{date_str}.xlsx"
     
     try:
-        wb.save(output_filename)
+        writer.save(output_filename)
         print(f"🚀 УСПЕХ! Файл создан: {output_filename}")
         return output_filename  # Возвращаем путь к файлу
     except PermissionError:
@@ -245,6 +97,9 @@ def generate_excel():
         return None
 
 if __name__ == "__main__":
+    from database import init_db
+    from megafon import sync_calls_from_megafon
+
     init_db()
 
     # 1. СБОР РЕАЛЬНЫХ ДАННЫХ
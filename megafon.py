@@ -2,6 +2,9 @@ import requests
 import os
 from datetime import datetime, timedelta
 from database import SessionLocal, Call
+from failures import ProcessingError, http_error, is_transient_exception
+from metrics import metrics
+from tenants import Tenant, scoped_call_id
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,8 +13,10 @@ load_dotenv()
 HOST = os.getenv("MEGAFON_HOST", "").rstrip('/')
 KEY = os.getenv("MEGAFON_KEY", "")
 
-def sync_calls_from_megafon(days_back=7):
-    print(f"📡 Стучусь в API, используя формат с вебхука...")
+def sync_calls_from_megafon(days_back=7, tenant: Tenant = None):
+    # АТС клиента (tenants.py); без клиента — MEGAFON_HOST/MEGAFON_KEY из .env
+    tenant = tenant or Tenant()
+    print(f"📡 Стучусь в API ({tenant.name}), используя формат с вебхука...")
     
     session = SessionLocal()
     
@@ -22,7 +27,7 @@ def sync_calls_from_megafon(days_back=7):
     # Используем 'crm_token' вместо 'token'
     payload = {
         "cmd": "history",
-        "crm_token": KEY, 
+        "crm_token": tenant.megafon_key, 
         "start": start_date.strftime("%Y%m%dT%H%M%SZ"),
         "end": end_date.strftime("%Y%m%dT%H%M%SZ"),
         "limit": 100
@@ -36,7 +41,7 @@ def sync_calls_from_megafon(days_back=7):
 
     try:
         # Шлем как обычную форму (data=), НЕ как JSON
-        resp = requests.post(HOST, data=payload, headers=headers, timeout=15)
+        resp = requests.post(tenant.megafon_host, data=payload, headers=headers, timeout=15)
         
         print(f"Статус ответа: {resp.status_code}")
         
@@ -64,12 +69,15 @@ def sync_calls_from_megafon(days_back=7):
         for item in calls:
             call_id = item.get("callid") or item.get("uid")
             if not call_id: continue
+            # Одинаковые callid у разных АТС — разные звонки
+            call_id = scoped_call_id(tenant.name, call_id)
             
-            if session.query(Call).filter(Call.id == str(call_id)).first():
+            if session.query(Call).filter(Call.id == call_id).first():
                 continue
                 
             new_call = Call(
-                id=str(call_id),
+                id=call_id,
+                tenant=tenant.name,
                 date=datetime.now(), 
                 operator=item.get("user", "Оператор"),
                 phone=item.get("phone"),
@@ -89,12 +97,15 @@ def sync_calls_from_megafon(days_back=7):
     finally:
         session.close()
 
-def download_audio(audio_url: str, save_path: str) -> bool:
+def download_audio(audio_url: str, save_path: str, raise_errors: bool = False, key: str = None) -> bool:
     """Скачивает аудио файл из АТС Мегафон по ссылке
     
     Args:
         audio_url: URL для скачивания аудио
         save_path: Путь куда сохранить файл
+        raise_errors: Вместо возврата False выбрасывать ProcessingError
+            с признаком, временная ли ошибка (нужно для повторов)
+        key: Ключ АТС клиента звонка (по умолчанию MEGAFON_KEY)
         
     Returns:
         bool: True если успешно скачано
@@ -109,11 +120,13 @@ def download_audio(audio_url: str, save_path: str) -> bool:
         
         # Если URL содержит токен, используем его
         # Иначе добавляем ключ как параметр
-        if "token" not in audio_url.lower() and KEY:
-            params = {"token": KEY}
+        key = key if key is not None else KEY
+        if "token" not in audio_url.lower() and key:
+            params = {"token": key}
         else:
             params = {}
         
+        metrics.inc("megafon_requests")
         response = requests.get(
             audio_url, 
             headers=headers,
@@ -126,15 +139,24 @@ def download_audio(audio_url: str, save_path: str) -> bool:
             with open(save_path, 'wb') as f:
                 for chunk in response.iter_content(chunk_size=8192):
                     f.write(chunk)
+                    metrics.inc("download_bytes", len(chunk))
             
             print(f"✅ Файл сохранен: {save_path}")
             return True
         else:
             print(f"❌ Ошибка скачивания: {response.status_code}")
+            if raise_errors:
+                raise http_error("Megafon download", response)
             return False
             
+    except ProcessingError:
+        raise
     except Exception as e:
         print(f"🔥 Ошибка при скачивании аудио: {e}")
+        if raise_errors:
+            raise ProcessingError(
+                f"Ошибка при скачивании аудио: {e}", transient=is_transient_exception(e)
+            ) from e
         return False
 
 if __name__ == "__main__":
@@ -0,0 +1,210 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from logger import LOG_DIR
+
+# Сколько последних замеров каждого этапа хранить для перцентилей
+MAX_SAMPLES = 10000
+# Префикс имен метрик в формате Prometheus
+METRICS_PREFIX = "speech_analysis"
+
+
+def percentile(values: list, q: float) -> float:
+    """Перцентиль q (0-100) с линейной интерполяцией"""
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return ordered[low]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class MetricsRegistry:
+    """Метрики пайплайна: время этапов, счетчики и текущие значения
+
+    - этапы (download, transcribe, score, ...) — длительности в секундах,
+      по ним считаются p50/p95/p99;
+    - счетчики — байты, запросы к API, повторы, обработанные звонки;
+    - gauges — текущие значения, например глубина очереди.
+
+    Потокобезопасен; у каждого процесса свой экземпляр (metrics).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Сбрасывает все метрики (начало нового запуска)"""
+        with self._lock:
+            self._started_at = datetime.now()
+            self._started = time.monotonic()
+            self._samples = {}
+            self._counts = {}
+            self._sums = {}
+            self._counters = {}
+            self._gauges = {}
+
+    def observe(self, stage: str, seconds: float):
+        """Записывает длительность этапа"""
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = deque(maxlen=MAX_SAMPLES)
+                self._counts[stage] = 0
+                self._sums[stage] = 0.0
+            self._samples[stage].append(seconds)
+            self._counts[stage] += 1
+            self._sums[stage] += seconds
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Замеряет время блока кода как этап stage
+
+        Использование:
+            with metrics.timer("download"):
+                download_audio(...)
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - started)
+
+    def inc(self, name: str, value: float = 1):
+        """Увеличивает счетчик"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        """Устанавливает текущее значение"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self) -> dict:
+        """Возвращает все метрики в виде словаря (для JSON и Prometheus)"""
+        with self._lock:
+            uptime = time.monotonic() - self._started
+            stages = {}
+            for stage, samples in self._samples.items():
+                values = list(samples)
+                count = self._counts[stage]
+                stages[stage] = {
+                    "count": count,
+                    "sum": round(self._sums[stage], 4),
+                    "mean": round(self._sums[stage] / count, 4) if count else 0.0,
+                    "p50": round(percentile(values, 50), 4),
+                    "p95": round(percentile(values, 95), 4),
+                    "p99": round(percentile(values, 99), 4),
+                    "max": round(max(values), 4) if values else 0.0,
+                }
+
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        processed = counters.get("calls_processed", 0)
+        audio_seconds = counters.get("audio_seconds_processed", 0)
+
+        return {
+            "started_at": self._started_at.isoformat(timespec="seconds"),
+            "uptime_seconds": round(uptime, 3),
+            "pid": os.getpid(),
+            "stages": stages,
+            "counters": counters,
+            "gauges": gauges,
+            "throughput": {
+                "calls_per_minute": round(processed / uptime * 60, 3) if uptime else 0.0,
+                "audio_minutes_per_hour": round(audio_seconds / 60 / uptime * 3600, 3) if uptime else 0.0,
+            },
+        }
+
+    def write_summary(self, path: Path = None) -> Path:
+        """Сохраняет снимок метрик в JSON (по умолчанию logs/metrics_<дата>_<pid>.json)"""
+        if path is None:
+            path = LOG_DIR / f"metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.json"
+
+        path = Path(path)
+        path.write_text(json.dumps(self.snapshot(), ensure_ascii=False, indent=2), encoding="utf-8")
+        return path
+
+    def to_prometheus(self, prefix: str = METRICS_PREFIX) -> str:
+        """Текущие метрики в текстовом формате Prometheus"""
+        return render_prometheus(self.snapshot(), prefix)
+
+
+def _metric_name(prefix: str, name: str) -> str:
+    """Имя метрики в допустимом для Prometheus виде"""
+    safe = "".join(ch if ch.isalnum() or ch == "_" else "_" for ch in name)
+    return f"{prefix}_{safe}"
+
+
+def render_prometheus(snapshot: dict, prefix: str = METRICS_PREFIX) -> str:
+    """Преобразует снимок метрик (MetricsRegistry.snapshot) в формат Prometheus"""
+    lines = []
+
+    stage_metric = f"{prefix}_stage_seconds"
+    if snapshot.get("stages"):
+        lines.append(f"# HELP {stage_metric} Длительность этапов пайплайна")
+        lines.append(f"# TYPE {stage_metric} summary")
+        for stage, stats in sorted(snapshot["stages"].items()):
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append(f'{stage_metric}{{stage="{stage}",quantile="{quantile}"}} {stats[key]}')
+            lines.append(f'{stage_metric}_sum{{stage="{stage}"}} {stats["sum"]}')
+            lines.append(f'{stage_metric}_count{{stage="{stage}"}} {stats["count"]}')
+
+    for name, value in sorted(snapshot.get("counters", {}).items()):
+        metric = _metric_name(prefix, name) + "_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+
+    for name, value in sorted(snapshot.get("gauges", {}).items()):
+        metric = _metric_name(prefix, name)
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {value}")
+
+    for name, value in sorted(snapshot.get("throughput", {}).items()):
+        metric = _metric_name(prefix, name)
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {value}")
+
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def load_summaries(limit: int = None) -> List[dict]:
+    """Читает сохраненные JSON снимки метрик из папки логов (новые в конце)
+
+    Args:
+        limit: Сколько последних снимков вернуть (по умолчанию все)
+    """
+    paths = sorted(LOG_DIR.glob("metrics_*.json"), key=lambda p: p.stat().st_mtime)
+    if limit:
+        paths = paths[-limit:]
+
+    summaries = []
+    for path in paths:
+        try:
+            summaries.append(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue
+    return summaries
+
+
+def load_latest_summary() -> Optional[dict]:
+    """Читает последний сохраненный JSON снимок метрик из папки логов"""
+    summaries = load_summaries(limit=1)
+    return summaries[-1] if summaries else None
+
+
+# Метрики текущего процесса
+metrics = MetricsRegistry()
@@ -0,0 +1,118 @@
+"""
+Тестовые данные для запусков без АТС и Yandex Cloud (--mock)
+
+Вынесено из main.py и reporter.py, чтобы faker и генераторы не
+загружались при обычном запуске.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from faker import Faker
+
+from database import SessionLocal, Call, CallStatus
+from logger import get_logger
+
+logger = get_logger("mock_data")
+
+fake = Faker("ru_RU")
+OPERATORS = ["Смирнова Анна", "Кузнецова Елена", "Васильева Мария"]
+
+
+def create_mock_data():
+    """Наполняет базу фейковыми звонками для теста"""
+    session = SessionLocal()
+    
+    if session.query(Call).count() > 0:
+        print("ℹ️ В базе уже есть данные. Используем их.")
+        session.close()
+        return
+
+    print("🎲 Генерирую 30 тестовых звонков...")
+    
+    for _ in range(30):
+        ai_mock = {
+            "greeting": random.randint(4, 10),
+            "greeting_comment": "Все ок",
+            "needs": random.randint(3, 9),
+            "needs_comment": "Мало вопросов",
+            "presentation": random.randint(4, 10),
+            "presentation_comment": "Хорошо",
+            "objection": random.randint(5, 10),
+            "objection_comment": "Справился",
+            "closing": random.randint(5, 10),
+            "closing_comment": "Записал",
+            "services_count": random.choice([0, 1, 1, 2]),
+            "bonus": random.choice([0, 0, 0, 500]),
+            "bonus_comment": "Бонус за сложность",
+            "summary": fake.sentence(nb_words=15), # Чуть длиннее текст
+            "recommendation": random.choice([
+                "Не перебивать клиента, выслушать до конца.",
+                "Предлагать доп. услуги (УЗИ, анализы) более настойчиво.",
+                "Говорить громче и увереннее, клиент переспрашивает.",
+                "Выучить прайс-лист, долгие паузы при поиске цены.",
+                "Отличная работа, эталонный диалог."
+            ])
+        }
+
+        call = Call(
+            id=str(random.randint(100000, 999999)),
+            date=datetime.now() - timedelta(days=random.randint(0, 14)),
+            operator=random.choice(OPERATORS),
+            duration=random.randint(60, 400),
+            status="PROCESSED",
+            ai_data=ai_mock
+        )
+        session.add(call)
+    
+    session.commit()
+    print("✅ Тестовые данные сохранены в calls.db")
+    session.close()
+
+
+def create_mock_calls(start_date: datetime, end_date: datetime, count: int = 15):
+    """Создаёт фейковые звонки в БД для mock-тестирования.
+    
+    Звонки создаются со статусом NEW в рамках указанного периода,
+    чтобы call_selector мог их найти и передать в processor.
+    """
+    session = SessionLocal()
+    
+    # Проверяем, есть ли уже звонки NEW за период
+    existing = session.query(Call).filter(
+        Call.status == CallStatus.NEW,
+        Call.date >= start_date,
+        Call.date <= end_date
+    ).count()
+    
+    if existing > 0:
+        logger.info(f"ℹ️ В БД уже есть {existing} звонков NEW за период. Пропускаем генерацию.")
+        session.close()
+        return
+    
+    logger.info(f"🎲 Генерируем {count} mock-звонков для периода {start_date.date()} - {end_date.date()}...")
+    
+    period_days = max(1, (end_date - start_date).days)
+    
+    for i in range(count):
+        call_date = start_date + timedelta(
+            days=random.randint(0, period_days - 1),
+            hours=random.randint(8, 18),
+            minutes=random.randint(0, 59)
+        )
+        
+        call = Call(
+            id=f"mock_{i}_{random.randint(10000, 99999)}",
+            date=call_date,
+            operator=random.choice(OPERATORS),
+            phone=f"+7-999-{random.randint(100,999)}-{random.randint(10,99)}-{random.randint(10,99)}",
+            duration=random.randint(90, 420),  # 1.5 - 7 минут
+            audio_url="mock://audio.mp3",
+            status=CallStatus.NEW,
+            ai_data={}
+        )
+        session.add(call)
+    
+    session.commit()
+    session.close()
+    logger.info(f"✅ Создано {count} mock-звонков\n")
@@ -0,0 +1,175 @@
+import math
+from typing import Dict, List
+
+from database import SessionLocal, Call, CallStatus
+from processor import STAGES, completed_stages
+from metrics import load_summaries
+from config import Config
+from logger import get_logger
+
+logger = get_logger("planner")
+
+# Сколько последних обработанных звонков брать для оценки скорости этапов
+HISTORY_CALLS = 500
+# Сколько последних снимков метрик брать для оценки итоговых рекомендаций
+HISTORY_SUMMARIES = 20
+# Шаг тарификации распознавания: длительность округляется вверх до него
+STT_BILLING_UNIT_SECONDS = 15
+
+
+def load_stage_history(limit: int = HISTORY_CALLS) -> dict:
+    """Скорость этапов и расход токенов по прошлым запускам
+
+    Этапы сильно зависят от длины звонка (загрузка, распознавание, длина
+    транскрипта в промпте), поэтому все считается на секунду аудио по
+    сохраненным stage_timings и gpt_tokens последних обработанных звонков.
+
+    Returns:
+        dict: stage_rates — сек. этапа на сек. аудио по этапам,
+              tokens_per_audio_second, summary_tokens — токены на одну
+              итоговую рекомендацию оператору, calls — размер выборки
+    """
+    session = SessionLocal()
+    try:
+        calls = session.query(Call.duration, Call.stage_timings, Call.gpt_tokens).filter(
+            Call.status == CallStatus.PROCESSED,
+            Call.stage_timings.isnot(None),
+            Call.duration > 0
+        ).order_by(Call.date.desc()).limit(limit).all()
+    finally:
+        session.close()
+
+    stage_seconds = {}
+    stage_audio = {}
+    tokens = 0
+    tokens_audio = 0
+    for duration, timings, gpt_tokens in calls:
+        for key, seconds in (timings or {}).items():
+            stage_seconds[key] = stage_seconds.get(key, 0.0) + seconds
+            stage_audio[key] = stage_audio.get(key, 0) + duration
+        if gpt_tokens:
+            tokens += gpt_tokens
+            tokens_audio += duration
+
+    summaries_count = 0
+    summaries_tokens = 0
+    for summary in load_summaries(limit=HISTORY_SUMMARIES):
+        counters = summary.get("counters", {})
+        summaries_count += counters.get("gpt_summaries", 0)
+        summaries_tokens += counters.get("gpt_summary_tokens", 0)
+
+    return {
+        "calls": len(calls),
+        "stage_rates": {
+            key: stage_seconds[key] / stage_audio[key]
+            for key in stage_seconds if stage_audio[key]
+        },
+        "tokens_per_audio_second": tokens / tokens_audio if tokens_audio else None,
+        "summary_tokens": summaries_tokens / summaries_count if summaries_count else None,
+    }
+
+
+def build_plan(calls: List[Call], history: dict, workers: int = None) -> dict:
+    """Оценивает запуск по выбранным звонкам без обращений к внешним API
+
+    Для начатых звонков учитываются только незавершенные этапы.
+    Звонки одного воркера проходят этапы последовательно, поэтому время
+    запуска — сумма времени этапов, деленная на число воркеров, а узкое
+    место — этап с наибольшей долей этой суммы.
+
+    Args:
+        calls: Звонки из select_balanced_calls
+        history: Результат load_stage_history
+        workers: Число параллельных воркеров (по умолчанию Config.WORKERS)
+
+    Returns:
+        dict: Ожидаемые время, минуты распознавания, токены и стоимость
+    """
+    workers = max(1, workers or Config.WORKERS)
+    rates = history["stage_rates"]
+
+    stage_seconds = {key: 0.0 for _, key in STAGES}
+    stage_audio = {key: 0 for _, key in STAGES}
+    stt_billed_seconds = 0
+    for call in calls:
+        duration = call.duration or 0
+        completed = completed_stages(call.status)
+        for _, key in STAGES:
+            if key in completed:
+                continue
+            stage_audio[key] += duration
+            stage_seconds[key] += duration * rates.get(key, 0.0)
+
+        if "transcribe" not in completed:
+            stt_billed_seconds += math.ceil(duration / STT_BILLING_UNIT_SECONDS) * STT_BILLING_UNIT_SECONDS
+
+    operators = {call.operator for call in calls}
+    score_tokens = stage_audio["score"] * (history["tokens_per_audio_second"] or 0)
+    summary_tokens = len(operators) * (history["summary_tokens"] or 0)
+    gpt_tokens = score_tokens + summary_tokens
+
+    stt_minutes = stt_billed_seconds / 60
+    stt_cost = stt_minutes * Config.SPEECHKIT_PRICE_PER_MINUTE
+    gpt_cost = gpt_tokens / 1000 * Config.GPT_PRICE_PER_1K_TOKENS
+
+    total_seconds = sum(stage_seconds.values())
+    bottleneck = max(stage_seconds, key=stage_seconds.get) if total_seconds else None
+
+    return {
+        "calls": len(calls),
+        "operators": len(operators),
+        "audio_minutes": sum(call.duration or 0 for call in calls) / 60,
+        "workers": workers,
+        "stage_seconds": stage_seconds,
+        "wall_seconds": total_seconds / workers,
+        "bottleneck": bottleneck,
+        "stt_minutes": stt_minutes,
+        "gpt_tokens": round(gpt_tokens),
+        "stt_cost": stt_cost,
+        "gpt_cost": gpt_cost,
+        "total_cost": stt_cost + gpt_cost,
+        "missing_history": [key for _, key in STAGES if stage_audio[key] and key not in rates],
+        "history_calls": history["calls"],
+    }
+
+
+def _format_duration(seconds: float) -> str:
+    """Секунды в вид "2 ч 05 мин" """
+    if seconds < 60:
+        return f"{seconds:.0f} сек"
+    minutes = round(seconds / 60)
+    if minutes < 60:
+        return f"{minutes} мин"
+    return f"{minutes // 60} ч {minutes % 60:02d} мин"
+
+
+def log_plan(plan: dict):
+    """Выводит план запуска в лог"""
+    logger.info(f"📞 Звонков к обработке: {plan['calls']} ({plan['operators']} операторов, "
+                f"{plan['audio_minutes']:.0f} мин аудио)")
+    logger.info(f"📚 История: {plan['history_calls']} обработанных звонков")
+
+    if plan["missing_history"]:
+        logger.warning(
+            f"⚠️ Нет истории по этапам: {', '.join(plan['missing_history'])} — "
+            f"время по ним не учтено, сделайте пробный запуск"
+        )
+
+    total = sum(plan["stage_seconds"].values())
+    for stage, seconds in plan["stage_seconds"].items():
+        share = seconds / total * 100 if total else 0
+        logger.info(f"   ⏱️ {stage}: {_format_duration(seconds)} ({share:.0f}%)")
+
+    logger.info(f"⏳ Ожидаемое время при {plan['workers']} воркерах: {_format_duration(plan['wall_seconds'])}")
+    if plan["bottleneck"]:
+        logger.info(f"🐢 Узкое место: {plan['bottleneck']}")
+    logger.info(f"🎙️ SpeechKit: {plan['stt_minutes']:.0f} мин, ~{plan['stt_cost']:.2f} руб.")
+    logger.info(f"🤖 YandexGPT: ~{plan['gpt_tokens']} токенов, ~{plan['gpt_cost']:.2f} руб.")
+    logger.info(f"💰 Итого: ~{plan['total_cost']:.2f} руб.")
+
+
+def plan_calls(calls: List[Call], workers: int = None) -> Dict:
+    """Строит и выводит план запуска по выбранным звонкам"""
+    plan = build_plan(calls, load_stage_history(), workers=workers)
+    log_plan(plan)
+    return plan
@@ -1,161 +1,327 @@
 import os
+import time
+from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional, Sized
 
-from database import SessionLocal, Call
+from database import SessionLocal, Call, CallStatus
 from config import Config
-from logger import logger
-from megafon import download_audio
-from yandex_speech import speech_client
-from yandex_gpt import gpt_client
+from logger import get_logger
+from failures import ProcessingError, describe_error
+from retry_scheduler import record_failure
+from metrics import metrics
+from tenants import get_tenant
+
+logger = get_logger("processor")
+# Шапка каждого звонка (в проде можно приглушить: LOG_LEVELS=processor.banner:WARNING)
+banner = get_logger("processor.banner")
+
+MOCK_AUDIO_PATH = "mock.mp3"
+
+# Клиенты API (и requests) загружаются при первом этапе, которому они
+# нужны, а не при импорте: planner.py и reporter.py --plan обходятся без
+# них. Дальше воркер переиспользует их для всех звонков
+_speech_client = None
+_gpt_client = None
+
+# Этапы пайплайна: статус, который получает звонок после этапа, и ключ в stage_timings
+STAGES = [
+    (CallStatus.DOWNLOADED, "download"),
+    (CallStatus.TRANSCRIBED, "transcribe"),
+    (CallStatus.SCORED, "score"),
+]
+
+
+def completed_stages(status: str) -> list[str]:
+    """Возвращает ключи этапов, уже завершенных для звонка с данным статусом"""
+    if status == CallStatus.PROCESSED:
+        return [key for _, key in STAGES]
+
+    completed = []
+    for stage_status, key in STAGES:
+        completed.append(key)
+        if stage_status == status:
+            return completed
+    return []
+
+
+def _save_stage(session, call: Call, status: str, stage_key: str, started: float, **fields):
+    """Фиксирует завершение этапа: статус, артефакты и время этапа"""
+    for name, value in fields.items():
+        setattr(call, name, value)
+
+    duration = time.monotonic() - started
+    metrics.observe(stage_key, duration)
+
+    timings = dict(call.stage_timings or {})
+    timings[stage_key] = round(duration, 3)
+    call.stage_timings = timings
+    call.status = status
+
+    with metrics.timer("db_commit"):
+        session.commit()
+
+    logger.debug(f"   ⏱️ Этап {stage_key}: {duration:.2f} с",
+                 extra={"call_id": call.id, "stage": stage_key, "duration": round(duration, 3)})
+
+
+def _get_speech_client():
+    """Клиент SpeechKit процесса (создается при первом распознавании)"""
+    global _speech_client
+    if _speech_client is None:
+        from yandex_speech import get_speech_client as create_client
+        _speech_client = create_client()
+    return _speech_client
+
+
+def _get_gpt_client():
+    """Клиент YandexGPT процесса (создается при первом анализе)"""
+    global _gpt_client
+    if _gpt_client is None:
+        from yandex_gpt import get_gpt_client as create_client
+        _gpt_client = create_client()
+    return _gpt_client
+
+
+def _remove_audio(audio_path: Optional[str]):
+    """Удаляет временный аудио файл, если он существует"""
+    if audio_path and audio_path != MOCK_AUDIO_PATH and Path(audio_path).exists():
+        os.remove(audio_path)
+        logger.info("🗑️  Временный аудио файл удален")
 
 
 def process_call(call: Call, use_mock: bool = False) -> bool:
     """Обрабатывает один звонок через весь пайплайн
-    
-    Шаги:
-    1. Скачивает аудио из АТС (если есть ссылка в ai_data)
-    2. Отправляет в SpeechSense для транскрибации и анализа эмоций
-    3. Анализирует через YandexGPT
-    4. Сохраняет результат в БД
-    5. Удаляет временный аудио файл
-    
+
+    Шаги (после каждого статус и промежуточный результат сохраняются в БД):
+    1. Скачивает аудио из АТС -> DOWNLOADED (путь к файлу)
+    2. Отправляет в SpeechKit для транскрибации -> TRANSCRIBED (транскрипт)
+    3. Анализирует через YandexGPT -> SCORED (ai_data)
+    4. Удаляет временный аудио файл -> PROCESSED
+
+    Если звонок уже прошел часть этапов (прошлый запуск упал),
+    обработка продолжается с первого незавершенного этапа.
+
+    При ошибке звонок становится FAILED (временная ошибка, будет повтор)
+    или DEAD (постоянная ошибка), см. retry_scheduler.record_failure.
+    Клиент звонка, не описанный в TENANTS_PATH, — ошибка настройки, а не
+    звонка: KeyError выходит наружу, попытка звонку не записывается.
+
     Args:
         call: Объект звонка из БД
         use_mock: Использовать моковые данные (для тестирования без API)
-        
+
     Returns:
         bool: True если обработка успешна
+
+    Raises:
+        KeyError: Клиента звонка нет в TENANTS_PATH
     """
+    # До try: иначе ошибка настройки ушла бы в record_failure и звонок — в DEAD
+    tenant = None if use_mock else get_tenant(call.tenant)
+
     session = SessionLocal()
-    
+    call_id = call.id
+    call_started = time.monotonic()
+
     try:
-        logger.info(f"\n{'='*60}")
-        logger.info(f"🔄 Обрабатываем звонок #{call.id}")
-        logger.info(f"   Оператор: {call.operator}")
-        logger.info(f"   Дата: {call.date.strftime('%d.%m.%Y %H:%M')}")
-        logger.info(f"   Длительность: {call.duration // 60}:{call.duration % 60:02d}")
-        logger.info(f"{'='*60}")
-        
+        session.add(call)
+
+        banner.info(f"\n{'='*60}")
+        banner.info(f"🔄 Обрабатываем звонок #{call.id}", extra={"call_id": call_id})
+        banner.info(f"   Оператор: {call.operator}")
+        banner.info(f"   Дата: {call.date.strftime('%d.%m.%Y %H:%M')}")
+        banner.info(f"   Длительность: {call.duration // 60}:{call.duration % 60:02d}")
+        if call.status != CallStatus.NEW:
+            banner.info(f"   ♻️ Продолжаем с этапа: {call.status}", extra={"call_id": call_id})
+        banner.info(f"{'='*60}")
+
+        # Скачанный файл мог быть удален между запусками — тогда качаем заново
+        if call.status == CallStatus.DOWNLOADED and not use_mock:
+            if not call.audio_path or not Path(call.audio_path).exists():
+                logger.warning("⚠️ Сохраненный аудио файл не найден, скачиваем заново")
+                call.status = CallStatus.NEW
+
         # Шаг 1: Получение аудио файла
-        audio_path = None
-        
-        if use_mock:
-            logger.info("🎭 РЕЖИМ ТЕСТИРОВАНИЯ: Используем mock данные")
-            audio_path = "mock.mp3"  # Фейковый путь
-        else:
-            # Получаем ссылку на аудио из БД
-            audio_url = call.audio_url
-            
-            if not audio_url:
-                logger.error("❌ Нет ссылки на аудио файл в БД")
-                return False
-            
-            # Скачиваем файл
-            Config.TEMP_AUDIO_PATH.mkdir(exist_ok=True)
-            audio_filename = f"call_{call.id}.mp3"
-            audio_path = Config.TEMP_AUDIO_PATH / audio_filename
-            
-            if not download_audio(audio_url, str(audio_path)):
-                logger.error("❌ Не удалось скачать аудио файл")
-                return False
-        
-        # Шаг 2: Анализ через SpeechSense
-        if use_mock:
-            speech_result = speech_client.analyze_audio_mock(str(audio_path))
-        else:
-            speech_result = speech_client.analyze_audio(str(audio_path))
-        
-        if not speech_result:
-            logger.error("❌ Не удалось проанализировать аудио через SpeechSense")
-            if audio_path and audio_path != "mock.mp3":
-                os.remove(audio_path)
-            return False
-        
+        if call.status == CallStatus.NEW:
+            started = time.monotonic()
+
+            if use_mock:
+                logger.info("🎭 РЕЖИМ ТЕСТИРОВАНИЯ: Используем mock данные")
+                audio_path = MOCK_AUDIO_PATH  # Фейковый путь
+            else:
+                # Получаем ссылку на аудио из БД
+                audio_url = call.audio_url
+
+                if not audio_url:
+                    logger.error("❌ Нет ссылки на аудио файл в БД")
+                    raise ProcessingError("Нет ссылки на аудио файл в БД", transient=False)
+
+                # Скачиваем файл (папка клиента: одинаковые callid у разных АТС не пересекаются)
+                from megafon import download_audio
+                audio_dir = Config.TEMP_AUDIO_PATH / tenant.name
+                audio_dir.mkdir(parents=True, exist_ok=True)
+                audio_filename = f"call_{call.id.replace(':', '_')}.mp3"
+                audio_path = str(audio_dir / audio_filename)
+
+                download_audio(audio_url, audio_path, raise_errors=True,
+                               key=tenant.megafon_key)
+
+            _save_stage(session, call, CallStatus.DOWNLOADED, "download", started,
+                        audio_path=audio_path)
+
+        # Шаг 2: Транскрибация через SpeechKit
+        if call.status == CallStatus.DOWNLOADED:
+            started = time.monotonic()
+
+            if use_mock:
+                from yandex_speech import YandexSpeechClient
+                speech_result = YandexSpeechClient.analyze_audio_mock(call.audio_path)
+                speech_error = None
+            else:
+                speech_client = _get_speech_client()
+                speech_result = speech_client.analyze_audio(call.audio_path)
+                speech_error = speech_client.last_error
+
+            if not speech_result:
+                logger.error("❌ Не удалось проанализировать аудио через SpeechSense")
+                raise describe_error(speech_error, "Не удалось распознать аудио")
+
+            _save_stage(session, call, CallStatus.TRANSCRIBED, "transcribe", started,
+                        transcript=speech_result.get("transcript", ""),
+                        speech_data={
+                            "sentiment": speech_result.get("sentiment", {}),
+                            "statistics": speech_result.get("statistics", {})
+                        })
+
         # Шаг 3: Анализ через YandexGPT
-        transcript = speech_result.get("transcript", "")
-        sentiment_data = {
-            "operator": speech_result.get("sentiment", {}).get("operator", "neutral"),
-            "client": speech_result.get("sentiment", {}).get("client", "neutral"),
-            "statistics": speech_result.get("statistics", {})
-        }
-        
-        gpt_result = gpt_client.analyze_call(transcript, sentiment_data)
-        
-        if not gpt_result:
-            logger.error("❌ Не удалось проанализировать звонок через GPT")
-            if audio_path and audio_path != "mock.mp3":
-                os.remove(audio_path)
-            return False
-        
-        # Шаг 4: Сохраняем результаты в БД
-        call.ai_data = gpt_result
-        call.status = "PROCESSED"
-        
-        session.add(call)
-        session.commit()
-        
-        logger.info("✅ Звонок успешно обработан и сохранен в БД")
-        
-        # Шаг 5: Удаляем временный файл
-        if audio_path and audio_path != "mock.mp3" and Path(audio_path).exists():
-            os.remove(audio_path)
-            logger.info("🗑️  Временный аудио файл удален")
-        
+        if call.status == CallStatus.TRANSCRIBED:
+            started = time.monotonic()
+
+            speech_data = call.speech_data or {}
+            sentiment_data = {
+                "operator": speech_data.get("sentiment", {}).get("operator", "neutral"),
+                "client": speech_data.get("sentiment", {}).get("client", "neutral"),
+                "statistics": speech_data.get("statistics", {})
+            }
+
+            gpt_client = _get_gpt_client()
+            gpt_result = gpt_client.analyze_call(call.transcript or "", sentiment_data)
+
+            if not gpt_result:
+                logger.error("❌ Не удалось проанализировать звонок через GPT")
+                raise describe_error(gpt_client.last_error, "Не удалось получить ответ от GPT")
+
+            _save_stage(session, call, CallStatus.SCORED, "score", started,
+                        ai_data=gpt_result,
+                        gpt_tokens=gpt_client.last_usage.get("total_tokens"))
+
+        # Шаг 4: Удаляем временный файл и завершаем обработку
+        _remove_audio(call.audio_path)
+
+        call.audio_path = None
+        call.status = CallStatus.PROCESSED
+        call.processed_at = datetime.now()
+        with metrics.timer("db_commit"):
+            session.commit()
+
+        call_duration = time.monotonic() - call_started
+        metrics.observe("call", call_duration)
+        metrics.inc("calls_processed")
+        metrics.inc("audio_seconds_processed", call.duration or 0)
+
+        logger.info("✅ Звонок успешно обработан и сохранен в БД",
+                    extra={"call_id": call_id, "operator": call.operator,
+                           "duration": round(call_duration, 3), "stages": call.stage_timings})
+
         return True
-        
+
+    except ProcessingError as e:
+        session.rollback()
+        metrics.inc("calls_failed")
+        record_failure(call_id, e)
+        return False
+
     except Exception as e:
-        logger.error(f"🔥 Критическая ошибка при обработке звонка: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        session.rollback()
+        logger.error(f"🔥 Критическая ошибка при обработке звонка: {e}",
+                     exc_info=True, extra={"call_id": call_id})
+        metrics.inc("calls_failed")
+        record_failure(call_id, describe_error(e, str(e)))
         return False
-        
+
     finally:
         session.close()
 
 
-def process_calls_batch(calls: list[Call], use_mock: bool = False) -> dict:
+def process_calls_batch(calls: Iterable[Call], use_mock: bool = False) -> dict:
     """Обрабатывает пакет звонков
-    
+
+    Звонки, прерванные прошлым запуском, продолжаются с сохраненного этапа.
+    Время этапов, которые не пришлось повторять, учитывается как экономия:
+    ускорение = (время запуска + сэкономленное время) / время запуска.
+
     Args:
-        calls: Список звонков для обработки
+        calls: Список звонков или итератор, выдающий звонки по одному
+            (например, захваченные из очереди work_queue.iter_claimed_calls)
         use_mock: Использовать моковые данные
-        
+
     Returns:
         dict: Статистика обработки
     """
-    total = len(calls)
+    planned = len(calls) if isinstance(calls, Sized) else None
+    total = 0
     successful = 0
     failed = 0
-    
-    logger.info(f"\n🚀 Начинаем обработку {total} звонков...")
-    
-    for i, call in enumerate(calls, 1):
-        logger.info(f"\n📍 Прогресс: {i}/{total}")
-        
+    resumed = 0
+    saved_seconds = 0.0
+
+    if planned is not None:
+        logger.info(f"\n🚀 Начинаем обработку {planned} звонков...")
+    else:
+        logger.info("\n🚀 Начинаем обработку звонков из очереди...")
+    batch_started = time.monotonic()
+
+    for call in calls:
+        total += 1
+        logger.info(f"\n📍 Прогресс: {total}/{planned if planned is not None else '?'}")
+
+        # Этапы, завершенные прошлым запуском, повторять не нужно
+        done_stages = completed_stages(call.status)
+        if done_stages:
+            resumed += 1
+            timings = call.stage_timings or {}
+            saved_seconds += sum(timings.get(key, 0) for key in done_stages)
+
         if process_call(call, use_mock=use_mock):
             successful += 1
         else:
             failed += 1
-            # Помечаем как FAILED в БД
-            session = SessionLocal()
-            try:
-                call.status = "FAILED"
-                session.add(call)
-                session.commit()
-            finally:
-                session.close()
-    
+
+    elapsed = time.monotonic() - batch_started
+    speedup = (elapsed + saved_seconds) / elapsed if elapsed > 0 else 1.0
+
     logger.info(f"\n{'='*60}")
-    logger.info(f"📊 ИТОГИ ОБРАБОТКИ:")
+    logger.info("📊 ИТОГИ ОБРАБОТКИ:")
     logger.info(f"   ✅ Успешно: {successful}")
     logger.info(f"   ❌ Ошибки: {failed}")
-    logger.info(f"   📈 Успешность: {successful/total*100:.1f}%")
+    if total:
+        logger.info(f"   📈 Успешность: {successful/total*100:.1f}%")
+    if resumed:
+        logger.info(f"   ♻️ Продолжено с чекпоинта: {resumed}")
+        logger.info(
+            f"   ⏱️ Сэкономлено: {saved_seconds:.1f} сек "
+            f"(ускорение x{speedup:.2f} относительно чистого запуска)"
+        )
     logger.info(f"{'='*60}\n")
-    
+
     return {
         "total": total,
         "successful": successful,
         "failed": failed,
-        "success_rate": successful / total if total > 0 else 0
+        "success_rate": successful / total if total > 0 else 0,
+        "resumed": resumed,
+        "elapsed_seconds": elapsed,
+        "saved_seconds": saved_seconds,
+        "speedup": speedup
     }
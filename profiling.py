@@ -0,0 +1,116 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from logger import LOG_DIR, get_logger
+
+logger = get_logger("profiling")
+
+# Сколько строк выводить в отчетах
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+
+
+class StepProfiler:
+    """Профилирование шагов запуска: CPU (cProfile) и память (tracemalloc)
+
+    Для каждого шага в logs/profile_<дата>/ пишутся:
+    - <шаг>.txt — топ функций по времени, топ мест аллокаций, пик памяти;
+    - <шаг>.prof — сырые данные cProfile (snakeviz, pstats);
+    а в summary.json — сводка по всем шагам для сравнения запусков.
+
+    Если профилирование выключено, step() ничего не делает.
+
+    Использование:
+        profiler = StepProfiler(enabled=True)
+        with profiler.step("selection"):
+            select_balanced_calls(...)
+    """
+
+    def __init__(self, enabled: bool = False, output_dir: Path = None):
+        self.enabled = enabled
+        self.output_dir = output_dir or LOG_DIR / f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.summary = {}
+
+        if self.enabled:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            logger.info(f"🔬 Профилирование включено, отчеты: {self.output_dir}")
+
+    @contextmanager
+    def step(self, name: str):
+        """Профилирует блок кода как шаг name"""
+        if not self.enabled:
+            yield
+            return
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(25)
+        tracemalloc.reset_peak()
+        snapshot_before = tracemalloc.take_snapshot()
+
+        profile = cProfile.Profile()
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            wall = time.perf_counter() - wall_started
+            cpu = time.process_time() - cpu_started
+
+            snapshot_after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+
+            self._write_step_report(name, profile, snapshot_before, snapshot_after,
+                                    wall, cpu, current, peak)
+
+    def _write_step_report(self, name, profile, snapshot_before, snapshot_after,
+                           wall, cpu, current, peak):
+        """Сохраняет отчет по шагу и обновляет summary.json"""
+        profile.dump_stats(str(self.output_dir / f"{name}.prof"))
+
+        stats_stream = io.StringIO()
+        stats = pstats.Stats(profile, stream=stats_stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+
+        allocations = snapshot_after.compare_to(snapshot_before, "lineno")[:TOP_ALLOCATIONS]
+
+        lines = [
+            f"Шаг: {name}",
+            f"Время (wall): {wall:.3f} с",
+            f"Время CPU: {cpu:.3f} с",
+            f"Пик памяти: {peak / 1024 / 1024:.2f} МБ",
+            f"Память в конце шага: {current / 1024 / 1024:.2f} МБ",
+            "",
+            f"=== Топ-{TOP_ALLOCATIONS} мест аллокаций (прирост за шаг) ===",
+        ]
+        lines.extend(str(stat) for stat in allocations)
+        lines.extend(["", f"=== Топ-{TOP_FUNCTIONS} функций (cumulative) ===", stats_stream.getvalue()])
+
+        report_path = self.output_dir / f"{name}.txt"
+        report_path.write_text("\n".join(lines), encoding="utf-8")
+
+        self.summary[name] = {
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "peak_memory_mb": round(peak / 1024 / 1024, 3),
+            "top_allocation": str(allocations[0]) if allocations else None,
+        }
+        (self.output_dir / "summary.json").write_text(
+            json.dumps(self.summary, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+
+        logger.info(
+            f"🔬 {name}: {wall:.2f}с (CPU {cpu:.2f}с), пик памяти "
+            f"{peak / 1024 / 1024:.1f} МБ -> {report_path.name}"
+        )
@@ -1,6 +1,10 @@
 import os
-from fastapi import FastAPI, Form, Request
+import time
+from fastapi import FastAPI, Form, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from database import SessionLocal, Call
+from tenants import DEFAULT_TENANT, configured_tenants, scoped_call_id
+from metrics import metrics, render_prometheus, load_latest_summary
 from datetime import datetime
 import uvicorn
 
@@ -8,6 +12,19 @@ app = FastAPI()
 
 @app.post("/")
 async def handle_megafon_webhook(request: Request):
+    return await _save_webhook_call(request, DEFAULT_TENANT)
+
+@app.post("/{tenant}")
+async def handle_tenant_webhook(tenant: str, request: Request):
+    """Вебхук АТС клиента из TENANTS_PATH (в АТС указывается адрес /<клиент>)"""
+    if tenant not in {item.name for item in configured_tenants()}:
+        raise HTTPException(status_code=404, detail=f"Неизвестный клиент: {tenant}")
+    return await _save_webhook_call(request, tenant)
+
+async def _save_webhook_call(request: Request, tenant: str):
+    started = time.monotonic()
+    metrics.inc("webhook_requests")
+
     form_data = await request.form()
     data = dict(form_data)
     
@@ -21,12 +38,15 @@ async def handle_megafon_webhook(request: Request):
 
     # Ловим только успешные звонки с записью
     if cmd == "history" and status == "Success" and link:
+        # Одинаковые callid у разных АТС — разные звонки
+        call_id = scoped_call_id(tenant, callid)
         session = SessionLocal()
         try:
-            exists = session.query(Call).filter(Call.id == callid).first()
+            exists = session.query(Call).filter(Call.id == call_id).first()
             if not exists:
                 new_call = Call(
-                    id=callid,
+                    id=call_id,
+                    tenant=tenant,
                     date=datetime.now(),
                     operator=user,
                     phone=phone,
@@ -36,16 +56,32 @@ async def handle_megafon_webhook(request: Request):
                     ai_data={}
                 )
                 session.add(new_call)
-                session.commit()
-                print(f"✅ УСПЕХ: Звонок {callid} сохранен в базу.")
+                with metrics.timer("webhook_db_commit"):
+                    session.commit()
+                metrics.inc("calls_received")
+                print(f"✅ УСПЕХ: Звонок {call_id} сохранен в базу.")
             else:
-                print(f"⚠️ Пропуск: Звонок {callid} уже в базе.")
+                metrics.inc("calls_duplicate")
+                print(f"⚠️ Пропуск: Звонок {call_id} уже в базе.")
         except Exception as e:
+            metrics.inc("webhook_errors")
             print(f"❌ Ошибка записи: {e}")
         finally:
             session.close()
     
+    metrics.observe("webhook", time.monotonic() - started)
     return {"status": "ok"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Метрики в формате Prometheus: вебхук (живые) и последний запуск обработки"""
+    text = metrics.to_prometheus()
+
+    last_run = load_latest_summary()
+    if last_run:
+        text += render_prometheus(last_run, prefix="speech_analysis_last_run")
+
+    return text
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""
+Несколько отчетов за один запуск: руководству и по группам операторов
+
+Отчеты описываются в REPORT_SPECS_PATH (JSON, см. reports.example.json):
+
+    [
+        {"name": "", "recipients": ["director@company.com"]},
+        {"name": "Группа Анны", "operators": ["Смирнова Анна", "Кузнецова Елена"],
+         "recipients": ["lead@company.com"]}
+    ]
+
+- name — часть имени файла (пусто — Report_<дата>.xlsx);
+- operators — операторы отчета (нет — все);
+- recipients — получатели (нет — EMAIL_TO);
+- period — "first_half"/"second_half" (нет — период запуска);
+- formats — форматы файлов: "xlsx", "html", "json" (нет — REPORT_FORMATS);
+- per_operator — {"Оператор": "email" или [email, ...]}: вместо одного
+  отчета — личный отчет каждому оператору из списка.
+
+У каждого клиента (tenants.py) свой файл описаний и свои отчеты:
+run_reports(..., tenant=...) берет только его звонки, а в имя файла
+добавляет имя клиента (кроме "default").
+
+Итоги (aggregation.aggregate_report) и итоговые рекомендации GPT
+считаются один раз на период и общие для всех отчетов, а файлы
+формируются параллельно в пуле процессов, поэтому время N отчетов
+определяется числом ядер, а не N.
+"""
+
+import importlib
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from aggregation import ReportSummary, aggregate_report, add_final_recommendations
+from config import Config
+from logger import get_logger, log_queue, use_parent_log_queue
+from tenants import DEFAULT_TENANT
+
+logger = get_logger("report_jobs")
+
+# Форматы отчета: расширение файла -> функция формирования (модуль, имя).
+# Импортируется в процессе пула, у всех одинаковые аргументы
+RENDERERS = {
+    "xlsx": ("main", "generate_excel"),
+    "html": ("html_report", "generate_html"),
+    "json": ("html_report", "generate_json"),
+}
+
+
+@dataclass
+class ReportSpec:
+    """Описание одного отчета"""
+    name: str = ""
+    operators: Optional[List[str]] = None
+    recipients: Optional[List[str]] = None
+    period: Optional[str] = None
+    formats: Optional[List[str]] = None
+
+
+def load_report_specs(path: Path = None) -> List[ReportSpec]:
+    """Отчеты из REPORT_SPECS_PATH; без файла — один общий отчет"""
+    path = Path(path or Config.REPORT_SPECS_PATH)
+    if not path.exists():
+        return [ReportSpec()]
+
+    with open(path, encoding="utf-8") as f:
+        specs = [spec for item in json.load(f) for spec in _expand_spec(item)]
+    if not specs:
+        raise ValueError(f"В {path} не описано ни одного отчета")
+    return specs
+
+
+def _expand_spec(item: dict) -> List[ReportSpec]:
+    """Описание из файла -> отчеты (per_operator — по одному на оператора)"""
+    item = dict(item)
+    per_operator = item.pop("per_operator", None)
+    if per_operator is None:
+        return [ReportSpec(**item)]
+
+    prefix = item.pop("name", "")
+    item.pop("operators", None)
+    item.pop("recipients", None)
+    return [
+        ReportSpec(name=f"{prefix} {operator}".strip(), operators=[operator],
+                   recipients=[recipients] if isinstance(recipients, str) else list(recipients),
+                   **item)
+        for operator, recipients in per_operator.items()
+    ]
+
+
+def parse_formats(value: str) -> List[str]:
+    """Форматы отчета из строки вида "xlsx,html"
+
+    Raises:
+        ValueError: Неизвестный формат
+    """
+    formats = [item.strip().lower() for item in value.split(",") if item.strip()]
+    unknown = [item for item in formats if item not in RENDERERS]
+    if unknown or not formats:
+        raise ValueError(
+            f"Неизвестный формат отчета: {', '.join(unknown) or value!r} "
+            f"(доступны: {', '.join(RENDERERS)})"
+        )
+    return formats
+
+
+def _output_filename(spec: ReportSpec, used: set, tenant: str = None) -> str:
+    """Уникальное в рамках запуска имя файла отчета (без расширения)"""
+    date_str = datetime.now().strftime("%d.%m.%y")
+    name = spec.name if tenant in (None, DEFAULT_TENANT) else f"{tenant} {spec.name}"
+    slug = re.sub(r"[^\w-]+", "_", name).strip("_")
+    base = f"Report_{date_str}_{slug}" if slug else f"Report_{date_str}"
+
+    filename = base
+    index = 2
+    while filename in used:
+        filename = f"{base}_{index}"
+        index += 1
+    used.add(filename)
+    return filename
+
+
+def _render_report(report_format: str, start_date: datetime, end_date: datetime,
+                   summary: ReportSummary, operators: Optional[List[str]],
+                   output_filename: str, tenant: Optional[str] = None) -> Optional[str]:
+    """Формирует один файл отчета (выполняется в процессе пула)"""
+    module, name = RENDERERS[report_format]
+    render = getattr(importlib.import_module(module), name)
+    return render(start_date, end_date, summary=summary, operators=operators,
+                  output_filename=output_filename, tenant=tenant)
+
+
+def run_reports(specs: List[ReportSpec], start_date: datetime, end_date: datetime,
+                processes: int = None, formats: List[str] = None,
+                tenant: str = None) -> List[Tuple[ReportSpec, List[Optional[str]]]]:
+    """Формирует отчеты по списку описаний
+
+    Args:
+        specs: Описания отчетов
+        start_date, end_date: Период запуска (для отчетов без своего period)
+        processes: Размер пула (по умолчанию REPORT_PROCESSES или число ядер)
+        formats: Форматы для отчетов без своих formats (по умолчанию REPORT_FORMATS)
+        tenant: Отчеты только по звонкам клиента (None — все звонки)
+
+    Returns:
+        list: (описание, пути к файлам по форматам, None — при ошибке) в порядке specs
+    """
+    from call_selector import get_period_dates
+
+    default_formats = formats or parse_formats(Config.REPORT_FORMATS)
+    spec_formats = [parse_formats(",".join(spec.formats)) if spec.formats else default_formats
+                    for spec in specs]
+
+    periods = [get_period_dates(spec.period) if spec.period else (start_date, end_date) for spec in specs]
+
+    # Итоги — один раз на период, рекомендации GPT — один раз на оператора
+    # (строки операторов общие у всех отчетов периода)
+    summaries = {period: aggregate_report(*period, tenant=tenant) for period in set(periods)}
+    for period, summary in summaries.items():
+        operator_lists = [spec.operators for spec, p in zip(specs, periods) if p == period]
+        if any(operators is None for operators in operator_lists):
+            add_final_recommendations(summary)
+        else:
+            add_final_recommendations(summary.for_operators(
+                {operator for operators in operator_lists for operator in operators}
+            ))
+
+    jobs = []
+    used_names = set()
+    for spec, period, report_formats in zip(specs, periods, spec_formats):
+        base = _output_filename(spec, used_names, tenant)
+        for report_format in report_formats:
+            jobs.append((
+                report_format, *period, summaries[period].for_operators(spec.operators),
+                spec.operators, f"{base}.{report_format}", tenant
+            ))
+
+    processes = min(len(jobs), processes or Config.REPORT_PROCESSES or os.cpu_count() or 1)
+    logger.info(f"📊 Отчетов: {len(specs)}, файлов: {len(jobs)}, процессов: {processes}")
+
+    if processes <= 1:
+        paths = []
+        for job in jobs:
+            try:
+                paths.append(_render_report(*job))
+            except Exception as e:
+                logger.error(f"❌ Не удалось сформировать {job[-2]}: {e}")
+                paths.append(None)
+    else:
+        # Дочерние процессы отправляют логи в очередь этого процесса
+        with ProcessPoolExecutor(max_workers=processes,
+                                 mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=use_parent_log_queue, initargs=(log_queue(),)) as pool:
+            futures = [pool.submit(_render_report, *job) for job in jobs]
+            paths = []
+            for job, future in zip(jobs, futures):
+                try:
+                    paths.append(future.result())
+                except Exception as e:
+                    logger.error(f"❌ Не удалось сформировать {job[-2]}: {e}")
+                    paths.append(None)
+
+    # Пути по отчетам в порядке их форматов
+    paths = iter(paths)
+    return [(spec, [next(paths) for _ in report_formats])
+            for spec, report_formats in zip(specs, spec_formats)]
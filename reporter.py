@@ -10,80 +10,106 @@
 1. Определяет период анализа
 2. Выбирает 2000 минут звонков (равномерно между операторами)
 3. Обрабатывает через SpeechSense + YandexGPT
-4. Генерирует Excel отчет
+   (с --report-only шаги 2-3 пропускаются: звонки в течение периода
+   обрабатывает daemon.py)
+4. Генерирует отчет (Excel, по настройке также HTML и JSON)
 5. Отправляет на email
+
+Клиенты (tenants.py) обрабатываются в одном запуске: выбор — по цели
+каждого клиента, обработка — общей очередью, отчеты и письма — свои.
+
+Модули с тяжелыми зависимостями (SQLAlchemy, openpyxl, requests)
+импортируются внутри plan() и main(), поэтому --help и ошибки в
+аргументах не ждут их загрузки (бюджет — benchmarks/bench_import.py).
 """
 
 import sys
-import random
-from datetime import datetime, timedelta
-
-from database import init_db, SessionLocal, Call
-from call_selector import select_balanced_calls, get_period_dates
-from processor import process_calls_batch
-from main import generate_excel
-from email_sender import send_report
-from logger import logger
+
+from logger import get_logger
+from metrics import metrics
 from config import Config
 
-OPERATORS = ["Смирнова Анна", "Кузнецова Елена", "Васильева Мария"]
+logger = get_logger("reporter")
+
+USAGE = """Использование: python reporter.py [опции]
+
+  --first-half, --second-half  Период (по умолчанию — по текущей дате)
+  --mock, -m                   Mock данные вместо АТС и Yandex Cloud
+  --deadline ЧЧ:ММ             Дедлайн обработки (PROCESSING_DEADLINE)
+  --formats xlsx,html,json     Форматы отчета (REPORT_FORMATS)
+  --profile                    Профилирование шагов (logs/profile_*/)
+  --report-only                Только отчет: звонки уже обработал daemon.py
+  --tenant ИМЯ                 Только один клиент из TENANTS_PATH
+  --plan [--workers N]         Оценка запуска без обработки
+  --help, -h                   Эта справка
+"""
+
+
+def _select_tenants(tenant_name: str = None) -> list:
+    """Клиенты запуска: все из TENANTS_PATH или один (--tenant)"""
+    from tenants import get_tenant, load_tenants
+    tenants = load_tenants()
+    return [get_tenant(tenant_name, tenants)] if tenant_name else tenants
 
 
-def _create_mock_calls(start_date: datetime, end_date: datetime, count: int = 15):
-    """Создаёт фейковые звонки в БД для mock-тестирования.
+def plan(period_type: str = "auto", workers: int = None, tenant_name: str = None) -> bool:
+    """Оценка запуска без обработки (--plan)
     
-    Звонки создаются со статусом NEW в рамках указанного периода,
-    чтобы call_selector мог их найти и передать в processor.
+    Выбирает звонки так же, как основной запуск, и по истории прошлых
+    запусков оценивает время, минуты SpeechKit, токены GPT и стоимость.
+    Внешние API не вызываются, очередь не меняется.
     """
-    session = SessionLocal()
-    
-    # Проверяем, есть ли уже звонки NEW за период
-    existing = session.query(Call).filter(
-        Call.status == "NEW",
-        Call.date >= start_date,
-        Call.date <= end_date
-    ).count()
+    from database import init_db
+    from call_selector import select_balanced_calls, get_period_dates
+    from planner import plan_calls
     
-    if existing > 0:
-        logger.info(f"ℹ️ В БД уже есть {existing} звонков NEW за период. Пропускаем генерацию.")
-        session.close()
-        return
-    
-    logger.info(f"🎲 Генерируем {count} mock-звонков для периода {start_date.date()} - {end_date.date()}...")
+    logger.info("🧮 ПЛАН ЗАПУСКА (без обработки)")
+    logger.info("-" * 70)
     
-    period_days = max(1, (end_date - start_date).days)
+    init_db()
+    start_date, end_date = get_period_dates(period_type)
+    logger.info(f"📅 Период: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}")
     
-    for i in range(count):
-        call_date = start_date + timedelta(
-            days=random.randint(0, period_days - 1),
-            hours=random.randint(8, 18),
-            minutes=random.randint(0, 59)
-        )
-        
-        call = Call(
-            id=f"mock_{i}_{random.randint(10000, 99999)}",
-            date=call_date,
-            operator=random.choice(OPERATORS),
-            phone=f"+7-999-{random.randint(100,999)}-{random.randint(10,99)}-{random.randint(10,99)}",
-            duration=random.randint(90, 420),  # 1.5 - 7 минут
-            audio_url="mock://audio.mp3",
-            status="NEW",
-            ai_data={}
-        )
-        session.add(call)
+    selected_calls = [
+        call
+        for tenant in _select_tenants(tenant_name)
+        for call in select_balanced_calls(start_date, end_date, tenant.minutes_target, tenant=tenant.name)
+    ]
+    if not selected_calls:
+        logger.info("ℹ️ Нет звонков для обработки")
+        return True
     
-    session.commit()
-    session.close()
-    logger.info(f"✅ Создано {count} mock-звонков\n")
+    plan_calls(selected_calls, workers=workers)
+    return True
 
 
-def main(use_mock: bool = False, period_type: str = "auto"):
+def main(use_mock: bool = False, period_type: str = "auto", profile: bool = False,
+         deadline: str = None, formats: list = None, report_only: bool = False,
+         tenant_name: str = None):
     """Главная функция генерации отчета
     
     Args:
         use_mock: Использовать mock данные для тестирования
         period_type: "first_half", "second_half" или "auto"
+        profile: Профилировать шаги (CPU и память), отчеты в logs/profile_*/
+        deadline: Дедлайн обработки "ЧЧ:ММ" (по умолчанию Config.PROCESSING_DEADLINE)
+        formats: Форматы файлов отчета (по умолчанию Config.REPORT_FORMATS)
+        report_only: Без выбора и обработки звонков — их обрабатывает daemon.py
+        tenant_name: Только этот клиент (по умолчанию — все из TENANTS_PATH)
     """
+    from database import init_db
+    from call_selector import select_balanced_calls, get_period_dates
+    from work_queue import enqueue_calls, make_batch_id
+    from worker import drain_batch
+    from scheduler import interleave_by_operator, parse_deadline, processed_minutes_by_operator
+    from report_jobs import ReportSpec, load_report_specs, run_reports
+    from email_sender import Delivery, default_recipients, send_reports
+    from tenants import DEFAULT_TENANT
+    from profiling import StepProfiler
+    from rollup import count_calls
+    
+    profiler = StepProfiler(enabled=profile)
+    
     logger.info("\n" + "="*70)
     logger.info("🚀 ЗАПУСК СИСТЕМЫ АНАЛИЗА ЗВОНКОВ")
     logger.info("="*70 + "\n")
@@ -92,9 +118,10 @@ def main(use_mock: bool = False, period_type: str = "auto"):
         # Валидируем конфигурацию
         logger.info("🔧 Проверяем конфигурацию...")
         Config.validate()
+        tenants = _select_tenants(tenant_name)
         logger.info("✅ Конфигурация в порядке\n")
         
-    except ValueError as e:
+    except (KeyError, ValueError) as e:
         logger.error(f"❌ {e}")
         return False
     
@@ -108,54 +135,137 @@ def main(use_mock: bool = False, period_type: str = "auto"):
     period_text = f"{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}"
     
     # В режиме mock — создаём фейковые звонки в БД для текущего периода
-    if use_mock:
-        _create_mock_calls(start_date, end_date)
-    
-    # Шаг 1: Выбор звонков
-    logger.info("📋 ШАГ 1: Выбор звонков для анализа")
-    logger.info("-" * 70)
-    
-    selected_calls = select_balanced_calls(start_date, end_date)
-    
-    if not selected_calls:
-        logger.error("❌ Нет звонков для обработки. Завершение.")
-        return False
-    
-    logger.info(f"✅ Выбрано {len(selected_calls)} звонков\n")
-    
-    # Шаг 2: Обработка звонков
-    logger.info("🤖 ШАГ 2: Обработка через SpeechSense + YandexGPT")
-    logger.info("-" * 70)
-    
-    stats = process_calls_batch(selected_calls, use_mock=use_mock)
-    
-    if stats['successful'] == 0:
-        logger.error("❌ Ни один звонок не был обработан успешно. Завершение.")
-        return False
-    
-    logger.info(f"✅ Обработано {stats['successful']} звонков\n")
+    if use_mock and not report_only:
+        from mock_data import create_mock_calls
+        create_mock_calls(start_date, end_date)
+    
+    if report_only:
+        # Звонки обработал daemon.py — только собираем отчет
+        logger.info("📋 ШАГИ 1-2: звонки обработаны заранее (daemon.py), только отчет")
+        logger.info("-" * 70)
+        processed = sum(count_calls(start_date, end_date, tenant=tenant.name) for tenant in tenants)
+        if not processed:
+            logger.error("❌ За период нет обработанных звонков. Завершение.")
+            return False
+        stats = {"total": processed, "successful": processed}
+        logger.info(f"✅ Обработанных звонков за период: {processed}\n")
+    else:
+        # Шаг 1: Выбор звонков
+        logger.info("📋 ШАГ 1: Выбор звонков для анализа")
+        logger.info("-" * 70)
+        
+        # Ставим выбранные звонки в очередь: их могут разбирать и воркеры (worker.py).
+        # Порядок — по кругу между операторами, чтобы прерванная по дедлайну
+        # обработка оставляла равномерное покрытие. У каждого клиента свой
+        # пакет; очередь выдает звонки пакетов по очереди
+        batch_ids = []
+        selected = already_processed = 0
+        with profiler.step("selection"):
+            for tenant in tenants:
+                selected_calls = select_balanced_calls(start_date, end_date, tenant.minutes_target,
+                                                       tenant=tenant.name)
+                already_processed += count_calls(start_date, end_date, tenant=tenant.name)
+                
+                batch_id = make_batch_id(start_date, end_date, tenant.name)
+                enqueue_calls(
+                    interleave_by_operator(selected_calls, processed_minutes_by_operator(batch_id)),
+                    batch_id
+                )
+                batch_ids.append(batch_id)
+                selected += len(selected_calls)
+                if len(tenants) > 1:
+                    logger.info(f"   {tenant.name}: выбрано {len(selected_calls)} звонков")
+        
+        if not selected and not already_processed:
+            logger.error("❌ Нет звонков для обработки. Завершение.")
+            return False
+        
+        logger.info(f"✅ Выбрано {selected} звонков\n")
+        
+        # Шаг 2: Обработка звонков
+        logger.info("🤖 ШАГ 2: Обработка через SpeechSense + YandexGPT")
+        logger.info("-" * 70)
+        
+        processing_deadline = parse_deadline(deadline if deadline is not None else Config.PROCESSING_DEADLINE)
+        if processing_deadline:
+            logger.info(f"⏰ Дедлайн обработки: {processing_deadline.strftime('%H:%M')}")
+        
+        with profiler.step("processing"):
+            stats = drain_batch(batch_ids, use_mock=use_mock, deadline=processing_deadline)
+        
+        if stats["deadline_reached"]:
+            logger.warning("⏰ Обработка остановлена по дедлайну, отчет по частичному покрытию:")
+            for batch_id in batch_ids:
+                coverage = processed_minutes_by_operator(batch_id)
+                for operator, minutes in sorted(coverage.items()):
+                    logger.warning(f"   {operator}: {minutes:.1f} мин")
+        
+        if sum(count_calls(start_date, end_date, tenant=tenant.name) for tenant in tenants) == 0:
+            logger.error("❌ Ни один звонок не был обработан успешно. Завершение.")
+            return False
+        
+        logger.info(f"✅ Обработано {stats['successful']} звонков\n")
     
-    # Шаг 3: Генерация Excel
-    logger.info("📊 ШАГ 3: Генерация Excel отчета")
+    # Шаг 3: Генерация отчетов
+    logger.info("📊 ШАГ 3: Генерация отчета")
     logger.info("-" * 70)
     
-    excel_path = generate_excel()
-    
-    if not excel_path:
-        logger.error("❌ Не удалось создать Excel отчет. Завершение.")
+    # Отчеты руководству и по группам операторов (REPORT_SPECS_PATH),
+    # у каждого клиента — по своим звонкам и своему файлу описаний
+    reports = []
+    with profiler.step("generate_excel"):
+        for tenant in tenants:
+            specs = load_report_specs(tenant.report_specs_path) if tenant.report_specs_path else [ReportSpec()]
+            reports += [(tenant, spec, paths) for spec, paths in
+                        run_reports(specs, start_date, end_date, formats=formats, tenant=tenant.name)]
+    
+    created = [(tenant, spec, [path for path in paths if path]) for tenant, spec, paths in reports]
+    created = [(tenant, spec, paths) for tenant, spec, paths in created if paths]
+    files_total = sum(len(paths) for _, _, paths in reports)
+    files_created = sum(len(paths) for _, _, paths in created)
+    if not created:
+        logger.error("❌ Не удалось создать отчет. Завершение.")
         return False
+    if files_created < files_total:
+        logger.error(f"❌ Создано файлов отчета: {files_created} из {files_total}")
     
-    logger.info(f"✅ Отчет создан: {excel_path}\n")
+    for _, _, paths in created:
+        for path in paths:
+            logger.info(f"✅ Отчет создан: {path}")
+    logger.info("")
     
     # Шаг 4: Отправка на email
     logger.info("📧 ШАГ 4: Отправка отчета на email")
     logger.info("-" * 70)
     
-    if Config.EMAIL_TO and Config.SMTP_USER:
-        if send_report(excel_path, period_text=period_text):
-            logger.info("✅ Отчет отправлен\n")
-        else:
-            logger.warning("⚠️ Отчет создан, но не отправлен (проверьте настройки SMTP)\n")
+    if Config.SMTP_USER:
+        with profiler.step("send_report"):
+            # Все письма — через одно SMTP соединение
+            deliveries = []
+            for tenant, spec, paths in created:
+                recipients = spec.recipients or tenant.email_to or []
+                # EMAIL_TO — получатели клиента "default": отчет другой клиники им не уходит
+                if not recipients and tenant.name != DEFAULT_TENANT:
+                    logger.warning(f"⚠️ У клиента {tenant.name} не указаны получатели (email_to) — "
+                                   f"{', '.join(paths)} не отправлен")
+                    continue
+                if not recipients and not default_recipients():
+                    logger.info(f"ℹ️ Для {', '.join(paths)} не указаны получатели, пропускаем отправку")
+                    continue
+                spec_period_text = period_text
+                if spec.period:
+                    spec_start, spec_end = get_period_dates(spec.period)
+                    spec_period_text = f"{spec_start.strftime('%d.%m.%Y')} - {spec_end.strftime('%d.%m.%Y')}"
+                deliveries.append(Delivery(files=paths, recipients=recipients,
+                                           period_text=spec_period_text, name=spec.name))
+            
+            for delivery, sent in zip(deliveries, send_reports(deliveries)):
+                path = ", ".join(delivery.files)
+                if sent:
+                    logger.info(f"✅ Отчет {path} отправлен")
+                else:
+                    logger.warning(f"⚠️ Отчет {path} создан, но не отправлен (проверьте настройки SMTP)")
+            logger.info("")
     else:
         logger.info("ℹ️ Email не настроен, пропускаем отправку\n")
     
@@ -165,13 +275,19 @@ def main(use_mock: bool = False, period_type: str = "auto"):
     logger.info("="*70)
     logger.info(f"📅 Период: {period_text}")
     logger.info(f"📞 Обработано звонков: {stats['successful']}/{stats['total']}")
-    logger.info(f"📄 Файл отчета: {excel_path}")
+    for _, _, paths in created:
+        for path in paths:
+            logger.info(f"📄 Файл отчета: {path}")
     logger.info("="*70 + "\n")
     
-    return True
+    return files_created == files_total
 
 
 if __name__ == "__main__":
+    if "--help" in sys.argv or "-h" in sys.argv:
+        print(USAGE)
+        sys.exit(0)
+    
     # Парсим аргументы командной строки
     use_mock = "--mock" in sys.argv or "-m" in sys.argv
     
@@ -184,6 +300,44 @@ if __name__ == "__main__":
     if use_mock:
         logger.info("🎭 РЕЖИМ ТЕСТИРОВАНИЯ: Используются mock данные\n")
     
-    success = main(use_mock=use_mock, period_type=period_type)
+    profile = "--profile" in sys.argv
+    
+    deadline = None
+    if "--deadline" in sys.argv:
+        index = sys.argv.index("--deadline")
+        if index + 1 < len(sys.argv):
+            deadline = sys.argv[index + 1]
+    
+    formats = None
+    if "--formats" in sys.argv:
+        index = sys.argv.index("--formats")
+        if index + 1 < len(sys.argv):
+            from report_jobs import parse_formats
+            formats = parse_formats(sys.argv[index + 1])
+    
+    tenant_name = None
+    if "--tenant" in sys.argv:
+        index = sys.argv.index("--tenant")
+        if index + 1 < len(sys.argv):
+            tenant_name = sys.argv[index + 1]
+    
+    if "--plan" in sys.argv:
+        workers = None
+        if "--workers" in sys.argv:
+            index = sys.argv.index("--workers")
+            if index + 1 < len(sys.argv):
+                workers = int(sys.argv[index + 1])
+        sys.exit(0 if plan(period_type=period_type, workers=workers, tenant_name=tenant_name) else 1)
+    
+    success = main(use_mock=use_mock, period_type=period_type, profile=profile, deadline=deadline,
+                   formats=formats, report_only="--report-only" in sys.argv, tenant_name=tenant_name)
+    
+    # Сводка метрик запуска: время этапов, запросы к API, очередь
+    for stage, stage_stats in metrics.snapshot()["stages"].items():
+        logger.info(
+            f"⏱️ {stage}: p50 {stage_stats['p50']:.2f}с, p95 {stage_stats['p95']:.2f}с, "
+            f"p99 {stage_stats['p99']:.2f}с ({stage_stats['count']} шт.)"
+        )
+    logger.info(f"📈 Метрики запуска сохранены: {metrics.write_summary()}")
     
     sys.exit(0 if success else 1)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Повторная обработка звонков после ошибок
+
+Ошибка обработки классифицируется (failures.py):
+- временная (таймаут, 5xx, rate limit) -> FAILED с next_retry_at,
+  пауза растет экспоненциально с каждой попыткой;
+- постоянная или исчерпан лимит попыток -> DEAD (dead-letter),
+  последняя ошибка хранится в last_error.
+
+Проход повторов возвращает FAILED звонки, у которых наступил next_retry_at,
+в очередь — на последний завершенный этап (промежуточные результаты
+сохраняются, см. processor.py).
+
+Запуск:
+    python retry_scheduler.py              # вернуть в очередь звонки, готовые к повтору
+    python retry_scheduler.py --dead       # показать dead-letter
+    python retry_scheduler.py --revive ID  # вернуть звонок из dead-letter
+"""
+
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+
+from database import init_db, SessionLocal, Call, CallStatus
+from failures import ProcessingError
+from work_queue import batch_filter
+from config import Config
+from logger import get_logger
+from metrics import metrics
+
+logger = get_logger("retry_scheduler")
+
+
+def get_backoff_seconds(attempts: int) -> float:
+    """Пауза перед повтором: base * 2^(attempts-1), не больше максимума, с джиттером ±20%"""
+    delay = Config.RETRY_BACKOFF_SECONDS * (2 ** max(0, attempts - 1))
+    delay = min(delay, Config.RETRY_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def infer_resume_status(call: Call) -> str:
+    """Определяет этап, с которого продолжить звонок, по сохраненным результатам"""
+    if call.ai_data:
+        return CallStatus.SCORED
+    if call.transcript is not None:
+        return CallStatus.TRANSCRIBED
+    if call.audio_path:
+        return CallStatus.DOWNLOADED
+    return CallStatus.NEW
+
+
+def record_failure(call_id: str, error: ProcessingError) -> str:
+    """Фиксирует ошибку обработки звонка и планирует повтор
+
+    Returns:
+        str: Новый статус звонка (FAILED или DEAD)
+    """
+    session = SessionLocal()
+    try:
+        call = session.get(Call, call_id)
+        call.attempts = (call.attempts or 0) + 1
+        call.last_error = str(error)[:2000]
+
+        if error.transient and call.attempts < Config.CALL_MAX_ATTEMPTS:
+            delay = get_backoff_seconds(call.attempts)
+            call.status = CallStatus.FAILED
+            call.next_retry_at = datetime.now() + timedelta(seconds=delay)
+            metrics.inc("call_retries_scheduled")
+            logger.warning(
+                f"🔁 Звонок #{call_id}: временная ошибка (попытка {call.attempts}/"
+                f"{Config.CALL_MAX_ATTEMPTS}), повтор через {delay:.0f} сек",
+                extra={"call_id": call_id, "attempt": call.attempts, "error": str(error)}
+            )
+        else:
+            reason = "постоянная ошибка" if not error.transient else "исчерпаны попытки"
+            call.status = CallStatus.DEAD
+            call.next_retry_at = None
+            metrics.inc("calls_dead")
+            logger.error(f"💀 Звонок #{call_id} перемещен в dead-letter ({reason}): {error}",
+                         extra={"call_id": call_id, "attempt": call.attempts, "error": str(error)})
+
+            # Аудио больше не понадобится
+            if call.audio_path and Path(call.audio_path).exists():
+                Path(call.audio_path).unlink()
+            call.audio_path = None
+
+        session.commit()
+        return call.status
+    finally:
+        session.close()
+
+
+def requeue_due_calls(batch_id: Union[str, Iterable[str]] = None) -> int:
+    """Возвращает в очередь FAILED звонки, для которых наступило время повтора
+
+    Args:
+        batch_id: Ограничить пакетом или списком пакетов (по умолчанию — все звонки)
+
+    Returns:
+        int: Количество возвращенных звонков
+    """
+    session = SessionLocal()
+    try:
+        query = session.query(Call).filter(
+            Call.status == CallStatus.FAILED,
+            Call.next_retry_at <= datetime.now()
+        )
+        if batch_id:
+            query = query.filter(batch_filter(batch_id))
+
+        calls = query.all()
+        for call in calls:
+            call.status = infer_resume_status(call)
+            call.next_retry_at = None
+            call.lease_owner = None
+            call.lease_expires_at = None
+
+        session.commit()
+
+        if calls:
+            metrics.inc("calls_requeued", len(calls))
+            logger.info(f"🔁 Возвращено в очередь после ошибок: {len(calls)}")
+        return len(calls)
+    finally:
+        session.close()
+
+
+def get_next_retry_time(batch_id: Union[str, Iterable[str]]) -> Optional[datetime]:
+    """Ближайшее время повтора среди FAILED звонков пакета"""
+    session = SessionLocal()
+    try:
+        call = session.query(Call).filter(
+            batch_filter(batch_id),
+            Call.status == CallStatus.FAILED,
+            Call.next_retry_at.isnot(None)
+        ).order_by(Call.next_retry_at).first()
+        return call.next_retry_at if call else None
+    finally:
+        session.close()
+
+
+def get_dead_letters(batch_id: str = None) -> List[Call]:
+    """Возвращает звонки из dead-letter"""
+    session = SessionLocal()
+    try:
+        query = session.query(Call).filter(Call.status == CallStatus.DEAD)
+        if batch_id:
+            query = query.filter(Call.batch_id == batch_id)
+        return query.order_by(Call.date).all()
+    finally:
+        session.close()
+
+
+def revive_call(call_id: str) -> bool:
+    """Возвращает звонок из dead-letter в очередь со сброшенным счетчиком попыток"""
+    session = SessionLocal()
+    try:
+        call = session.get(Call, call_id)
+        if not call or call.status != CallStatus.DEAD:
+            logger.error(f"❌ Звонок #{call_id} не найден в dead-letter")
+            return False
+
+        call.status = infer_resume_status(call)
+        call.attempts = 0
+        call.next_retry_at = None
+        session.commit()
+
+        logger.info(f"✅ Звонок #{call_id} возвращен в очередь ({call.status})")
+        return True
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    init_db()
+
+    if "--dead" in sys.argv:
+        dead = get_dead_letters()
+        print(f"💀 Dead-letter: {len(dead)} звонков")
+        for call in dead:
+            print(f"  #{call.id} | {call.operator} | {call.date:%d.%m.%Y %H:%M} | "
+                  f"попыток: {call.attempts or 0} | {call.last_error}")
+    elif "--revive" in sys.argv:
+        index = sys.argv.index("--revive")
+        if index + 1 >= len(sys.argv):
+            print("Укажите ID звонка: python retry_scheduler.py --revive ID")
+            sys.exit(1)
+        sys.exit(0 if revive_call(sys.argv[index + 1]) else 1)
+    else:
+        requeue_due_calls()
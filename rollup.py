@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Сводка звонков по (клиент, оператор, день, статус) — таблица call_rollup
+
+Сводка обновляется автоматически при каждом изменении звонков через
+SessionLocal (см. database.CallRollup). Массовые изменения в обход ORM
+(ручные UPDATE в БД, импорт) ее не обновляют — тогда сводку нужно
+проверить и перестроить.
+
+Запуск:
+    python rollup.py            # проверить сводку против таблицы calls
+    python rollup.py --rebuild  # перестроить сводку по calls
+"""
+
+import sys
+from datetime import datetime, time
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import delete, func
+
+from database import init_db, SessionLocal, Call, CallRollup, CallStatus
+from config import Config
+from logger import get_logger
+from tenants import DEFAULT_TENANT
+
+logger = get_logger("rollup")
+
+
+def _covers_whole_days(start_date: datetime, end_date: datetime) -> bool:
+    """True если период состоит из целых дней (как у get_period_dates)"""
+    return start_date.time() == time.min and end_date.time() >= time(23, 59, 59)
+
+
+def operator_totals(start_date: datetime, end_date: datetime,
+                    statuses: Iterable[str], tenant: Optional[str] = None) -> Dict[str, Tuple[int, int]]:
+    """Количество и длительность звонков периода по операторам
+
+    Для периода из целых дней считается по сводке, иначе — по calls.
+
+    Args:
+        statuses: Учитываемые статусы
+        tenant: Только звонки клиента (None — всех клиентов)
+
+    Returns:
+        dict: {оператор: (звонков, секунд)}
+    """
+    statuses = tuple(statuses)
+    session = SessionLocal()
+    try:
+        if _covers_whole_days(start_date, end_date):
+            query = session.query(
+                CallRollup.operator, func.sum(CallRollup.calls), func.sum(CallRollup.duration)
+            ).filter(
+                CallRollup.day >= start_date.date(),
+                CallRollup.day <= end_date.date(),
+                CallRollup.status.in_(statuses)
+            )
+            if tenant is not None:
+                query = query.filter(CallRollup.tenant == tenant)
+            rows = query.group_by(CallRollup.operator).all()
+        else:
+            query = session.query(
+                Call.operator, func.count(Call.id), func.sum(Call.duration)
+            ).filter(
+                Call.date >= start_date,
+                Call.date <= end_date,
+                Call.status.in_(statuses)
+            )
+            if tenant is not None:
+                query = query.filter(Call.tenant == tenant)
+            rows = query.group_by(Call.operator).all()
+
+        # Строки с нулем звонков остаются в сводке после смены статуса
+        return {
+            (operator or None): (calls or 0, seconds or 0)
+            for operator, calls, seconds in rows if calls
+        }
+    finally:
+        session.close()
+
+
+def operator_status_seconds(start_date: datetime, end_date: datetime,
+                            tenant: Optional[str] = None) -> Dict[str, Tuple[int, int]]:
+    """Секунды необработанных и обработанных звонков периода по операторам
+
+    Необработанные — CallStatus.PENDING, включая FAILED, ждущие повтора:
+    они уже выбраны и займут квоту, когда будут обработаны.
+
+    Args:
+        tenant: Только звонки клиента (None — всех клиентов)
+
+    Returns:
+        dict: {оператор: (секунд необработанных, секунд обработанных)}
+    """
+    pending = operator_totals(start_date, end_date, CallStatus.PENDING, tenant)
+    processed = operator_totals(start_date, end_date, (CallStatus.PROCESSED,), tenant)
+
+    return {
+        operator: (pending.get(operator, (0, 0))[1], processed.get(operator, (0, 0))[1])
+        for operator in sorted(set(pending) | set(processed), key=lambda name: name or "")
+    }
+
+
+def count_calls(start_date: datetime = None, end_date: datetime = None,
+                status: str = CallStatus.PROCESSED, tenant: Optional[str] = None) -> int:
+    """Количество звонков со статусом status (за период или за все время) по сводке
+
+    Args:
+        tenant: Только звонки клиента (None — всех клиентов)
+    """
+    session = SessionLocal()
+    try:
+        query = session.query(func.sum(CallRollup.calls)).filter(CallRollup.status == status)
+        if tenant is not None:
+            query = query.filter(CallRollup.tenant == tenant)
+        if start_date:
+            query = query.filter(CallRollup.day >= start_date.date())
+        if end_date:
+            query = query.filter(CallRollup.day <= end_date.date())
+        return query.scalar() or 0
+    finally:
+        session.close()
+
+
+def _has_archive() -> bool:
+    """Есть ли файлы архива (archive.py импортируется только тогда: он тянет pandas и pyarrow)"""
+    return Config.ARCHIVE_PATH.exists() and any(Config.ARCHIVE_PATH.glob("month=*/*.parquet"))
+
+
+def _compute_from_calls(session) -> Dict[tuple, Tuple[int, int]]:
+    """Сводка, посчитанная заново по таблице calls и архиву звонков"""
+    rows = session.query(
+        Call.tenant, Call.operator, func.date(Call.date), Call.status,
+        func.count(Call.id), func.sum(Call.duration)
+    ).filter(Call.date.isnot(None)).group_by(
+        Call.tenant, Call.operator, func.date(Call.date), Call.status
+    ).all()
+
+    result = {}
+    for tenant, operator, day, status, calls, seconds in rows:
+        if isinstance(day, str):
+            day = datetime.strptime(day, "%Y-%m-%d").date()
+        key = (tenant or DEFAULT_TENANT, operator or "", day, status)
+        live_calls, live_seconds = result.get(key, (0, 0))
+        result[key] = (live_calls + calls, live_seconds + (seconds or 0))
+
+    if not _has_archive():
+        return result
+
+    # Архивные звонки удалены из calls, но остаются в сводке
+    # (звонки, оставшиеся в calls после прерванной архивации, archive_rollup не считает)
+    from archive import archive_rollup
+
+    for key, (calls, seconds) in archive_rollup().items():
+        live_calls, live_seconds = result.get(key, (0, 0))
+        result[key] = (live_calls + calls, live_seconds + seconds)
+    return result
+
+
+def check_rollup() -> list:
+    """Сравнивает сводку с таблицей calls
+
+    Returns:
+        list: Расхождения (ключ, по сводке, по calls)
+    """
+    session = SessionLocal()
+    try:
+        expected = _compute_from_calls(session)
+        actual = {
+            (row.tenant, row.operator, row.day, row.status): (row.calls, row.duration)
+            for row in session.query(CallRollup)
+            if row.calls or row.duration
+        }
+    finally:
+        session.close()
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual), key=str):
+        if expected.get(key, (0, 0)) != actual.get(key, (0, 0)):
+            mismatches.append((key, actual.get(key, (0, 0)), expected.get(key, (0, 0))))
+    return mismatches
+
+
+def rebuild_rollup() -> int:
+    """Перестраивает сводку по таблице calls в одной транзакции
+
+    Returns:
+        int: Количество строк сводки
+    """
+    session = SessionLocal()
+    try:
+        rows = _compute_from_calls(session)
+        session.execute(delete(CallRollup))
+        session.add_all(
+            CallRollup(tenant=tenant, operator=operator, day=day, status=status, calls=calls, duration=seconds)
+            for (tenant, operator, day, status), (calls, seconds) in rows.items()
+        )
+        session.commit()
+
+        logger.info(f"🧮 Сводка call_rollup перестроена: {len(rows)} строк")
+        return len(rows)
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    init_db()
+
+    if "--rebuild" in sys.argv:
+        rebuild_rollup()
+        sys.exit(0)
+
+    mismatches = check_rollup()
+    if not mismatches:
+        print("✅ Сводка call_rollup совпадает с таблицей calls")
+        sys.exit(0)
+
+    print(f"❌ Расхождений в сводке: {len(mismatches)}")
+    for (tenant, operator, day, status), actual, expected in mismatches[:50]:
+        print(f"  {tenant} | {operator or '—'} | {day} | {status}: в сводке {actual}, по calls {expected}")
+    print("Перестроить: python rollup.py --rebuild")
+    sys.exit(1)
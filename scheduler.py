@@ -0,0 +1,250 @@
+import heapq
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Union
+
+from sqlalchemy import func
+
+from database import SessionLocal, Call, CallStatus
+from work_queue import batch_filter
+from config import Config
+from logger import get_logger
+from metrics import metrics
+
+logger = get_logger("scheduler")
+
+# Как часто (в звонках) писать в лог прогноз завершения
+ETA_LOG_EVERY = 10
+# Формат дедлайна: ЧЧ:ММ (час можно одной цифрой)
+DEADLINE_PATTERN = re.compile(r"(\d{1,2}):(\d{2})")
+
+
+def interleave_by_operator(calls: Iterable[Call], covered_minutes: Dict[str, float] = None) -> List[Call]:
+    """Упорядочивает звонки по кругу между операторами
+
+    Следующим всегда идет звонок оператора, у которого сейчас меньше всего
+    покрытых минут (уже обработанные + поставленные раньше в очередь).
+    Внутри оператора исходный порядок сохраняется. Если обработку прервать
+    в любой момент, покрытие операторов останется равномерным.
+
+    Args:
+        calls: Звонки в порядке приоритета внутри каждого оператора
+        covered_minutes: Уже покрытые минуты по операторам
+
+    Returns:
+        List[Call]: Звонки в порядке обработки
+    """
+    covered = dict(covered_minutes or {})
+    queues = {}
+    for call in calls:
+        queues.setdefault(call.operator, []).append(call)
+
+    # (покрытые минуты, порядковый номер оператора, оператор, позиция в его очереди)
+    heap = [
+        (covered.get(operator, 0.0), index, operator, 0)
+        for index, operator in enumerate(queues)
+    ]
+    heapq.heapify(heap)
+
+    ordered = []
+    while heap:
+        minutes, index, operator, position = heapq.heappop(heap)
+        call = queues[operator][position]
+        ordered.append(call)
+
+        if position + 1 < len(queues[operator]):
+            heapq.heappush(heap, (minutes + call.duration / 60, index, operator, position + 1))
+
+    return ordered
+
+
+def processed_minutes_by_operator(batch_id: str) -> Dict[str, float]:
+    """Минуты, уже обработанные в пакете, по операторам"""
+    session = SessionLocal()
+    try:
+        rows = session.query(Call.operator, func.sum(Call.duration)).filter(
+            Call.batch_id == batch_id,
+            Call.status == CallStatus.PROCESSED
+        ).group_by(Call.operator).all()
+        return {operator: (seconds or 0) / 60 for operator, seconds in rows}
+    finally:
+        session.close()
+
+
+def parse_deadline(value: Optional[str]) -> Optional[datetime]:
+    """Превращает "ЧЧ:ММ" в дату-время сегодня
+
+    Пустое значение — без дедлайна. Если время уже прошло (ручной запуск
+    вечером) или значение не в формате ЧЧ:ММ, дедлайн игнорируется с
+    предупреждением.
+    """
+    if not value:
+        return None
+
+    match = DEADLINE_PATTERN.fullmatch(value.strip())
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        logger.warning(f"⚠️ Дедлайн {value!r} не в формате ЧЧ:ММ — обрабатываем без ограничения по времени")
+        return None
+
+    hours, minutes = (int(part) for part in match.groups())
+    deadline = datetime.now().replace(hour=hours, minute=minutes, second=0, microsecond=0)
+
+    if deadline <= datetime.now():
+        logger.warning(f"⚠️ Дедлайн {value} уже прошел — обрабатываем без ограничения по времени")
+        return None
+
+    return deadline
+
+
+class DeadlineGuard:
+    """Решает, успеет ли воркер обработать следующий звонок до дедлайна
+
+    Оценка строится по живой пропускной способности этого процесса: сколько
+    секунд обработки уходит на секунду аудио (метрика "call" и счетчик
+    audio_seconds_processed). До первого обработанного звонка оценки нет,
+    и звонок принимается. Под формирование и отправку отчета оставляется
+    запас Config.DEADLINE_RESERVE_MINUTES.
+    """
+
+    def __init__(self, deadline: Optional[datetime], batch_id: Union[str, Iterable[str]] = None,
+                 reserve_minutes: int = None):
+        self.deadline = deadline
+        self.batch_id = batch_id
+        if reserve_minutes is None:
+            reserve_minutes = Config.DEADLINE_RESERVE_MINUTES
+        self.reserve = timedelta(minutes=reserve_minutes)
+        self.accepted = 0
+        self.stopped = False
+
+    def seconds_per_audio_second(self) -> Optional[float]:
+        """Живая оценка: время обработки на секунду аудио"""
+        snapshot = metrics.snapshot()
+        call_stats = snapshot["stages"].get("call")
+        audio_seconds = snapshot["counters"].get("audio_seconds_processed", 0)
+        if not call_stats or not audio_seconds:
+            return None
+        return call_stats["sum"] / audio_seconds
+
+    def time_left(self) -> timedelta:
+        """Сколько осталось до дедлайна с учетом запаса на отчет"""
+        return self.deadline - self.reserve - datetime.now()
+
+    def estimate_completion(self) -> Optional[datetime]:
+        """Прогноз окончания оставшейся работы пакета
+
+        Оставшиеся секунды аудио пакета умножаются на живую оценку и делятся
+        на число воркеров, у которых сейчас есть действующая аренда.
+        """
+        ratio = self.seconds_per_audio_second()
+        if ratio is None or not self.batch_id:
+            return None
+
+        session = SessionLocal()
+        try:
+            pending = session.query(Call).filter(
+                batch_filter(self.batch_id),
+                Call.status.in_(CallStatus.IN_PROGRESS)
+            )
+            remaining_audio = pending.with_entities(func.sum(Call.duration)).scalar() or 0
+            workers = pending.filter(
+                Call.lease_owner.isnot(None), Call.lease_expires_at >= datetime.now()
+            ).with_entities(func.count(func.distinct(Call.lease_owner))).scalar() or 1
+        finally:
+            session.close()
+
+        return datetime.now() + timedelta(seconds=remaining_audio * ratio / workers)
+
+    def accept(self, call: Call) -> bool:
+        """True если звонок успеет обработаться до дедлайна"""
+        if self.deadline is None:
+            return True
+
+        ratio = self.seconds_per_audio_second()
+        expected = timedelta(seconds=(call.duration or 0) * ratio) if ratio else timedelta(0)
+
+        if expected > self.time_left():
+            if not self.stopped:
+                logger.warning(
+                    f"⏰ До дедлайна {self.deadline.strftime('%H:%M')} не успеваем "
+                    f"обработать еще звонок (~{expected.total_seconds():.0f} сек) — "
+                    f"завершаем с текущим равномерным покрытием"
+                )
+            self.stopped = True
+            metrics.inc("deadline_stops")
+            return False
+
+        self.accepted += 1
+        if self.accepted % ETA_LOG_EVERY == 0:
+            eta = self.estimate_completion()
+            if eta:
+                metrics.set_gauge("eta_seconds", round((eta - datetime.now()).total_seconds(), 1))
+                status = "успеваем" if eta <= self.deadline - self.reserve else "НЕ успеваем"
+                logger.info(
+                    f"🕒 Прогноз окончания обработки: {eta.strftime('%H:%M')} "
+                    f"(дедлайн {self.deadline.strftime('%H:%M')}, {status})"
+                )
+
+        return True
+
+
+class DailyQuotaGuard:
+    """Дневная квота минут аудио для непрерывной обработки (daemon.py)
+
+    Считаются звонки, обработанные с начала суток (Call.processed_at),
+    и звонки, которые сейчас в работе (действующая аренда), всеми
+    процессами с общей БД — иначе несколько демонов вместе выйдут за
+    квоту. Звонок принимается, если вместе с ним квота не превышена;
+    иначе обработка ждет следующих суток, а звонок остается в очереди.
+    Квота 0 — без ограничения.
+    """
+
+    def __init__(self, minutes: int = None):
+        if minutes is None:
+            minutes = Config.DAEMON_DAILY_MINUTES
+        self.seconds = minutes * 60
+        self.stopped = False
+
+    def used_seconds(self, exclude_call_id: str = None) -> int:
+        """Секунды аудио, обработанные с начала суток и взятые в работу
+
+        Args:
+            exclude_call_id: Не учитывать звонок (он уже захвачен и сейчас проверяется)
+        """
+        now = datetime.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        session = SessionLocal()
+        try:
+            processed = session.query(func.sum(Call.duration)).filter(
+                Call.status == CallStatus.PROCESSED,
+                Call.processed_at >= midnight
+            ).scalar() or 0
+            leased = session.query(func.sum(Call.duration)).filter(
+                Call.status.in_(CallStatus.IN_PROGRESS),
+                Call.lease_owner.isnot(None),
+                Call.lease_expires_at >= now
+            )
+            if exclude_call_id is not None:
+                leased = leased.filter(Call.id != exclude_call_id)
+            return processed + (leased.scalar() or 0)
+        finally:
+            session.close()
+
+    def accept(self, call: Call) -> bool:
+        """True если звонок помещается в дневную квоту"""
+        if not self.seconds:
+            return True
+
+        used = self.used_seconds(exclude_call_id=call.id)
+        metrics.set_gauge("daily_quota_used_minutes", round(used / 60, 1))
+        if used + (call.duration or 0) > self.seconds:
+            if not self.stopped:
+                logger.info(
+                    f"🧮 Дневная квота исчерпана: {used / 60:.0f} из {self.seconds / 60:.0f} мин — "
+                    f"продолжим завтра"
+                )
+            self.stopped = True
+            metrics.inc("daily_quota_stops")
+            return False
+
+        self.stopped = False
+        return True
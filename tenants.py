@@ -0,0 +1,121 @@
+"""
+Несколько АТС (клиник) в одной установке
+
+Клиенты описываются в TENANTS_PATH (JSON, см. tenants.example.json):
+
+    [
+        {"name": "default", "megafon_host": "https://clinic1.megapbx.ru/crmapi/v1",
+         "megafon_key": "...", "minutes_target": 2000, "email_to": ["director@clinic1.ru"]},
+        {"name": "clinic2", "megafon_host": "https://clinic2.megapbx.ru/crmapi/v1",
+         "megafon_key": "...", "minutes_target": 800, "report_specs": "./reports_clinic2.json"}
+    ]
+
+- name — имя клиента: колонка calls.tenant, путь вебхука (POST /<name>),
+  часть имени файлов отчетов и ключа пакета в очереди;
+- megafon_host, megafon_key — АТС клиента (нет — MEGAFON_HOST, MEGAFON_KEY);
+- minutes_target — минут на анализ за период (нет — ANALYSIS_MINUTES_TARGET);
+- email_to — получатели отчетов без своих recipients (нет — EMAIL_TO
+  только у клиента "default"; у остальных такие отчеты не отправляются);
+- report_specs — файл описаний отчетов, как REPORT_SPECS_PATH
+  (нет — REPORT_SPECS_PATH у клиента "default", один общий отчет у остальных).
+
+Без файла работает один клиент "default" с настройками из .env — так
+же, как до появления клиентов; звонки, сохраненные раньше, относятся
+к нему. Номера звонков у разных АТС независимы, поэтому ID звонков
+клиентов, кроме "default", хранятся с префиксом клиента (scoped_call_id).
+Квоты Yandex Cloud (DAEMON_DAILY_MINUTES, воркеры) общие:
+очередь выдает звонки клиентов по очереди (work_queue.claim_call).
+"""
+
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+
+from config import Config
+
+# Клиент установки без TENANTS_PATH и звонков, сохраненных до появления клиентов
+DEFAULT_TENANT = "default"
+
+
+@dataclass
+class Tenant:
+    """Клиент: своя АТС, цель по минутам и получатели отчетов"""
+    name: str = DEFAULT_TENANT
+    megafon_host: Optional[str] = None
+    megafon_key: Optional[str] = None
+    minutes_target: Optional[int] = None
+    email_to: Optional[List[str]] = None
+    report_specs: Optional[str] = None
+
+    def __post_init__(self):
+        self.megafon_host = (self.megafon_host or Config.MEGAFON_HOST or "").rstrip("/")
+        self.megafon_key = self.megafon_key or Config.MEGAFON_KEY
+        if self.minutes_target is None:
+            self.minutes_target = Config.ANALYSIS_MINUTES_TARGET
+        if isinstance(self.email_to, str):
+            self.email_to = [email.strip() for email in self.email_to.split(",") if email.strip()]
+
+    @property
+    def report_specs_path(self) -> Optional[Path]:
+        """Файл описаний отчетов клиента (None — один общий отчет)"""
+        if self.report_specs:
+            return Path(self.report_specs)
+        return Config.REPORT_SPECS_PATH if self.name == DEFAULT_TENANT else None
+
+
+def load_tenants(path: Path = None) -> List[Tenant]:
+    """Клиенты из TENANTS_PATH; без файла — один клиент "default" из .env"""
+    path = Path(path or Config.TENANTS_PATH)
+    if not path.exists():
+        return [Tenant()]
+
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    try:
+        tenants = [Tenant(**item) for item in items]
+    except TypeError as e:
+        # Неизвестный ключ или клиент не объектом — ошибка файла, как и остальные ниже
+        raise ValueError(f"В {path} неверное описание клиента: {e}") from e
+    if not tenants:
+        raise ValueError(f"В {path} не описано ни одного клиента")
+
+    names = [tenant.name for tenant in tenants]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates or not all(names):
+        raise ValueError(f"В {path} имена клиентов должны быть непустыми и разными: {', '.join(duplicates)}")
+    return tenants
+
+
+def scoped_call_id(tenant: Optional[str], call_id: str) -> str:
+    """ID звонка в БД по callid из АТС клиента, например "clinic2:12345"
+
+    У клиента "default" — callid как есть (так хранились звонки до появления клиентов).
+    """
+    call_id = str(call_id)
+    return f"{tenant}:{call_id}" if tenant and tenant != DEFAULT_TENANT else call_id
+
+
+@lru_cache(maxsize=1)
+def configured_tenants() -> tuple:
+    """Клиенты из TENANTS_PATH, прочитанные один раз за процесс"""
+    return tuple(load_tenants())
+
+
+def get_tenant(name: Optional[str], tenants: List[Tenant] = None) -> Tenant:
+    """Клиент по имени (None — "default")
+
+    Клиент "default", не описанный в TENANTS_PATH, — настройки из .env
+    (к нему относятся звонки, сохраненные до появления клиентов).
+
+    Raises:
+        KeyError: Клиента нет в TENANTS_PATH
+    """
+    name = name or DEFAULT_TENANT
+    for tenant in tenants if tenants is not None else configured_tenants():
+        if tenant.name == name:
+            return tenant
+    if name == DEFAULT_TENANT:
+        return Tenant()
+    raise KeyError(f"Клиент {name!r} не описан в {Config.TENANTS_PATH}")
@@ -119,7 +119,8 @@ test_report = input("   Сгенерировать mock отчет? (y/n): ").lo
 
 if test_report:
     try:
-        from main import create_mock_data, generate_excel
+        from main import generate_excel
+        from mock_data import create_mock_data
         
         print("   🎲 Создаем тестовые данные...")
         create_mock_data()
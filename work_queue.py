@@ -0,0 +1,339 @@
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+from sqlalchemy import and_, bindparam, or_, update
+
+from database import SessionLocal, Call, CallStatus
+from logger import get_logger
+from metrics import metrics
+from tenants import DEFAULT_TENANT
+
+logger = get_logger("work_queue")
+
+# Сколько секунд аренда действует без heartbeat
+LEASE_SECONDS = 300
+# Как часто воркер продлевает аренду (должно быть заметно меньше LEASE_SECONDS)
+HEARTBEAT_INTERVAL = 60
+# Сколько кандидатов проверять за одну попытку захвата
+CLAIM_CANDIDATES = 10
+
+
+def make_batch_id(start_date: datetime, end_date: datetime, tenant: str = None) -> str:
+    """Ключ пакета работ для периода, например "20260201-20260215"
+
+    У клиентов, кроме "default", ключ с именем клиента: "clinic2:20260201-20260215".
+    """
+    period = f"{start_date.strftime('%Y%m%d')}-{end_date.strftime('%Y%m%d')}"
+    return f"{tenant}:{period}" if tenant and tenant != DEFAULT_TENANT else period
+
+
+def batch_filter(batch_id: Union[str, Iterable[str]]):
+    """Условие на звонки пакета или нескольких пакетов (клиентов) сразу"""
+    if isinstance(batch_id, str):
+        return Call.batch_id == batch_id
+    return Call.batch_id.in_(list(batch_id))
+
+
+def batch_label(batch_id: Union[str, Iterable[str]]) -> str:
+    """Пакет или пакеты клиентов для логов"""
+    return batch_id if isinstance(batch_id, str) else ", ".join(batch_id)
+
+
+def make_worker_id() -> str:
+    """Уникальный ID воркера: хост, PID и случайный суффикс"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def _lease_is_free(now: datetime):
+    """Условие: звонок никем не захвачен или аренда истекла"""
+    return or_(Call.lease_owner.is_(None), Call.lease_expires_at < now)
+
+
+def enqueue_calls(calls: List[Call], batch_id: str) -> int:
+    """Помечает выбранные звонки как работу пакета batch_id
+
+    Звонки, уже отнесенные к другому пакету, не переназначаются.
+    Порядок списка становится порядком обработки (priority): воркеры
+    захватывают звонки по возрастанию priority, поэтому список стоит
+    упорядочить через scheduler.interleave_by_operator.
+
+    Returns:
+        int: Количество звонков, добавленных в пакет
+    """
+    if not calls:
+        return 0
+
+    session = SessionLocal()
+    try:
+        ids = [call.id for call in calls]
+        result = session.execute(
+            update(Call)
+            .where(and_(Call.id.in_(ids), Call.batch_id.is_(None)))
+            .values(batch_id=batch_id)
+        )
+        attached = result.rowcount
+
+        # Порядок обработки — одним executemany для звонков этого пакета
+        table = Call.__table__
+        session.execute(
+            update(table)
+            .where(and_(table.c.id == bindparam("call_id"), table.c.batch_id == batch_id))
+            .values(priority=bindparam("call_priority")),
+            [{"call_id": call_id, "call_priority": index} for index, call_id in enumerate(ids)]
+        )
+        session.commit()
+
+        # Обновляем и переданные объекты, чтобы они соответствовали БД
+        for call in calls:
+            if call.batch_id is None:
+                call.batch_id = batch_id
+
+        logger.info(f"📥 В пакет {batch_id} добавлено звонков: {attached}")
+        return attached
+    finally:
+        session.close()
+
+
+def carry_over_calls(old_batch_id: str, new_batch_id: str) -> int:
+    """Переносит незавершенную работу пакета в другой пакет (смена периода)
+
+    Необработанные звонки (NEW, начатые, FAILED с повтором) переходят в
+    new_batch_id с сохранением статуса, priority и аренды: воркер, который
+    сейчас обрабатывает звонок, доводит его до конца. PROCESSED и DEAD
+    остаются в старом пакете.
+
+    Returns:
+        int: Количество перенесенных звонков
+    """
+    if old_batch_id == new_batch_id:
+        return 0
+
+    session = SessionLocal()
+    try:
+        result = session.execute(
+            update(Call)
+            .where(and_(
+                Call.batch_id == old_batch_id,
+                Call.status.in_(CallStatus.PENDING)
+            ))
+            .values(batch_id=new_batch_id)
+        )
+        session.commit()
+
+        if result.rowcount:
+            logger.info(f"📦 Из пакета {old_batch_id} в {new_batch_id} перенесено незавершенных звонков: "
+                        f"{result.rowcount}")
+        return result.rowcount
+    finally:
+        session.close()
+
+
+def claim_call(batch_id: Union[str, Iterable[str]], worker_id: str,
+               lease_seconds: int = LEASE_SECONDS) -> Optional[Call]:
+    """Атомарно захватывает один необработанный звонок пакета
+
+    Захват — условный UPDATE (compare-and-set): он проходит, только если
+    звонок все еще свободен. Если другой воркер успел раньше, пробуем
+    следующего кандидата. Истекшие аренды считаются свободными.
+    Кандидаты берутся по priority (порядок из enqueue_calls), затем по дате.
+    Для списка пакетов (клиентов) priority у каждого свой с нуля, поэтому
+    звонки клиентов выдаются по очереди и делят общие лимиты Yandex поровну.
+
+    Returns:
+        Call: Захваченный звонок или None, если свободной работы нет
+    """
+    session = SessionLocal()
+    try:
+        with metrics.timer("queue_claim"):
+            now = datetime.now()
+            candidates = session.query(Call.id).filter(
+                batch_filter(batch_id),
+                Call.status.in_(CallStatus.IN_PROGRESS),
+                _lease_is_free(now)
+            ).order_by(
+                Call.priority.asc().nulls_last(), Call.date
+            ).limit(CLAIM_CANDIDATES).all()
+
+            for (call_id,) in candidates:
+                result = session.execute(
+                    update(Call)
+                    .where(and_(
+                        Call.id == call_id,
+                        Call.status.in_(CallStatus.IN_PROGRESS),
+                        _lease_is_free(now)
+                    ))
+                    .values(
+                        lease_owner=worker_id,
+                        lease_expires_at=now + timedelta(seconds=lease_seconds),
+                        heartbeat_at=now
+                    )
+                )
+                session.commit()
+
+                if result.rowcount == 1:
+                    return session.get(Call, call_id)
+
+            return None
+    finally:
+        session.close()
+
+
+def heartbeat(call_id: str, worker_id: str, lease_seconds: int = LEASE_SECONDS) -> bool:
+    """Продлевает аренду звонка
+
+    Returns:
+        bool: False если аренда уже потеряна (истекла и перехвачена)
+    """
+    session = SessionLocal()
+    try:
+        now = datetime.now()
+        result = session.execute(
+            update(Call)
+            .where(and_(Call.id == call_id, Call.lease_owner == worker_id))
+            .values(
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                heartbeat_at=now
+            )
+        )
+        session.commit()
+        return result.rowcount == 1
+    finally:
+        session.close()
+
+
+def release_call(call_id: str, worker_id: str):
+    """Освобождает аренду после обработки звонка"""
+    session = SessionLocal()
+    try:
+        session.execute(
+            update(Call)
+            .where(and_(Call.id == call_id, Call.lease_owner == worker_id))
+            .values(lease_owner=None, lease_expires_at=None)
+        )
+        session.commit()
+    finally:
+        session.close()
+
+
+def reclaim_expired_leases(batch_id: Union[str, Iterable[str]] = None) -> int:
+    """Снимает истекшие аренды (воркер упал или завис без heartbeat)
+
+    Returns:
+        int: Количество освобожденных звонков
+    """
+    session = SessionLocal()
+    try:
+        now = datetime.now()
+        query = update(Call).where(and_(
+            Call.lease_owner.isnot(None),
+            Call.lease_expires_at < now
+        ))
+        if batch_id:
+            query = query.where(batch_filter(batch_id))
+
+        result = session.execute(query.values(lease_owner=None, lease_expires_at=None))
+        session.commit()
+
+        if result.rowcount:
+            logger.warning(f"♻️ Освобождено звонков с истекшей арендой: {result.rowcount}")
+        return result.rowcount
+    finally:
+        session.close()
+
+
+def get_batch_progress(batch_id: Union[str, Iterable[str]]) -> dict:
+    """Возвращает состояние пакета (или пакетов): сколько ждет, в работе и завершено"""
+    session = SessionLocal()
+    try:
+        now = datetime.now()
+        base = session.query(Call).filter(batch_filter(batch_id))
+        pending = base.filter(Call.status.in_(CallStatus.IN_PROGRESS))
+
+        progress = {
+            "total": base.count(),
+            "pending": pending.count(),
+            "leased": pending.filter(
+                Call.lease_owner.isnot(None), Call.lease_expires_at >= now
+            ).count(),
+            "processed": base.filter(Call.status == CallStatus.PROCESSED).count(),
+            "failed": base.filter(Call.status == CallStatus.FAILED).count(),
+            "dead": base.filter(Call.status == CallStatus.DEAD).count(),
+        }
+
+        # Глубина очереди для метрик
+        for key, value in progress.items():
+            metrics.set_gauge(f"queue_{key}", value)
+
+        return progress
+    finally:
+        session.close()
+
+
+class LeaseHeartbeat:
+    """Фоновый поток, продлевающий аренду, пока звонок обрабатывается
+
+    Использование:
+        with LeaseHeartbeat(call.id, worker_id):
+            process_call(call)
+    """
+
+    def __init__(self, call_id: str, worker_id: str,
+                 lease_seconds: int = LEASE_SECONDS, interval: int = HEARTBEAT_INTERVAL):
+        self.call_id = call_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not heartbeat(self.call_id, self.worker_id, self.lease_seconds):
+                    logger.warning(f"⚠️ Аренда звонка #{self.call_id} потеряна")
+                    return
+            except Exception as e:
+                logger.error(f"Ошибка heartbeat для звонка #{self.call_id}: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+
+
+def iter_claimed_calls(batch_id: Union[str, Iterable[str]], worker_id: str,
+                       lease_seconds: int = LEASE_SECONDS,
+                       accept: Callable[[Call], bool] = None) -> Iterator[Call]:
+    """Выдает звонки пакета по одному, захватывая каждый на время обработки
+
+    Пока вызывающий код обрабатывает выданный звонок, аренда продлевается
+    heartbeat-потоком; при запросе следующего звонка аренда предыдущего
+    снимается. Итерация заканчивается, когда в пакете не осталось
+    свободной работы или accept отклонил захваченный звонок (например,
+    он не успевает до дедлайна, см. scheduler.DeadlineGuard) — тогда
+    аренда сразу снимается и звонок остается в очереди.
+    """
+    while True:
+        call = claim_call(batch_id, worker_id, lease_seconds)
+        if call is None:
+            return
+
+        if accept is not None and not accept(call):
+            release_call(call.id, worker_id)
+            return
+
+        # После обработки объект отсоединен от сессии — запоминаем ID заранее
+        call_id = call.id
+        try:
+            with LeaseHeartbeat(call_id, worker_id, lease_seconds,
+                                interval=max(1, min(HEARTBEAT_INTERVAL, lease_seconds // 3))):
+                yield call
+        finally:
+            release_call(call_id, worker_id)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Воркеры для параллельной обработки пакета звонков
+
+Несколько процессов (на одной или нескольких машинах с общей БД)
+разбирают звонки одного периода через очередь в таблице calls:
+каждый звонок захватывается с арендой, аренда продлевается heartbeat-ом,
+а аренды упавших воркеров освобождаются по истечении срока.
+
+Запуск:
+    python worker.py --first-half --workers 4
+    python worker.py --second-half --mock
+    python worker.py --workers 4 --deadline 18:00
+    python worker.py --tenant clinic2         # только один клиент (tenants.py)
+
+Если пакет для периода еще не сформирован, первый воркер выбирает звонки
+(select_balanced_calls) и ставит их в очередь; остальные присоединяются.
+Звонки разбираются по кругу между операторами (scheduler.py), а с дедлайном
+воркеры не берут звонки, которые не успевают обработать до него.
+У каждого клиента свой пакет, воркеры разбирают пакеты всех клиентов
+сразу — звонки клиентов по очереди (work_queue.claim_call).
+"""
+
+import multiprocessing
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Union
+
+from database import init_db
+from call_selector import select_balanced_calls, get_period_dates
+from processor import process_calls_batch
+from work_queue import (
+    LEASE_SECONDS, enqueue_calls, get_batch_progress, iter_claimed_calls,
+    batch_label, make_batch_id, make_worker_id, reclaim_expired_leases
+)
+from retry_scheduler import get_next_retry_time, requeue_due_calls
+from scheduler import (
+    DeadlineGuard, interleave_by_operator, parse_deadline, processed_minutes_by_operator
+)
+from metrics import metrics
+from logger import get_logger, log_queue, use_parent_log_queue
+from tenants import Tenant, get_tenant, load_tenants
+from config import Config
+
+logger = get_logger("worker")
+
+# Как часто ждущий воркер проверяет, закончили ли другие
+WAIT_POLL_INTERVAL = 10
+
+
+def prepare_batch(start_date, end_date, tenant: Tenant = None) -> str:
+    """Формирует пакет работ периода, если он еще не сформирован
+
+    Args:
+        tenant: Клиент (по умолчанию — "default" с настройками из .env)
+
+    Returns:
+        str: batch_id пакета
+    """
+    tenant = tenant or Tenant()
+    batch_id = make_batch_id(start_date, end_date, tenant.name)
+
+    progress = get_batch_progress(batch_id)
+    if progress["total"] == 0:
+        logger.info(f"📋 Пакет {batch_id} пуст — выбираем звонки")
+        enqueue_calls(
+            interleave_by_operator(
+                select_balanced_calls(start_date, end_date, tenant.minutes_target, tenant=tenant.name),
+                processed_minutes_by_operator(batch_id)
+            ),
+            batch_id
+        )
+    else:
+        logger.info(
+            f"📋 Пакет {batch_id}: всего {progress['total']}, "
+            f"ожидают {progress['pending']}, обработано {progress['processed']}"
+        )
+
+    return batch_id
+
+
+def prepare_batches(start_date, end_date, tenants: List[Tenant] = None) -> List[str]:
+    """Пакеты периода для всех клиентов (по умолчанию — из TENANTS_PATH)
+
+    Выбор по клиентам по очереди: одна БД, запросы параллельно не ускорятся.
+    """
+    return [prepare_batch(start_date, end_date, tenant) for tenant in tenants or load_tenants()]
+
+
+def run_worker(batch_id: Union[str, Iterable[str]], use_mock: bool = False, lease_seconds: int = LEASE_SECONDS,
+               deadline: Optional[datetime] = None) -> dict:
+    """Обрабатывает звонки пакета (или пакетов клиентов), пока есть свободная работа
+
+    Args:
+        deadline: Не брать звонки, которые не успевают до этого времени
+
+    Returns:
+        dict: Статистика обработки (как у process_calls_batch)
+              + deadline_reached — остановлен по дедлайну
+    """
+    worker_id = make_worker_id()
+    logger.info(f"👷 Воркер {worker_id} подключился к пакету {batch_label(batch_id)}")
+
+    guard = DeadlineGuard(deadline, batch_id)
+    reclaim_expired_leases(batch_id)
+    requeue_due_calls(batch_id)
+    stats = process_calls_batch(
+        iter_claimed_calls(batch_id, worker_id, lease_seconds, accept=guard.accept),
+        use_mock=use_mock
+    )
+    stats["worker_id"] = worker_id
+    stats["deadline_reached"] = guard.stopped
+    return stats
+
+
+def _past_deadline(deadline: Optional[datetime], wait_seconds: float = 0) -> bool:
+    """True если после ожидания wait_seconds дедлайн (с запасом на отчет) будет пройден"""
+    if deadline is None:
+        return False
+    reserve = timedelta(minutes=Config.DEADLINE_RESERVE_MINUTES)
+    return datetime.now() + timedelta(seconds=wait_seconds) > deadline - reserve
+
+
+def drain_batch(batch_id: Union[str, Iterable[str]], use_mock: bool = False, lease_seconds: int = LEASE_SECONDS,
+                deadline: Optional[datetime] = None) -> dict:
+    """Обрабатывает пакет и ждет, пока другие воркеры закончат свои звонки
+
+    Если чужие аренды истекают (воркер упал), звонки доделываются здесь.
+    Если повтор звонков после временных ошибок наступит скоро
+    (в пределах Config.RETRY_MAX_WAIT_SECONDS), дожидаемся и повторяем;
+    более поздние повторы выполнит следующий запуск. В mock режиме
+    повторы не ждем.
+
+    С дедлайном новые звонки не берутся, если не успевают, и ожидание
+    повторов/других воркеров прекращается: отчет строится по уже
+    обработанным звонкам, которые благодаря порядку очереди равномерно
+    покрывают операторов.
+
+    Returns:
+        dict: Суммарная статистика этого процесса (+ deadline_reached)
+    """
+    totals = {"total": 0, "successful": 0, "failed": 0}
+    deadline_reached = False
+
+    while True:
+        stats = run_worker(batch_id, use_mock=use_mock, lease_seconds=lease_seconds,
+                           deadline=deadline)
+        for key in totals:
+            totals[key] += stats[key]
+
+        if stats["deadline_reached"] or _past_deadline(deadline):
+            deadline_reached = True
+            break
+
+        progress = get_batch_progress(batch_id)
+        if progress["pending"] == 0:
+            next_retry = get_next_retry_time(batch_id)
+            if next_retry is None:
+                break
+
+            # Mock запуск — проверка настроек: не ждем повторов, он должен завершаться быстро
+            if use_mock:
+                logger.info(f"ℹ️ Звонков, ждущих повтора: {progress['failed']} — в mock режиме не ждем")
+                break
+
+            wait_seconds = (next_retry - datetime.now()).total_seconds()
+            if wait_seconds > Config.RETRY_MAX_WAIT_SECONDS:
+                logger.info(
+                    f"ℹ️ Звонков, ждущих повтора: {progress['failed']}, "
+                    f"ближайший повтор в {next_retry.strftime('%H:%M')} — оставляем следующему запуску"
+                )
+                break
+
+            if _past_deadline(deadline, wait_seconds):
+                logger.info("⏰ Повтор звонков не успевает до дедлайна — оставляем следующему запуску")
+                deadline_reached = True
+                break
+
+            logger.info(f"⏳ Ждем повтора звонков после ошибок: {max(0, wait_seconds):.0f} сек")
+            time.sleep(max(0, wait_seconds))
+            continue
+
+        if progress["leased"]:
+            logger.info(
+                f"⏳ Ждем другие воркеры: в работе {progress['leased']}, "
+                f"ожидают {progress['pending']}"
+            )
+            time.sleep(WAIT_POLL_INTERVAL)
+
+    totals["success_rate"] = totals["successful"] / totals["total"] if totals["total"] else 0
+    totals["deadline_reached"] = deadline_reached
+    return totals
+
+
+def _worker_process(batch_id: Union[str, List[str]], use_mock: bool, lease_seconds: int,
+                    deadline: Optional[datetime] = None, parent_log_queue=None):
+    """Точка входа дочернего процесса (логи пишет основной процесс)"""
+    use_parent_log_queue(parent_log_queue)
+    run_worker(batch_id, use_mock=use_mock, lease_seconds=lease_seconds, deadline=deadline)
+    get_batch_progress(batch_id)
+    logger.info(f"📈 Метрики воркера сохранены: {metrics.write_summary()}")
+
+
+def start_workers(batch_id: Union[str, List[str]], workers: int, use_mock: bool = False,
+                  lease_seconds: int = LEASE_SECONDS, deadline: Optional[datetime] = None):
+    """Запускает N процессов-воркеров и ждет их завершения"""
+    ctx = multiprocessing.get_context("spawn")
+    processes = [
+        ctx.Process(target=_worker_process,
+                    args=(batch_id, use_mock, lease_seconds, deadline, log_queue()))
+        for _ in range(workers)
+    ]
+
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def _get_arg_value(name: str, default: str) -> str:
+    """Возвращает значение аргумента вида --name VALUE"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+
+if __name__ == "__main__":
+    use_mock = "--mock" in sys.argv or "-m" in sys.argv
+
+    period_type = "auto"
+    if "--first-half" in sys.argv:
+        period_type = "first_half"
+    elif "--second-half" in sys.argv:
+        period_type = "second_half"
+
+    workers = int(_get_arg_value("--workers", str(Config.WORKERS)))
+    lease_seconds = int(_get_arg_value("--lease", str(LEASE_SECONDS)))
+    deadline = parse_deadline(_get_arg_value("--deadline", Config.PROCESSING_DEADLINE))
+
+    try:
+        Config.validate()
+    except ValueError as e:
+        logger.error(f"❌ {e}")
+        sys.exit(1)
+
+    init_db()
+
+    tenant_name = _get_arg_value("--tenant", None)
+    try:
+        tenants = [get_tenant(tenant_name, load_tenants())] if tenant_name else load_tenants()
+    except (KeyError, ValueError) as e:
+        logger.error(f"❌ {e}")
+        sys.exit(1)
+
+    start_date, end_date = get_period_dates(period_type)
+    batch_id = prepare_batches(start_date, end_date, tenants)
+
+    if workers > 1:
+        start_workers(batch_id, workers, use_mock=use_mock, lease_seconds=lease_seconds,
+                      deadline=deadline)
+    else:
+        run_worker(batch_id, use_mock=use_mock, lease_seconds=lease_seconds, deadline=deadline)
+
+    progress = get_batch_progress(batch_id)
+    logger.info(
+        f"🏁 Пакет {batch_label(batch_id)}: обработано {progress['processed']}, "
+        f"ждут повтора {progress['failed']}, dead-letter {progress['dead']}, "
+        f"ожидают {progress['pending']}"
+    )
+    logger.info(f"📈 Метрики сохранены: {metrics.write_summary()}")
+    sys.exit(0)
@@ -5,7 +5,25 @@ from typing import Dict, Optional
 from pathlib import Path
 
 from config import Config
-from logger import logger
+from logger import get_logger
+from failures import ProcessingError, http_error, is_transient_exception
+from metrics import metrics
+
+logger = get_logger("yandex_gpt")
+
+
+def parse_gpt_json(response_text: str):
+    """JSON из ответа GPT (модель иногда оборачивает его в ```json ... ```)
+
+    Raises:
+        json.JSONDecodeError: В ответе нет корректного JSON
+    """
+    clean_text = response_text.strip()
+    if "```" in clean_text:
+        clean_text = clean_text.split("```")[1]
+        if clean_text.strip().startswith("json"):
+            clean_text = clean_text.strip()[4:]
+    return json.loads(clean_text.strip())
 
 
 class YandexGPTClient:
@@ -17,6 +35,11 @@ class YandexGPTClient:
         self.folder_id = Config.YANDEX_FOLDER_ID
         self.model = Config.YANDEX_GPT_MODEL
         
+        # Причина последней неудачи analyze_call (для решения о повторе)
+        self.last_error: Optional[ProcessingError] = None
+        # Токены последнего успешного запроса (поле usage ответа API)
+        self.last_usage: Dict[str, int] = {}
+        
     def _make_request(self, messages: list, temperature: float = 0.3) -> Optional[str]:
         """Отправляет запрос в YandexGPT API
         
@@ -42,7 +65,10 @@ class YandexGPTClient:
         }
         
         for attempt in range(Config.RETRY_ATTEMPTS):
+            if attempt:
+                metrics.inc("gpt_retries")
             try:
+                metrics.inc("gpt_requests")
                 response = requests.post(
                     self.api_url,
                     headers=headers,
@@ -52,22 +78,38 @@ class YandexGPTClient:
                 
                 if response.status_code == 200:
                     result = response.json()
+                    self._record_usage(result["result"].get("usage") or {})
                     return result["result"]["alternatives"][0]["message"]["text"]
                 elif response.status_code == 429:
                     # Rate limit, ждем и повторяем
                     logger.warning(f"Rate limit exceeded, waiting 5 seconds...")
+                    self.last_error = http_error("YandexGPT", response)
                     time.sleep(5)
                     continue
                 else:
                     logger.error(f"YandexGPT API error: {response.status_code} - {response.text}")
+                    self.last_error = http_error("YandexGPT", response)
                     
             except Exception as e:
                 logger.error(f"Request to YandexGPT failed (attempt {attempt + 1}): {e}")
+                self.last_error = ProcessingError(
+                    f"Request to YandexGPT failed: {e}", transient=is_transient_exception(e)
+                )
                 if attempt < Config.RETRY_ATTEMPTS - 1:
                     time.sleep(2)
                     
         return None
     
+    def _record_usage(self, usage: dict):
+        """Запоминает расход токенов запроса (API отдает числа строками)"""
+        self.last_usage = {
+            "input_tokens": int(usage.get("inputTextTokens", 0)),
+            "completion_tokens": int(usage.get("completionTokens", 0)),
+            "total_tokens": int(usage.get("totalTokens", 0)),
+        }
+        metrics.inc("gpt_input_tokens", self.last_usage["input_tokens"])
+        metrics.inc("gpt_completion_tokens", self.last_usage["completion_tokens"])
+    
     def analyze_call(self, transcript: str, sentiment_data: dict) -> Optional[Dict]:
         """Анализирует звонок на основе транскрипта и данных о тоне
         
@@ -76,8 +118,12 @@ class YandexGPTClient:
             sentiment_data: Данные о тоне из SpeechSense
             
         Returns:
-            dict: Структурированный анализ звонка
+            dict: Структурированный анализ звонка.
+            None при ошибке — причина сохраняется в self.last_error
         """
+        self.last_error = None
+        self.last_usage = {}
+        
         # Формируем промпт
         operator_sentiment = sentiment_data.get("operator", "unknown")
         client_sentiment = sentiment_data.get("client", "unknown")
@@ -162,14 +208,7 @@ class YandexGPTClient:
             
         # Парсим JSON из ответа
         try:
-            # Убираем markdown разметку если есть
-            clean_text = response_text.strip()
-            if "```" in clean_text:
-                clean_text = clean_text.split("```")[1]
-                if clean_text.strip().startswith("json"):
-                    clean_text = clean_text.strip()[4:]
-            
-            result = json.loads(clean_text.strip())
+            result = parse_gpt_json(response_text)
             
             # Рассчитываем итоговый балл (среднее по 5 основным категориям * 2 + бонус) -> шкала 0-100
             # 5 категорий по 10 баллов = 50 макс. Умножаем на 2 = 100.
@@ -194,9 +233,11 @@ class YandexGPTClient:
             return result
 
             
-        except json.JSONDecodeError as e:
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
             logger.error(f"Не удалось распарсить JSON ответ от GPT: {e}")
             logger.error(f"Ответ был: {response_text[:500]}")
+            # Модель может ответить корректно при следующей попытке
+            self.last_error = ProcessingError(f"Некорректный ответ GPT: {e}", transient=True)
             return None
     
     def generate_operator_summary(self, recommendations: list[str], operator_name: str) -> str:
@@ -232,10 +273,31 @@ class YandexGPTClient:
         ]
         
         logger.info(f"Генерируем итоговую рекомендацию для {operator_name}...")
+        self.last_usage = {}
         response = self._make_request(messages, temperature=0.5)
         
+        if response:
+            # Для планирования запусков (reporter.py --plan)
+            metrics.inc("gpt_summaries")
+            metrics.inc("gpt_summary_tokens", self.last_usage.get("total_tokens", 0))
+        
         return response or "Не удалось сгенерировать рекомендацию"
 
 
 # Singleton instance
-gpt_client = YandexGPTClient()
+_gpt_client: Optional[YandexGPTClient] = None
+
+
+def get_gpt_client() -> YandexGPTClient:
+    """Общий клиент YandexGPT (создается при первом обращении, а не при импорте)"""
+    global _gpt_client
+    if _gpt_client is None:
+        _gpt_client = YandexGPTClient()
+    return _gpt_client
+
+
+def __getattr__(attr: str):
+    # Совместимость: from yandex_gpt import gpt_client
+    if attr == "gpt_client":
+        return get_gpt_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {attr!r}")
@@ -7,7 +7,11 @@ from typing import Dict, Optional
 from pathlib import Path
 
 from config import Config
-from logger import logger
+from logger import get_logger
+from failures import ProcessingError, http_error, is_transient_exception
+from metrics import metrics
+
+logger = get_logger("yandex_speech")
 
 
 class YandexSpeechClient:
@@ -31,6 +35,9 @@ class YandexSpeechClient:
         # Таймауты для поллинга операции
         self.poll_interval = 3       # секунд между проверками
         self.poll_max_wait = 300     # макс ожидание (5 мин)
+        
+        # Причина последней неудачи analyze_audio (для решения о повторе)
+        self.last_error: Optional[ProcessingError] = None
     
     def analyze_audio(self, audio_path: str) -> Optional[Dict]:
         """Транскрибирует аудио файл через SpeechKit async API.
@@ -45,14 +52,18 @@ class YandexSpeechClient:
             audio_path: Путь к MP3 файлу
             
         Returns:
-            dict с полями: transcript, sentiment, statistics
+            dict с полями: transcript, sentiment, statistics.
+            None при ошибке — причина сохраняется в self.last_error
         """
         logger.info(f"📞 Транскрибируем аудио: {Path(audio_path).name}")
+        self.last_error = None
         
         # Шаг 1: Читаем и кодируем файл
         file_path = Path(audio_path)
         if not file_path.exists():
             logger.error(f"❌ Файл не найден: {audio_path}")
+            # Файл скачивается заново при повторе
+            self.last_error = ProcessingError(f"Файл не найден: {audio_path}", transient=True)
             return None
         
         file_size_mb = file_path.stat().st_size / (1024 * 1024)
@@ -82,6 +93,7 @@ class YandexSpeechClient:
         
         if not transcript:
             logger.warning("⚠️ Транскрипт пуст (возможно, в аудио нет речи)")
+            self.last_error = ProcessingError("Пустой транскрипт: в аудио нет речи", transient=False)
             return None
         
         logger.info(f"✅ Транскрибация завершена ({len(transcript)} символов)")
@@ -131,8 +143,13 @@ class YandexSpeechClient:
             }
         }
         
+        metrics.inc("stt_upload_bytes", len(audio_base64))
+        
         for attempt in range(Config.RETRY_ATTEMPTS):
+            if attempt:
+                metrics.inc("speechkit_retries")
             try:
+                metrics.inc("speechkit_requests")
                 response = requests.post(
                     self.stt_url,
                     headers=headers,
@@ -146,6 +163,7 @@ class YandexSpeechClient:
                     
                 elif response.status_code == 429:
                     logger.warning("⏳ Rate limit, ждём 5 сек...")
+                    self.last_error = http_error("SpeechKit", response)
                     time.sleep(5)
                     continue
                 else:
@@ -153,12 +171,17 @@ class YandexSpeechClient:
                         f"SpeechKit error ({response.status_code}): "
                         f"{response.text[:300]}"
                     )
+                    self.last_error = http_error("SpeechKit", response)
                     
             except requests.exceptions.Timeout:
                 logger.warning(f"⏳ Таймаут при отправке (попытка {attempt + 1})")
+                self.last_error = ProcessingError("Таймаут при отправке в SpeechKit")
                 time.sleep(2)
             except Exception as e:
                 logger.error(f"Ошибка запроса к SpeechKit (попытка {attempt + 1}): {e}")
+                self.last_error = ProcessingError(
+                    f"Ошибка запроса к SpeechKit: {e}", transient=is_transient_exception(e)
+                )
                 if attempt < Config.RETRY_ATTEMPTS - 1:
                     time.sleep(2)
         
@@ -182,10 +205,12 @@ class YandexSpeechClient:
         
         while elapsed < self.poll_max_wait:
             try:
+                metrics.inc("speechkit_polls")
                 response = requests.get(url, headers=headers, timeout=30)
                 
                 if response.status_code != 200:
                     logger.error(f"Ошибка проверки операции: {response.status_code}")
+                    self.last_error = http_error("SpeechKit operations", response)
                     return None
                 
                 data = response.json()
@@ -198,6 +223,11 @@ class YandexSpeechClient:
                             f"❌ Ошибка распознавания: "
                             f"[{error.get('code')}] {error.get('message')}"
                         )
+                        # Операция завершилась ошибкой — аудио не распознается и при повторе
+                        self.last_error = ProcessingError(
+                            f"Ошибка распознавания: [{error.get('code')}] {error.get('message')}",
+                            transient=False
+                        )
                         return None
                     
                     return data.get("response", {})
@@ -213,6 +243,7 @@ class YandexSpeechClient:
                 elapsed += self.poll_interval
         
         logger.error(f"❌ Таймаут ожидания результата ({self.poll_max_wait}с)")
+        self.last_error = ProcessingError(f"Таймаут ожидания результата ({self.poll_max_wait}с)")
         return None
     
     def _extract_transcript(self, response_data: dict) -> str:
@@ -245,10 +276,12 @@ class YandexSpeechClient:
         
         return " ".join(transcript_parts)
     
-    def analyze_audio_mock(self, audio_path: str) -> Dict:
+    @staticmethod
+    def analyze_audio_mock(audio_path: str) -> Dict:
         """Моковый анализ для тестирования БЕЗ реальных API запросов.
         
         Возвращает реалистичный транскрипт диалога L7 для проверки GPT-промпта.
+        Клиент (ключи API) не нужен: YandexSpeechClient.analyze_audio_mock(path).
         """
         logger.info(f"🎭 MOCK: Транскрибируем аудио {Path(audio_path).name}")
         
@@ -328,4 +361,19 @@ class YandexSpeechClient:
 
 
 # Singleton instance
-speech_client = YandexSpeechClient()
+_speech_client: Optional[YandexSpeechClient] = None
+
+
+def get_speech_client() -> YandexSpeechClient:
+    """Общий клиент SpeechKit (создается при первом обращении, а не при импорте)"""
+    global _speech_client
+    if _speech_client is None:
+        _speech_client = YandexSpeechClient()
+    return _speech_client
+
+
+def __getattr__(attr: str):
+    # Совместимость: from yandex_speech import speech_client
+    if attr == "speech_client":
+        return get_speech_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {attr!r}")